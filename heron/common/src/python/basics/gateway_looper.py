@@ -15,13 +15,19 @@
 
 import asyncore
 import errno
+import fcntl
+import logging
 import os
+import threading
 import time
 import select
 
 from event_looper import EventLooper
 from heron.common.src.python.utils.log import Log
 
+# epoll.poll() converts the timeout to an int in milliseconds, so it cannot take sys.maxint
+_MAX_EPOLL_TIMEOUT = 3600.0
+
 class GatewayLooper(EventLooper):
   """A GatewayLooper, inheriting EventLooper
 
@@ -35,17 +41,34 @@ class GatewayLooper(EventLooper):
   In order to use this class, users first need to specify a socket map that maps from
   a file descriptor to ``asyncore.dispatcher`` class, using ``prepare_map()`` method.
   The GatewayLooper will dispatch ready events that are in the specified map.
+
+  When ``select.epoll`` is available, file descriptors are registered to it only once, and
+  their interest is modified only when ``readable()`` or ``writable()`` of the dispatcher
+  changes. Otherwise, it falls back to ``select.select()``.
   """
-  def __init__(self, socket_map):
+  def __init__(self, socket_map, use_epoll=True):
     """Initializes a GatewayLooper instance
 
     :param socket_map: socket map used for asyncore.dispatcher
+    :param use_epoll: whether to use ``select.epoll`` if it is available on this platform
     """
     super(GatewayLooper, self).__init__()
     self.sock_map = socket_map
 
-    # Pipe used for wake up select
+    # Non-blocking pipe used for wake up select, which is drained on every wake up
     self.pipe_r, self.pipe_w = os.pipe()
+    for fd in (self.pipe_r, self.pipe_w):
+      fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+    # wake_up() may be called from another thread after on_exit() closed the pipe, which sets
+    # pipe_w to None
+    self._pipe_lock = threading.Lock()
+
+    self._epoll = None
+    # map from fd to the event mask currently registered to epoll
+    self._registered = {}
+    if use_epoll and hasattr(select, "epoll"):
+      self._epoll = select.epoll()
+      self._epoll.register(self.pipe_r, select.EPOLLIN)
 
     self.started = time.time()
     Log.debug("Gateway Looper started time: " + str(time.asctime()))
@@ -58,19 +81,118 @@ class GatewayLooper(EventLooper):
       self.poll(timeout=0.0)
 
   def wake_up(self):
-    os.write(self.pipe_w, "\n")
+    with self._pipe_lock:
+      if self.pipe_w is None:
+        # the looper has already exited, so there is nothing to wake up
+        return
+      try:
+        os.write(self.pipe_w, "\n")
+      except OSError as e:
+        # pipe is full, so the looper is already going to wake up
+        if e.errno != errno.EAGAIN:
+          raise
     Log.debug("Wake up called")
 
   def on_exit(self):
     super(GatewayLooper, self).on_exit()
-    os.close(self.pipe_r)
-    os.close(self.pipe_w)
+    if self._epoll is not None:
+      self._epoll.close()
+    with self._pipe_lock:
+      os.close(self.pipe_r)
+      os.close(self.pipe_w)
+      self.pipe_w = None
+
+  def _drain_wakeup_pipe(self):
+    try:
+      while os.read(self.pipe_r, 1024):
+        pass
+    except OSError as e:
+      if e.errno != errno.EAGAIN:
+        raise
 
-  # pylint: disable=too-many-branches
   def poll(self, timeout=0.0):
     """Modified version of poll() from asyncore module"""
     if self.sock_map is None:
       Log.warning("Socket map is not registered to Gateway Looper")
+    if self._epoll is not None:
+      self._poll_epoll(timeout)
+    else:
+      self._poll_select(timeout)
+
+  def _update_registration(self):
+    """Registers, modifies or unregisters fds of the socket map to epoll based on their interest"""
+    registered = self._registered
+    sock_map = self.sock_map if self.sock_map is not None else {}
+
+    for fd in [fd for fd in registered if fd not in sock_map]:
+      self._unregister(fd)
+
+    for fd, obj in sock_map.items():
+      flags = _get_interest_flags(obj)
+      current = registered.get(fd)
+      if current == flags or (current is None and not flags):
+        continue
+      if not flags:
+        self._unregister(fd)
+      else:
+        self._register(fd, flags, current is None)
+
+  def _register(self, fd, flags, is_new):
+    """Registers a new fd to epoll, or modifies the event mask of an already registered one"""
+    if is_new:
+      try:
+        self._epoll.register(fd, flags)
+      except IOError as e:
+        if e.errno != errno.EEXIST:
+          raise
+        self._epoll.modify(fd, flags)
+    else:
+      try:
+        self._epoll.modify(fd, flags)
+      except IOError as e:
+        # fd was closed and re-opened since it was registered
+        if e.errno != errno.ENOENT:
+          raise
+        self._epoll.register(fd, flags)
+    self._registered[fd] = flags
+
+  def _unregister(self, fd):
+    del self._registered[fd]
+    try:
+      self._epoll.unregister(fd)
+    except (IOError, ValueError):
+      # already closed, so epoll removed it automatically
+      pass
+
+  def _poll_epoll(self, timeout):
+    self._update_registration()
+    if timeout is None or timeout > _MAX_EPOLL_TIMEOUT:
+      timeout = -1
+
+    is_debug = Log.isEnabledFor(logging.DEBUG)
+    if is_debug:
+      Log.debug("Will epoll() with timeout: %s, with map: %s" % (str(timeout), str(self.sock_map)))
+    try:
+      events = self._epoll.poll(timeout)
+    except IOError as err:
+      if err.errno != errno.EINTR:
+        raise
+      Log.debug("Trivial error: " + str(err))
+      return
+    if is_debug:
+      Log.debug("Polled events: " + str(events))
+
+    for fd, flags in events:
+      if fd == self.pipe_r:
+        self._drain_wakeup_pipe()
+        continue
+      obj = self.sock_map.get(fd) if self.sock_map is not None else None
+      if obj is None:
+        continue
+      asyncore.readwrite(obj, flags)
+
+  # pylint: disable=too-many-branches
+  def _poll_select(self, timeout):
     readable_lst = []
     writable_lst = []
     error_lst = []
@@ -89,22 +211,25 @@ class GatewayLooper(EventLooper):
     # Add wakeup fd
     readable_lst.append(self.pipe_r)
 
-    Log.debug("Will select() with timeout: " + str(timeout) + ", with map: " + str(self.sock_map))
+    is_debug = Log.isEnabledFor(logging.DEBUG)
+    if is_debug:
+      Log.debug("Will select() with timeout: " + str(timeout) + ", with map: " + str(self.sock_map))
     try:
       readable_lst, writable_lst, error_lst = \
         select.select(readable_lst, writable_lst, error_lst, timeout)
     except select.error, err:
-      Log.debug("Trivial error: " + err.message)
+      Log.debug("Trivial error: " + str(err))
       if err.args[0] != errno.EINTR:
         raise
       else:
         return
-    Log.debug("Selected [r]: " + str(readable_lst) +
-              " [w]: " + str(writable_lst) + " [e]: " + str(error_lst))
+    if is_debug:
+      Log.debug("Selected [r]: " + str(readable_lst) +
+                " [w]: " + str(writable_lst) + " [e]: " + str(error_lst))
 
     if self.pipe_r in readable_lst:
       Log.debug("Read from pipe")
-      os.read(self.pipe_r, 1024)
+      self._drain_wakeup_pipe()
       readable_lst.remove(self.pipe_r)
 
     if self.sock_map is not None:
@@ -126,3 +251,14 @@ class GatewayLooper(EventLooper):
           continue
         # pylint: disable=W0212
         asyncore._exception(obj)
+
+def _get_interest_flags(obj):
+  """Returns the epoll event mask of a dispatcher based on its interest, 0 if it has none"""
+  flags = 0
+  if obj.readable():
+    flags |= select.EPOLLIN | select.EPOLLPRI
+  if obj.writable() and not obj.accepting:
+    flags |= select.EPOLLOUT
+  if flags:
+    flags |= select.EPOLLERR | select.EPOLLHUP
+  return flags
@@ -53,8 +53,30 @@ TOPOLOGY_MAX_SPOUT_PENDING = "topology.max.spout.pending"
 TOPOLOGY_AUTO_TASK_HOOKS = "topology.auto.task.hooks"
 # The serialization class that is used to serialize/deserialize tuples
 TOPOLOGY_SERIALIZER_CLASSNAME = "topology.serializer.classname"
+# Serializers used for each stream, overriding topology.serializer.classname.
+# dict <component name -> <stream id -> built-in serializer name or serializer class name>>
+TOPOLOGY_STREAM_SERIALIZERS = "topology.stream.serializers"
+# Whether to serialize all the fields of a tuple as a single value, instead of each field.
+# Only for topologies whose components are all written in Python.
+TOPOLOGY_WHOLE_TUPLE_SERIALIZATION = "topology.serializer.whole.tuple"
 # How many executors to spawn for ackers.
 TOPOLOGY_ENABLE_ACKING = "topology.acking"
+# Whether to merge acks (and fails) of the same root while they are buffered in an instance.
+TOPOLOGY_ACK_COALESCING = "topology.acking.coalesce"
+# Target latency in ms of an emit/execute batch. If set, batch limits of instances are tuned
+# at runtime to meet it, instead of staying at the system config values.
+TOPOLOGY_ADAPTIVE_BATCHING_LATENCY_SLO_MS = "topology.adaptive.batching.latency.slo.ms"
+# Latencies are measured for 1 in this many tuples (e.g. data tuples executed by a bolt, calls
+# to next_tuple() of a spout, and serializations), and counts stay exact. Tuples whose
+# latencies are not measured have None as creation_time. Every tuple is measured if task hooks
+# are registered. Default is 1, i.e. every tuple.
+TOPOLOGY_LATENCY_SAMPLING_INTERVAL = "topology.latency.sampling.interval"
+# Number of worker processes running process() of a python bolt; 0 runs it in the instance.
+TOPOLOGY_BOLT_PROCESS_POOL_SIZE = "topology.bolt.process.pool.size"
+# Whether results of the worker processes are emitted in the order tuples were received.
+TOPOLOGY_BOLT_PROCESS_POOL_ORDERED = "topology.bolt.process.pool.ordered"
+# Number of tuples each worker process can hold before the bolt stops reading tuples.
+TOPOLOGY_BOLT_PROCESS_POOL_MAX_PENDING = "topology.bolt.process.pool.max.pending"
 
 # Number of cpu cores per container to be reserved for this topology.
 TOPOLOGY_CONTAINER_CPU_REQUESTED = "topology.container.cpu"
@@ -117,6 +139,9 @@ INSTANCE_INTERNAL_SPOUT_WRITE_QUEUE_CAPACITY = "heron.instance.internal.spout.wr
 # The queue capacity (num of items) for metrics packets to write to metrics manager
 INSTANCE_INTERNAL_METRICS_WRITE_QUEUE_CAPACITY = \
   "heron.instance.internal.metrics.write.queue.capacity"
+# Whether a Python instance runs the spout/bolt on an executor thread, separate from the gateway
+# thread handling the network I/O. Default false, i.e. a single thread
+INSTANCE_PYTHON_EXECUTOR_THREAD = "heron.instance.python.executor.thread"
 
 # Time based, the maximum batch time in ms for instance to read from stream manager per attempt
 INSTANCE_NETWORK_READ_BATCH_TIME_MS = "heron.instance.network.read.batch.time.ms"
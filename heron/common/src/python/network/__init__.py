@@ -1,6 +1,7 @@
 '''network module'''
 __all__ = ['protocol', 'heron_client', 'socket_options']
 
-from .protocol import HeronProtocol, OutgoingPacket, IncomingPacket, REQID, StatusCode
+from .protocol import (HeronProtocol, OutgoingPacket, IncomingPacket, PacketReader, REQID,
+                       StatusCode)
 from .heron_client import HeronClient
 from .socket_options import SocketOptions, create_socket_options
@@ -14,12 +14,15 @@
 '''heron_client.py'''
 
 import asyncore
+import collections
+import itertools
 import socket
 import traceback
 from abc import abstractmethod
 
 import time
-from heron.common.src.python.network import HeronProtocol, REQID, StatusCode, OutgoingPacket
+from heron.common.src.python.network import (HeronProtocol, REQID, StatusCode, OutgoingPacket,
+                                             PacketReader)
 from heron.common.src.python.utils.log import Log
 import heron.common.src.python.constants as constants
 
@@ -46,14 +49,14 @@ class HeronClient(asyncore.dispatcher):
     self.hostname = hostname
     self.port = int(port)
     self.endpoint = (self.hostname, self.port)
-    self.out_buffer = []
+    self.out_buffer = collections.deque()
     self.socket_options = socket_options
 
     # map <message name -> message.Message object>
     self.registered_message_map = dict()
     self.response_message_map = dict()
     self.context_map = dict()
-    self.incomplete_pkt = None
+    self.packet_reader = PacketReader()
 
     self.total_bytes_written = 0
     self.total_pkt_written = 0
@@ -85,7 +88,7 @@ class HeronClient(asyncore.dispatcher):
     self.close()
 
   def _clean_up_state(self):
-    self.out_buffer = []
+    self.out_buffer = collections.deque()
     self.total_bytes_written = 0
     self.total_pkt_written = 0
     self.total_bytes_received = 0
@@ -94,10 +97,10 @@ class HeronClient(asyncore.dispatcher):
     self.registered_message_map = dict()
     self.response_message_map = dict()
     self.context_map = dict()
-    self.incomplete_pkt = None
+    self.packet_reader = PacketReader()
     self._connecting = False
 
-  # read bytes stream from socket and convert them into a list of IncomingPacket
+  # read bytes stream from socket and decode as many complete packets as are read
   def handle_read(self):
     start_cycle_time = time.time()
     bytes_read = 0
@@ -109,31 +112,22 @@ class HeronClient(asyncore.dispatcher):
 
     while (time.time() - start_cycle_time - read_batch_time_sec) < 0 and \
             bytes_read < read_batch_size_bytes:
-      if self.incomplete_pkt is None:
-        # incomplete packet doesn't exist
-        pkt = HeronProtocol.read_new_packet(self)
-      else:
-        # continue reading into the incomplete packet
-        Log.debug("In handle_read(): Continue reading")
-        pkt = self.incomplete_pkt
-        pkt.read(self)
+      if self.packet_reader.read(self) == 0:
+        break
 
-      if pkt.is_complete:
+      for typename, reqid, serialized_msg, pktsize in self.packet_reader.decode_packets():
         num_pkt_read += 1
-        bytes_read += pkt.get_pktsize()
-        Log.debug("Read a complete packet of size %d" % bytes_read)
-        self.incomplete_pkt = None
-        read_pkt_list.append(pkt)
-      else:
-        Log.debug("In handle_read(): Packet read not yet complete")
-        self.incomplete_pkt = pkt
-        break
+        bytes_read += pktsize
+        read_pkt_list.append((typename, reqid, serialized_msg))
+
+    if self.packet_reader.pending_size > 0:
+      Log.debug("In handle_read(): Packet read not yet complete")
 
     self.total_bytes_received += bytes_read
     self.total_pkt_received += num_pkt_read
 
-    for pkt in read_pkt_list:
-      self._handle_packet(pkt)
+    for typename, reqid, serialized_msg in read_pkt_list:
+      self._dispatch_packet(typename, reqid, serialized_msg)
 
   def handle_write(self):
     if len(self.out_buffer) == 0:
@@ -147,20 +141,47 @@ class HeronClient(asyncore.dispatcher):
 
     while (time.time() - start_cycle_time - write_batch_time_sec) < 0 and \
             bytes_written < write_batch_size_bytes and len(self.out_buffer) > 0:
-      outgoing_pkt = self.out_buffer[0]
-      outgoing_pkt.send(self)
-
-      if outgoing_pkt.sent_complete:
-        num_pkt_written += 1
-        bytes_written += len(outgoing_pkt)
-        self.out_buffer.remove(outgoing_pkt)
-      else:
-        # sending this packet not complete yet, will continue later
+      to_send = self._coalesce_out_buffer(write_batch_size_bytes - bytes_written)
+      sent = self.send(to_send)
+
+      # remove packets that are completely sent, and keep the offset of a partially sent one
+      remaining = sent
+      while remaining > 0:
+        outgoing_pkt = self.out_buffer[0]
+        remaining -= outgoing_pkt.advance(remaining)
+        if outgoing_pkt.sent_complete:
+          num_pkt_written += 1
+          bytes_written += len(outgoing_pkt)
+          self.out_buffer.popleft()
+
+      if sent < len(to_send):
+        # socket's send buffer is full, will continue later
         break
 
     self.total_bytes_written += bytes_written
     self.total_pkt_written += num_pkt_written
 
+  def _coalesce_out_buffer(self, max_bytes):
+    """Returns the content of packets at the head of out_buffer, to be sent with one send() call
+
+    At least one packet is included, and following packets are included as long as the total
+    size does not exceed ``max_bytes``.
+    """
+    first = self.out_buffer[0]
+    size = first.remaining_size
+    if len(self.out_buffer) == 1 or size >= max_bytes:
+      return first.get_remaining()
+
+    chunks = [first.get_remaining().tobytes() if first.offset > 0 else first.raw]
+    for outgoing_pkt in itertools.islice(self.out_buffer, 1, None):
+      if size + len(outgoing_pkt) > max_bytes:
+        break
+      chunks.append(outgoing_pkt.raw)
+      size += len(outgoing_pkt)
+    if len(chunks) == 1:
+      return first.get_remaining()
+    return ''.join(chunks)
+
   def writable(self):
     if self._connecting:
       return True
@@ -246,11 +267,38 @@ class HeronClient(asyncore.dispatcher):
       self.handle_close()
       self.on_error()
 
+  def recv_into(self, buf):
+    """Reads bytes from the socket into ``buf``, in the same manner as asyncore's ``recv()``
+
+    :returns: number of bytes read, 0 if the connection is closed
+    """
+    try:
+      num_bytes = self.socket.recv_into(buf)
+      if num_bytes == 0:
+        # a closed connection is indicated by signaling a read condition, and having recv() 0
+        self.handle_close()
+      return num_bytes
+    except socket.error as why:
+      # pylint: disable=protected-access
+      if why.args[0] in asyncore._DISCONNECTED:
+        self.handle_close()
+        return 0
+      else:
+        raise
+
   def _handle_packet(self, packet):
     # only called when packet.is_complete is True
-    # otherwise, it's just an message -- call on_incoming_message()
     typename, reqid, serialized_msg = HeronProtocol.decode_packet(packet)
-    if self.context_map.has_key(reqid):
+    self._dispatch_packet(typename, reqid, serialized_msg)
+
+  def _dispatch_packet(self, typename, reqid, serialized_msg):
+    # if reqid is zero, it's just an message -- call on_incoming_message()
+    # otherwise, if reqid is registered, it's a response -- call on_response()
+    if reqid is REQID.ZERO:
+      # fast path for messages, which are most of the packets (e.g. tuples from stream manager),
+      # as unpacked zero REQID is always the singleton
+      self._handle_message(typename, serialized_msg)
+    elif self.context_map.has_key(reqid):
       # this incoming packet has the response of a request
       context = self.context_map.pop(reqid)
       response_msg = self.response_message_map.pop(reqid)
@@ -268,25 +316,28 @@ class HeronClient(asyncore.dispatcher):
         Log.error("Response not initialized")
         self.on_response(StatusCode.INVALID_PACKET, context, None)
     elif reqid.is_zero():
-      # this is a Message -- no need to send back response
-      try:
-        if typename not in self.registered_message_map:
-          raise ValueError("%s is not registered in message map" % typename)
-        msg_builder = self.registered_message_map[typename]
-        message = msg_builder()
-        message.ParseFromString(serialized_msg)
-        if message.IsInitialized():
-          self.on_incoming_message(message)
-        else:
-          raise RuntimeError("Message not initialized")
-      except Exception as e:
-        Log.error("Error when handling message packet: %s" % e.message)
-        Log.error(traceback.format_exc())
+      self._handle_message(typename, serialized_msg)
     else:
       # might be a timeout response
       Log.info("In handle_packet(): Received message whose REQID is not registered: %s"
                % str(reqid))
 
+  def _handle_message(self, typename, serialized_msg):
+    # this is a Message -- no need to send back response
+    try:
+      if typename not in self.registered_message_map:
+        raise ValueError("%s is not registered in message map" % typename)
+      msg_builder = self.registered_message_map[typename]
+      message = msg_builder()
+      message.ParseFromString(serialized_msg)
+      if message.IsInitialized():
+        self.on_incoming_message(message)
+      else:
+        raise RuntimeError("Message not initialized")
+    except Exception as e:
+      Log.error("Error when handling message packet: %s" % e.message)
+      Log.error(traceback.format_exc())
+
   def _send_packet(self, pkt):
     """Pushes a packet to a send buffer, the content of which will be send when available"""
     self.out_buffer.append(pkt)
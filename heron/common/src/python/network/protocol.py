@@ -59,29 +59,45 @@ class HeronProtocol(object):
     if not packet.is_complete:
       raise RuntimeError("In decode_packet(): Packet corrupted")
 
-    data = packet.data
+    return HeronProtocol.decode_data(packet.data, 0)
 
-    len_typename = HeronProtocol.unpack_int(data[:4])
-    data = data[4:]
+  @staticmethod
+  def decode_data(buf, offset):
+    """Decodes the data part of a packet that starts at ``offset`` of ``buf``
+
+    Each field is copied out of ``buf`` only once, using ``memoryview`` offsets.
+
+    :param buf: str or bytearray containing the packet
+    :param offset: offset of the data part (i.e. right after the header) of the packet in ``buf``
+    :returns: (typename, reqid, serialized message)
+    """
+    view = memoryview(buf)
+
+    len_typename = struct.unpack_from(HeronProtocol.INT_PACK_FMT, buf, offset)[0]
+    offset += 4
 
-    typename = data[:len_typename]
-    data = data[len_typename:]
+    typename = view[offset:offset + len_typename].tobytes()
+    offset += len_typename
 
-    reqid = REQID.unpack(data[:REQID.REQID_SIZE])
-    data = data[REQID.REQID_SIZE:]
+    reqid = REQID.unpack(view[offset:offset + REQID.REQID_SIZE])
+    offset += REQID.REQID_SIZE
 
-    len_msg = HeronProtocol.unpack_int(data[:4])
-    data = data[4:]
+    len_msg = struct.unpack_from(HeronProtocol.INT_PACK_FMT, buf, offset)[0]
+    offset += 4
 
-    serialized_msg = data[:len_msg]
+    serialized_msg = view[offset:offset + len_msg].tobytes()
 
     return typename, reqid, serialized_msg
 
 class OutgoingPacket(object):
-  """Wrapper class for outgoing packet"""
+  """Wrapper class for outgoing packet
+
+  The progress of sending is tracked by ``offset`` into ``raw``, so that the content is not
+  copied after every partial send.
+  """
   def __init__(self, raw_data):
     self.raw = str(raw_data)
-    self.to_send = str(raw_data)
+    self.offset = 0
 
   def __len__(self):
     return len(self.raw)
@@ -120,15 +136,35 @@ class OutgoingPacket(object):
   @property
   def sent_complete(self):
     """Indicates whether this packet is successfully sent"""
-    return len(self.to_send) == 0
+    return self.offset >= len(self.raw)
+
+  @property
+  def remaining_size(self):
+    """Returns the number of bytes yet to be sent"""
+    return len(self.raw) - self.offset
+
+  def get_remaining(self):
+    """Returns the bytes yet to be sent, without copying if nothing has been sent yet"""
+    if self.offset == 0:
+      return self.raw
+    return memoryview(self.raw)[self.offset:]
+
+  def advance(self, num_bytes):
+    """Marks ``num_bytes`` of this packet as sent
+
+    :returns: number of bytes consumed from ``num_bytes`` by this packet
+    """
+    consumed = min(num_bytes, self.remaining_size)
+    self.offset += consumed
+    return consumed
 
   def send(self, dispatcher):
     """Sends this outgoing packet to dispatcher's socket"""
     if self.sent_complete:
       return
 
-    sent = dispatcher.send(self.to_send)
-    self.to_send = self.to_send[sent:]
+    sent = dispatcher.send(self.get_remaining())
+    self.advance(sent)
 
 class IncomingPacket(object):
   """Helper class for incoming packet"""
@@ -210,25 +246,116 @@ class IncomingPacket(object):
     return "Packet ID: %s, header: %s, complete: %s" % \
            (str(self.id), self.is_header_read, self.is_complete)
 
+class PacketReader(object):
+  """Buffered reader of incoming packets
+
+  Bytes are read from a socket with ``recv_into()`` into a reusable ``bytearray``, so that
+  one system call can read many packets. Then, as many complete packets as are present in
+  the buffer are split out and decoded at once, and a trailing incomplete packet is kept in the
+  buffer until the rest of it is read.
+  """
+  DEFAULT_BUFFER_SIZE = 64 * 1024
+
+  def __init__(self, buffer_size=DEFAULT_BUFFER_SIZE):
+    self._buffer = bytearray(buffer_size)
+    # unconsumed bytes are in self._buffer[self._start:self._end]
+    self._start = 0
+    self._end = 0
+
+  @property
+  def pending_size(self):
+    """Returns the number of bytes read but not yet decoded"""
+    return self._end - self._start
+
+  def read(self, dispatcher):
+    """Reads available bytes from dispatcher with one ``recv_into()`` call
+
+    :returns: number of bytes read, which is 0 if no bytes are available or the connection closed
+    """
+    self._make_room()
+    try:
+      num_bytes = dispatcher.recv_into(memoryview(self._buffer)[self._end:])
+    except socket.error as e:
+      if e.errno == socket.errno.EAGAIN or e.errno == socket.errno.EWOULDBLOCK:
+        # Try again later
+        Log.debug("Try again error")
+        return 0
+      else:
+        # Fatal error
+        Log.debug("Fatal error when reading packets")
+        raise RuntimeError("Fatal error occured in PacketReader.read()")
+    self._end += num_bytes
+    return num_bytes
+
+  def decode_packets(self):
+    """Splits out and decodes all the complete packets in the buffer
+
+    :returns: list of (typename, reqid, serialized message, packet size) of complete packets
+    """
+    ret = []
+    buf = self._buffer
+    while self._end - self._start >= HeronProtocol.HEADER_SIZE:
+      pktsize = HeronProtocol.HEADER_SIZE + \
+                struct.unpack_from(HeronProtocol.INT_PACK_FMT, buf, self._start)[0]
+      if self._end - self._start < pktsize:
+        break
+      typename, reqid, serialized_msg = \
+        HeronProtocol.decode_data(buf, self._start + HeronProtocol.HEADER_SIZE)
+      ret.append((typename, reqid, serialized_msg, pktsize))
+      self._start += pktsize
+
+    if self._start == self._end:
+      self._start = self._end = 0
+    return ret
+
+  def _make_room(self):
+    """Makes sure that there is free space at the end of the buffer
+
+    A trailing incomplete packet is moved to the front of the buffer, and the buffer is grown
+    if the packet does not fit in it.
+    """
+    pending = self._end - self._start
+    required = pending + 1
+    if pending >= HeronProtocol.HEADER_SIZE:
+      required = max(required, HeronProtocol.HEADER_SIZE +
+                     struct.unpack_from(HeronProtocol.INT_PACK_FMT, self._buffer, self._start)[0])
+    if len(self._buffer) - self._end >= required - pending:
+      return
+
+    if self._start > 0:
+      self._buffer[:pending] = self._buffer[self._start:self._end]
+      self._start, self._end = 0, pending
+    if len(self._buffer) < required:
+      self._buffer.extend(bytearray(max(required, 2 * len(self._buffer)) - len(self._buffer)))
 
 class REQID(object):
-  """Helper class for REQID"""
+  """Helper class for REQID
+
+  REQID is backed by an immutable 32-byte string, whose hash is computed once at construction.
+  There is only one zero REQID object, ``REQID.ZERO``, which is returned by ``generate_zero()``
+  and by ``unpack()`` of zero bytes, so that messages can be recognized by identity.
+  """
+  __slots__ = ('bytes', '_hash')
   REQID_SIZE = 32
+  ZERO_BYTES = '\x00' * REQID_SIZE
+  ZERO = None
 
   def __init__(self, data_bytes):
-    self.bytes = data_bytes
+    self.bytes = str(data_bytes)
+    self._hash = hash(self.bytes)
 
   @staticmethod
   def generate():
     """Generates a random REQID for request"""
-    data_bytes = bytearray(random.getrandbits(8) for i in range(REQID.REQID_SIZE))
-    return REQID(data_bytes)
+    while True:
+      data_bytes = ('%064x' % random.getrandbits(8 * REQID.REQID_SIZE)).decode('hex')
+      if data_bytes != REQID.ZERO_BYTES:
+        return REQID(data_bytes)
 
   @staticmethod
   def generate_zero():
     """Generates a zero REQID for message"""
-    data_bytes = bytearray(0 for i in range(REQID.REQID_SIZE))
-    return REQID(data_bytes)
+    return REQID.ZERO
 
   def pack(self):
     """Packs this REQID to bytestring"""
@@ -236,24 +363,32 @@ class REQID(object):
 
   def is_zero(self):
     """Checks if this REQID is zero"""
-    return self == REQID.generate_zero()
+    return self is REQID.ZERO or self.bytes == REQID.ZERO_BYTES
 
   @staticmethod
   def unpack(raw_data):
-    """Unpacks a given bytestring and returns REQID object"""
-    return REQID(bytearray(raw_data))
+    """Unpacks a given bytestring (or memoryview) and returns REQID object"""
+    data_bytes = raw_data.tobytes() if isinstance(raw_data, memoryview) else str(raw_data)
+    if data_bytes == REQID.ZERO_BYTES:
+      return REQID.ZERO
+    return REQID(data_bytes)
 
   def __eq__(self, another):
-    return hasattr(another, 'bytes') and self.bytes == another.bytes
+    return self is another or (hasattr(another, 'bytes') and self.bytes == another.bytes)
+
+  def __ne__(self, another):
+    return not self.__eq__(another)
 
   def __hash__(self):
-    return hash(self.__str__())
+    return self._hash
 
   def __str__(self):
     if self.is_zero():
       return "ZERO"
     else:
-      return ''.join([str(i) for i in list(self.bytes)])
+      return ''.join([str(ord(i)) for i in self.bytes])
+
+REQID.ZERO = REQID(REQID.ZERO_BYTES)
 
 class StatusCode(object):
   """StatusCode for Response"""
@@ -10,6 +10,12 @@ from .metrics import (IMetric,
                       MultiReducedMetric,
                       AssignableMetrics,
                       MultiAssignableMetrics,
+                      Counter,
+                      Updater,
+                      MeanUpdater,
+                      HistogramMetric,
+                      MultiHistogramMetric,
+                      HistogramUpdater,
                       MeanReducedMetric,
                       MultiMeanReducedMetric)
 
@@ -13,6 +13,7 @@
 # limitations under the License.
 """metrics.py: common heron metric"""
 from abc import abstractmethod
+from array import array
 
 # pylint: disable=attribute-defined-outside-init
 
@@ -38,26 +39,75 @@ class CountMetric(IMetric):
     self.value = 0
     return ret
 
+class _SlotMap(object):
+  """Interned keys of a multi-key metric, each of which is given an integer slot
+
+  Values of a key are kept in flat lists indexed by its slot, which is never reused, so that
+  a handle bound to slots stays valid across resets.
+  """
+  def __init__(self):
+    self.keys = []
+    self.slots = {}
+
+  def get_slot(self, key):
+    """Returns the slot of a given key, interning the key if it is new"""
+    slot = self.slots.get(key, None)
+    if slot is None:
+      slot = len(self.keys)
+      self.keys.append(key)
+      self.slots[key] = slot
+    return slot
+
+class Counter(object):
+  """Handle of a MultiCountMetric bound to one or more keys
+
+  ``incr()`` increments the values of all the keys, without looking them up.
+  """
+  __slots__ = ('_values', '_slots')
+
+  def __init__(self, values, slots):
+    self._values = values
+    self._slots = tuple(slots)
+
+  def incr(self, to_add=1):
+    """Increments the values of the keys by ``to_add``"""
+    values = self._values
+    for slot in self._slots:
+      values[slot] += to_add
+
 class MultiCountMetric(IMetric):
   """Counter for a multiple value"""
   def __init__(self):
     """Initializes MultiCountMetric"""
-    self.value = {}
+    self._slot_map = _SlotMap()
+    self._values = []
+
+  def _get_slot(self, key):
+    slot = self._slot_map.get_slot(key)
+    if slot == len(self._values):
+      self._values.append(0)
+    return slot
 
   def add_key(self, key):
     """Registers a new key"""
-    self.incr(key, to_add=0)
+    self._get_slot(key)
 
   def incr(self, key, to_add=1):
     """Increments the value of a given key by ``to_add``"""
-    if key not in self.value:
-      self.value[key] = CountMetric()
-    self.value[key].incr(to_add)
+    slot = self._slot_map.slots.get(key, None)
+    if slot is None:
+      slot = self._get_slot(key)
+    self._values[slot] += to_add
+
+  def get_counter(self, *keys):
+    """Returns a Counter bound to given keys, which stays valid across resets"""
+    return Counter(self._values, [self._get_slot(key) for key in keys])
 
   def get_value_and_reset(self):
-    ret = {}
-    for key, value in self.value.iteritems():
-      ret[key] = value.get_value_and_reset()
+    values = self._values
+    ret = dict(zip(self._slot_map.keys, values))
+    # reset in place, as counters hold the list
+    values[:] = [0] * len(values)
     return ret
 
 # Reducer metric
@@ -113,6 +163,21 @@ class ReducedMetric(IMetric):
     self.reducer.init()
     return value
 
+class Updater(object):
+  """Handle of a MultiReducedMetric bound to one or more keys
+
+  ``update()`` reduces a value into all the keys, without looking them up.
+  """
+  __slots__ = ('_reduced_metrics',)
+
+  def __init__(self, reduced_metrics):
+    self._reduced_metrics = tuple(reduced_metrics)
+
+  def update(self, value):
+    """Updates a value of the keys and apply reduction"""
+    for reduced_metric in self._reduced_metrics:
+      reduced_metric.update(value)
+
 class MultiReducedMetric(IMetric):
   """MultiReducedMetric"""
   def __init__(self, reducer):
@@ -123,6 +188,12 @@ class MultiReducedMetric(IMetric):
     self.value = {}
     self.reducer = reducer
 
+  def get_updater(self, *keys):
+    """Returns an Updater bound to given keys, which stays valid across resets"""
+    for key in keys:
+      self.add_key(key)
+    return Updater([self.value[key] for key in keys])
+
   def update(self, key, value):
     """Updates a value of a given key and apply reduction"""
     if key not in self.value:
@@ -170,5 +241,231 @@ class MultiAssignableMetrics(IMetric):
       ret[k] = self.map[k].get_value_and_reset()
     return ret
 
+class MeanUpdater(object):
+  """Handle of a MultiMeanReducedMetric bound to one or more keys"""
+  __slots__ = ('_sums', '_counts', '_slots')
+
+  def __init__(self, sums, counts, slots):
+    self._sums = sums
+    self._counts = counts
+    self._slots = tuple(slots)
+
+  def update(self, value):
+    """Adds a value to the mean of the keys"""
+    value = float(value)
+    sums = self._sums
+    counts = self._counts
+    for slot in self._slots:
+      sums[slot] += value
+      counts[slot] += 1
+
+  def update_total(self, total, count):
+    """Adds ``count`` values summing up to ``total`` to the mean of the keys"""
+    total = float(total)
+    sums = self._sums
+    counts = self._counts
+    for slot in self._slots:
+      sums[slot] += total
+      counts[slot] += count
+
+class MultiMeanReducedMetric(MultiReducedMetric):
+  """MultiReducedMetric with MeanReducer, keeping sums and counts in flat lists by slot"""
+  # pylint: disable=super-init-not-called
+  def __init__(self):
+    self.reducer = MeanReducer
+    self._slot_map = _SlotMap()
+    self._sums = []
+    self._counts = []
+
+  def _get_slot(self, key):
+    slot = self._slot_map.get_slot(key)
+    if slot == len(self._sums):
+      self._sums.append(0.0)
+      self._counts.append(0)
+    return slot
+
+  def update(self, key, value):
+    slot = self._slot_map.slots.get(key, None)
+    if slot is None:
+      slot = self._get_slot(key)
+    self._sums[slot] += float(value)
+    self._counts[slot] += 1
+
+  def add_key(self, key):
+    self._get_slot(key)
+
+  def get_updater(self, *keys):
+    return MeanUpdater(self._sums, self._counts, [self._get_slot(key) for key in keys])
+
+  def get_value_and_reset(self):
+    sums = self._sums
+    counts = self._counts
+    ret = {}
+    for key, total, count in zip(self._slot_map.keys, sums, counts):
+      ret[key] = total / count if count > 0 else None
+    # reset in place, as updaters hold the lists
+    sums[:] = [0.0] * len(sums)
+    counts[:] = [0] * len(counts)
+    return ret
+
 MeanReducedMetric = lambda: ReducedMetric(MeanReducer)
-MultiMeanReducedMetric = lambda: MultiReducedMetric(MeanReducer)
+
+# Histogram metric
+SUB_BUCKET_BITS = 4
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+MAX_HISTOGRAM_VALUE = (1 << 63) - 1
+
+def get_bucket_index(value):
+  """Returns the index of the log-linear bucket of a non-negative int value
+
+  Values below ``2 * SUB_BUCKETS`` have their own buckets, and each power of two above them is
+  split into ``SUB_BUCKETS`` buckets of the same width, so that the width of a bucket is less
+  than ``1 / SUB_BUCKETS`` of its values.
+  """
+  shift = value.bit_length() - SUB_BUCKET_BITS - 1
+  if shift <= 0:
+    return value
+  return (shift << SUB_BUCKET_BITS) + (value >> shift)
+
+def get_bucket_upper_bound(index):
+  """Returns the largest value in the bucket of a given index"""
+  if index < 2 * SUB_BUCKETS:
+    return index
+  shift = (index >> SUB_BUCKET_BITS) - 1
+  mantissa = index - (shift << SUB_BUCKET_BITS)
+  return ((mantissa + 1) << shift) - 1
+
+NUM_HISTOGRAM_BUCKETS = get_bucket_index(MAX_HISTOGRAM_VALUE) + 1
+_MAX_SHIFT = MAX_HISTOGRAM_VALUE.bit_length() - SUB_BUCKET_BITS - 1
+
+def _summarize(counts, base, max_value, percentiles):
+  """Returns a dict of the percentiles and max of a histogram, or ``None`` if it is empty"""
+  buckets = counts[base:base + NUM_HISTOGRAM_BUCKETS]
+  total = sum(buckets)
+  if total == 0:
+    return None
+
+  ret = {}
+  cumulative = 0
+  index = 0
+  for name, fraction in percentiles:
+    # the smallest value such that at least ``fraction`` of the values are not larger
+    rank = max(1, int(round(fraction * total)))
+    while cumulative + buckets[index] < rank:
+      cumulative += buckets[index]
+      index += 1
+    ret[name] = min(get_bucket_upper_bound(index), max_value)
+  ret["max"] = max_value
+  return ret
+
+class HistogramMetric(IMetric):
+  """Histogram of non-negative values (e.g. latencies in ns) in log-linear buckets
+
+  Counts are kept in an array of ``NUM_HISTOGRAM_BUCKETS`` buckets, so the memory footprint is
+  fixed, and two histograms are merged by adding up the counts. A value is recorded with a
+  relative error below ``1 / SUB_BUCKETS``, and the max is recorded exactly.
+
+  ``get_value_and_reset()`` returns a dict of the percentiles in ``PERCENTILES`` and the max,
+  e.g. ``{"p50": 10, "p95": 20, "p99": 30, "max": 35}``, or ``None`` if nothing was recorded.
+  """
+  PERCENTILES = (("p50", 0.50), ("p95", 0.95), ("p99", 0.99))
+
+  def __init__(self):
+    self.counts = array('l', [0]) * NUM_HISTOGRAM_BUCKETS
+    self.max_value = array('l', [0])
+    self._updater = HistogramUpdater(self.counts, self.max_value, (0,))
+
+  def update(self, value):
+    """Records a value"""
+    self._updater.update(value)
+
+  def merge(self, other):
+    """Adds the values recorded in another HistogramMetric"""
+    counts = self.counts
+    for index, count in enumerate(other.counts):
+      if count:
+        counts[index] += count
+    self.max_value[0] = max(self.max_value[0], other.max_value[0])
+
+  def get_value_and_reset(self):
+    ret = _summarize(self.counts, 0, self.max_value[0], self.PERCENTILES)
+    if ret is not None:
+      self.counts[:] = array('l', [0]) * NUM_HISTOGRAM_BUCKETS
+      self.max_value[0] = 0
+    return ret
+
+class HistogramUpdater(object):
+  """Handle of a MultiHistogramMetric bound to one or more keys"""
+  __slots__ = ('_counts', '_maxes', '_targets')
+
+  def __init__(self, counts, maxes, slots):
+    self._counts = counts
+    self._maxes = maxes
+    # (offset of the buckets, slot) of each key
+    self._targets = tuple((slot * NUM_HISTOGRAM_BUCKETS, slot) for slot in slots)
+
+  def update(self, value):
+    """Records a value into the histograms of the keys"""
+    value = int(value)
+    # get_bucket_index() inlined, as this is called once or more per tuple
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    if shift <= 0:
+      index = value if value > 0 else 0
+    elif shift <= _MAX_SHIFT:
+      index = (shift << SUB_BUCKET_BITS) + (value >> shift)
+    else:
+      index = NUM_HISTOGRAM_BUCKETS - 1
+      value = MAX_HISTOGRAM_VALUE
+    counts = self._counts
+    maxes = self._maxes
+    for base, slot in self._targets:
+      counts[base + index] += 1
+      if value > maxes[slot]:
+        maxes[slot] = value
+
+class MultiHistogramMetric(IMetric):
+  """HistogramMetric for multiple keys, whose buckets are kept in one flat array by slot
+
+  ``get_value_and_reset()`` returns a dict of ``<key -> dict of percentiles and max>`` for the
+  keys with recorded values, which ``MetricsCollector`` exports as ``<name>-<percentile>/<key>``.
+  """
+  PERCENTILES = HistogramMetric.PERCENTILES
+
+  def __init__(self):
+    self._slot_map = _SlotMap()
+    self._counts = array('l')
+    self._maxes = array('l')
+
+  def _get_slot(self, key):
+    slot = self._slot_map.get_slot(key)
+    if slot == len(self._maxes):
+      self._counts.extend(array('l', [0]) * NUM_HISTOGRAM_BUCKETS)
+      self._maxes.append(0)
+    return slot
+
+  def add_key(self, key):
+    """Registers a new key"""
+    self._get_slot(key)
+
+  def update(self, key, value):
+    """Records a value into the histogram of a given key"""
+    slot = self._slot_map.slots.get(key, None)
+    if slot is None:
+      slot = self._get_slot(key)
+    HistogramUpdater(self._counts, self._maxes, (slot,)).update(value)
+
+  def get_updater(self, *keys):
+    """Returns a HistogramUpdater bound to given keys, which stays valid across resets"""
+    return HistogramUpdater(self._counts, self._maxes, [self._get_slot(key) for key in keys])
+
+  def get_value_and_reset(self):
+    ret = {}
+    for slot, key in enumerate(self._slot_map.keys):
+      summary = _summarize(self._counts, slot * NUM_HISTOGRAM_BUCKETS, self._maxes[slot],
+                           self.PERCENTILES)
+      if summary is not None:
+        ret[key] = summary
+    # reset in place, as updaters hold the arrays
+    self._counts[:] = array('l', [0]) * len(self._counts)
+    self._maxes[:] = array('l', [0]) * len(self._maxes)
+    return ret
@@ -19,7 +19,47 @@ from heron.proto import metrics_pb2
 import heron.common.src.python.constants as constants
 
 from .metrics import (CountMetric, MultiCountMetric, MeanReducedMetric,
-                      ReducedMetric, MultiMeanReducedMetric, MultiReducedMetric)
+                      ReducedMetric, MultiMeanReducedMetric, MultiReducedMetric,
+                      MultiHistogramMetric)
+
+class SpoutStreamMetrics(object):
+  """Metric handles of an output stream of a spout, bound to the stream id"""
+  __slots__ = ('ack_count', 'complete_latency', 'complete_latency_histogram', 'fail_count',
+               'fail_latency', 'timeout_count')
+
+  # pylint: disable=too-many-arguments
+  def __init__(self, ack_count, complete_latency, complete_latency_histogram, fail_count,
+               fail_latency, timeout_count):
+    self.ack_count = ack_count
+    self.complete_latency = complete_latency
+    self.complete_latency_histogram = complete_latency_histogram
+    self.fail_count = fail_count
+    self.fail_latency = fail_latency
+    self.timeout_count = timeout_count
+
+# pylint: disable=too-many-instance-attributes
+class BoltStreamMetrics(object):
+  """Metric handles of an input stream of a bolt, bound to both the stream id and the global
+  stream id (i.e. ``<source component>/<stream id>``)
+  """
+  __slots__ = ('ack_count', 'process_latency', 'process_latency_histogram', 'fail_count',
+               'fail_latency', 'exec_count', 'exec_latency', 'exec_latency_histogram',
+               'exec_time_ns', 'deserialization_time_ns')
+
+  # pylint: disable=too-many-arguments
+  def __init__(self, ack_count, process_latency, process_latency_histogram, fail_count,
+               fail_latency, exec_count, exec_latency, exec_latency_histogram, exec_time_ns,
+               deserialization_time_ns):
+    self.ack_count = ack_count
+    self.process_latency = process_latency
+    self.process_latency_histogram = process_latency_histogram
+    self.fail_count = fail_count
+    self.fail_latency = fail_latency
+    self.exec_count = exec_count
+    self.exec_latency = exec_latency
+    self.exec_latency_histogram = exec_latency_histogram
+    self.exec_time_ns = exec_time_ns
+    self.deserialization_time_ns = deserialization_time_ns
 
 class BaseMetricsHelper(object):
   """Helper class for metrics management
@@ -117,16 +157,21 @@ class GatewayMetrics(BaseMetricsHelper):
     super(GatewayMetrics, self).__init__(self.metrics)
     interval = float(sys_config[constants.HERON_METRICS_EXPORT_INTERVAL_SEC])
     self.register_metrics(metrics_collector, interval)
+    # updated once per packet, so bound here rather than looked up by name
+    self._received_pkt_count = self.metrics[self.RECEIVED_PKT_COUNT]
+    self._received_pkt_size = self.metrics[self.RECEIVED_PKT_SIZE]
+    self._sent_pkt_count = self.metrics[self.SENT_PKT_COUNT]
+    self._sent_pkt_size = self.metrics[self.SENT_PKT_SIZE]
 
   def update_received_packet(self, received_pkt_size_bytes):
     """Update received packet metrics"""
-    self.update_count(self.RECEIVED_PKT_COUNT)
-    self.update_count(self.RECEIVED_PKT_SIZE, incr_by=received_pkt_size_bytes)
+    self._received_pkt_count.incr()
+    self._received_pkt_size.incr(received_pkt_size_bytes)
 
   def update_sent_packet(self, sent_pkt_size_bytes):
     """Update sent packet metrics"""
-    self.update_count(self.SENT_PKT_COUNT)
-    self.update_count(self.SENT_PKT_SIZE, incr_by=sent_pkt_size_bytes)
+    self._sent_pkt_count.incr()
+    self._sent_pkt_size.incr(sent_pkt_size_bytes)
 
   def update_sent_metrics_size(self, size):
     self.update_count(self.SENT_METRICS_SIZE, size)
@@ -185,27 +230,47 @@ class ComponentMetrics(BaseMetricsHelper):
     """Apply update to serialization metrics"""
     self.update_count(self.TUPLE_SERIALIZATION_TIME_NS, incr_by=latency_in_ns, key=stream_id)
 
+  def get_emit_counters(self, stream_id):
+    """Returns CountMetrics of (emit count, serialization time) for a given stream
+
+    They can be updated directly, instead of ``update_emit_count()`` and
+    ``serialize_data_tuple()``.
+    """
+    return (self.metrics[self.EMIT_COUNT].get_counter(stream_id),
+            self.metrics[self.TUPLE_SERIALIZATION_TIME_NS].get_counter(stream_id))
+
 class SpoutMetrics(ComponentMetrics):
   """Metrics helper class for Spout"""
   ACK_COUNT = "__ack-count"
   COMPLETE_LATENCY = "__complete-latency"
+  # exported as __complete-latency-histogram-<p50|p95|p99|max>/<stream id>
+  COMPLETE_LATENCY_HISTOGRAM = "__complete-latency-histogram"
   TIMEOUT_COUNT = "__timeout-count"
   NEXT_TUPLE_LATENCY = "__next-tuple-latency"
   NEXT_TUPLE_COUNT = "__next-tuple-count"
   PENDING_ACKED_COUNT = "__pending-acked-count"
+  PENDING_TABLE_CAPACITY = "__pending-table-capacity"
+  PENDING_TABLE_OCCUPANCY = "__pending-table-occupancy"
 
   spout_metrics = {ACK_COUNT: MultiCountMetric(),
                    COMPLETE_LATENCY: MultiMeanReducedMetric(),
+                   COMPLETE_LATENCY_HISTOGRAM: MultiHistogramMetric(),
                    TIMEOUT_COUNT: MultiCountMetric(),
                    NEXT_TUPLE_LATENCY: MeanReducedMetric(),
                    NEXT_TUPLE_COUNT: CountMetric(),
-                   PENDING_ACKED_COUNT: MeanReducedMetric()}
+                   PENDING_ACKED_COUNT: MeanReducedMetric(),
+                   PENDING_TABLE_CAPACITY: MeanReducedMetric(),
+                   PENDING_TABLE_OCCUPANCY: MeanReducedMetric()}
 
   to_multi_init = [ACK_COUNT, ComponentMetrics.FAIL_COUNT,
                    TIMEOUT_COUNT, ComponentMetrics.EMIT_COUNT]
 
   def __init__(self, pplan_helper):
     super(SpoutMetrics, self).__init__(self.spout_metrics)
+    self._next_tuple_latency = self.metrics[self.NEXT_TUPLE_LATENCY]
+    self._next_tuple_count = self.metrics[self.NEXT_TUPLE_COUNT]
+    # map <stream id -> SpoutStreamMetrics>
+    self._stream_metrics = {}
     self._init_multi_count_metrics(pplan_helper)
 
   def _init_multi_count_metrics(self, pplan_helper):
@@ -216,29 +281,80 @@ class SpoutMetrics(ComponentMetrics):
       stream_id = out_stream.stream.id
       for metric in to_init:
         metric.add_key(stream_id)
+      self._get_stream_metrics(stream_id)
+
+  def _get_stream_metrics(self, stream_id):
+    """Returns the metric handles of a given output stream, binding them if not bound yet"""
+    handles = self._stream_metrics.get(stream_id, None)
+    if handles is None:
+      metrics = self.metrics
+      handles = SpoutStreamMetrics(
+          ack_count=metrics[self.ACK_COUNT].get_counter(stream_id),
+          complete_latency=metrics[self.COMPLETE_LATENCY].get_updater(stream_id),
+          complete_latency_histogram=\
+              metrics[self.COMPLETE_LATENCY_HISTOGRAM].get_updater(stream_id),
+          fail_count=metrics[self.FAIL_COUNT].get_counter(stream_id),
+          fail_latency=metrics[self.FAIL_LATENCY].get_updater(stream_id),
+          timeout_count=metrics[self.TIMEOUT_COUNT].get_counter(stream_id))
+      self._stream_metrics[stream_id] = handles
+    return handles
 
   def next_tuple(self, latency_in_ns):
-    """Apply updates to the next tuple metrics"""
-    self.update_reduced_metric(self.NEXT_TUPLE_LATENCY, latency_in_ns)
-    self.update_count(self.NEXT_TUPLE_COUNT)
+    """Apply updates to the next tuple metrics
+
+    :param latency_in_ns: latency of ``next_tuple()``, or ``None`` if it was not measured
+    """
+    if latency_in_ns is not None:
+      self._next_tuple_latency.update(latency_in_ns)
+    self._next_tuple_count.incr()
 
   def acked_tuple(self, stream_id, complete_latency_ns):
     """Apply updates to the ack metrics"""
-    self.update_count(self.ACK_COUNT, key=stream_id)
-    self.update_reduced_metric(self.COMPLETE_LATENCY, complete_latency_ns, key=stream_id)
+    handles = self._stream_metrics.get(stream_id, None) or self._get_stream_metrics(stream_id)
+    handles.ack_count.incr()
+    handles.complete_latency.update(complete_latency_ns)
+    handles.complete_latency_histogram.update(complete_latency_ns)
 
   def failed_tuple(self, stream_id, fail_latency_ns):
     """Apply updates to the fail metrics"""
-    self.update_count(self.FAIL_COUNT, key=stream_id)
-    self.update_reduced_metric(self.FAIL_LATENCY, fail_latency_ns, key=stream_id)
+    handles = self._stream_metrics.get(stream_id, None) or self._get_stream_metrics(stream_id)
+    handles.fail_count.incr()
+    handles.fail_latency.update(fail_latency_ns)
+
+  def acked_tuple_batch(self, stream_id, complete_latencies_ns):
+    """Apply updates to the ack metrics for a batch of tuples
+
+    :param complete_latencies_ns: complete latency of each tuple in the batch
+    """
+    handles = self._stream_metrics.get(stream_id, None) or self._get_stream_metrics(stream_id)
+    handles.ack_count.incr(len(complete_latencies_ns))
+    handles.complete_latency.update_total(sum(complete_latencies_ns), len(complete_latencies_ns))
+    update_histogram = handles.complete_latency_histogram.update
+    for complete_latency_ns in complete_latencies_ns:
+      update_histogram(complete_latency_ns)
+
+  def failed_tuple_batch(self, stream_id, fail_latencies_ns):
+    """Apply updates to the fail metrics for a batch of tuples
+
+    :param fail_latencies_ns: fail latency of each tuple in the batch
+    """
+    handles = self._stream_metrics.get(stream_id, None) or self._get_stream_metrics(stream_id)
+    handles.fail_count.incr(len(fail_latencies_ns))
+    handles.fail_latency.update_total(sum(fail_latencies_ns), len(fail_latencies_ns))
 
   def update_pending_tuples_count(self, count):
     """Apply updates to the pending tuples count"""
     self.update_reduced_metric(self.PENDING_ACKED_COUNT, count)
 
+  def update_pending_table(self, capacity, occupancy):
+    """Apply updates to the capacity (in slots) and occupancy (fraction) of the pending table"""
+    self.update_reduced_metric(self.PENDING_TABLE_CAPACITY, capacity)
+    self.update_reduced_metric(self.PENDING_TABLE_OCCUPANCY, occupancy)
+
   def timeout_tuple(self, stream_id):
     """Apply updates to the timeout count"""
-    self.update_count(self.TIMEOUT_COUNT, key=stream_id)
+    handles = self._stream_metrics.get(stream_id, None) or self._get_stream_metrics(stream_id)
+    handles.timeout_count.incr()
 
 class BoltMetrics(ComponentMetrics):
   """Metrics helper class for Bolt"""
@@ -246,6 +362,9 @@ class BoltMetrics(ComponentMetrics):
   PROCESS_LATENCY = "__process-latency"
   EXEC_COUNT = "__execute-count"
   EXEC_LATENCY = "__execute-latency"
+  # exported as <name>-<p50|p95|p99|max>/<stream id>
+  PROCESS_LATENCY_HISTOGRAM = "__process-latency-histogram"
+  EXEC_LATENCY_HISTOGRAM = "__execute-latency-histogram"
   EXEC_TIME_NS = "__execute-time-ns"
   TUPLE_DESERIALIZATION_TIME_NS = "__tuple-deserialization-time-ns"
 
@@ -253,6 +372,8 @@ class BoltMetrics(ComponentMetrics):
                   PROCESS_LATENCY: MultiMeanReducedMetric(),
                   EXEC_COUNT: MultiCountMetric(),
                   EXEC_LATENCY: MultiMeanReducedMetric(),
+                  PROCESS_LATENCY_HISTOGRAM: MultiHistogramMetric(),
+                  EXEC_LATENCY_HISTOGRAM: MultiHistogramMetric(),
                   EXEC_TIME_NS: MultiCountMetric(),
                   TUPLE_DESERIALIZATION_TIME_NS: MultiCountMetric()}
 
@@ -262,10 +383,16 @@ class BoltMetrics(ComponentMetrics):
 
   def __init__(self, pplan_helper):
     super(BoltMetrics, self).__init__(self.bolt_metrics)
+    # map <(stream id, source component) -> BoltStreamMetrics>
+    self._stream_metrics = {}
     self._init_multi_count_metrics(pplan_helper)
 
   def _init_multi_count_metrics(self, pplan_helper):
-    """Initializes the default values for a necessary set of MultiCountMetrics"""
+    """Initializes the default values for a necessary set of MultiCountMetrics
+
+    Metric handles of the input streams are also bound here, so that updating them does not
+    build the global stream id or look up the keys.
+    """
     # inputs
     to_in_init = [self.metrics[i] for i in self.inputs_init
                   if i in self.metrics and isinstance(self.metrics[i], MultiCountMetric)]
@@ -275,6 +402,7 @@ class BoltMetrics(ComponentMetrics):
       for metric in to_in_init:
         metric.add_key(stream_id)
         metric.add_key(global_stream_id)
+      self._get_stream_metrics(stream_id, in_stream.stream.component_name)
     # outputs
     to_out_init = [self.metrics[i] for i in self.outputs_init
                    if i in self.metrics and isinstance(self.metrics[i], MultiCountMetric)]
@@ -283,39 +411,85 @@ class BoltMetrics(ComponentMetrics):
       for metric in to_out_init:
         metric.add_key(stream_id)
 
-  def execute_tuple(self, stream_id, source_component, latency_in_ns):
-    """Apply updates to the execute metrics"""
-    self.update_count(self.EXEC_COUNT, key=stream_id)
-    self.update_reduced_metric(self.EXEC_LATENCY, latency_in_ns, stream_id)
-    self.update_count(self.EXEC_TIME_NS, incr_by=latency_in_ns, key=stream_id)
+  def _get_stream_metrics(self, stream_id, source_component):
+    """Returns the metric handles of a given input stream, binding them if not bound yet"""
+    handles = self._stream_metrics.get((stream_id, source_component), None)
+    if handles is None:
+      keys = (stream_id, source_component + "/" + stream_id)
+      metrics = self.metrics
+      handles = BoltStreamMetrics(
+          ack_count=metrics[self.ACK_COUNT].get_counter(*keys),
+          process_latency=metrics[self.PROCESS_LATENCY].get_updater(*keys),
+          process_latency_histogram=metrics[self.PROCESS_LATENCY_HISTOGRAM].get_updater(*keys),
+          fail_count=metrics[self.FAIL_COUNT].get_counter(*keys),
+          fail_latency=metrics[self.FAIL_LATENCY].get_updater(*keys),
+          exec_count=metrics[self.EXEC_COUNT].get_counter(*keys),
+          exec_latency=metrics[self.EXEC_LATENCY].get_updater(*keys),
+          exec_latency_histogram=metrics[self.EXEC_LATENCY_HISTOGRAM].get_updater(*keys),
+          exec_time_ns=metrics[self.EXEC_TIME_NS].get_counter(*keys),
+          deserialization_time_ns=metrics[self.TUPLE_DESERIALIZATION_TIME_NS].get_counter(*keys))
+      self._stream_metrics[(stream_id, source_component)] = handles
+    return handles
+
+  def execute_tuple(self, stream_id, source_component, latency_in_ns, sample_weight=1):
+    """Apply updates to the execute metrics
+
+    :param latency_in_ns: execute latency, or ``None`` if it was not measured for this tuple
+    :param sample_weight: number of tuples represented by this measured one, by which the
+                          latency is scaled when added to the total execute time
+    """
+    handles = self._stream_metrics.get((stream_id, source_component), None) or \
+              self._get_stream_metrics(stream_id, source_component)
+    handles.exec_count.incr()
+    if latency_in_ns is not None:
+      handles.exec_latency.update(latency_in_ns)
+      handles.exec_latency_histogram.update(latency_in_ns)
+      handles.exec_time_ns.incr(latency_in_ns * sample_weight)
+
+  def execute_tuple_batch(self, stream_id, source_component, count, latency_in_ns):
+    """Apply updates to the execute metrics for a batch of ``count`` tuples
+
+    The total latency of the batch is weighted by ``count`` in the execute latency, so that it
+    is reduced to the average latency of a tuple. The execute latency histogram is not updated,
+    as the latency of each tuple is not known.
+    """
+    handles = self._stream_metrics.get((stream_id, source_component), None) or \
+              self._get_stream_metrics(stream_id, source_component)
+    handles.exec_count.incr(count)
+    handles.exec_latency.update_total(latency_in_ns, count)
+    handles.exec_time_ns.incr(latency_in_ns)
 
-    global_stream_id = source_component + "/" + stream_id
-    self.update_count(self.EXEC_COUNT, key=global_stream_id)
-    self.update_reduced_metric(self.EXEC_LATENCY, latency_in_ns, global_stream_id)
-    self.update_count(self.EXEC_TIME_NS, incr_by=latency_in_ns, key=global_stream_id)
+  def deserialize_data_tuple(self, stream_id, source_component, latency_in_ns, sample_weight=1):
+    """Apply updates to the deserialization metrics
 
-  def deserialize_data_tuple(self, stream_id, source_component, latency_in_ns):
-    """Apply updates to the deserialization metrics"""
-    self.update_count(self.TUPLE_DESERIALIZATION_TIME_NS, incr_by=latency_in_ns, key=stream_id)
-    global_stream_id = source_component + "/" + stream_id
-    self.update_count(self.TUPLE_DESERIALIZATION_TIME_NS, incr_by=latency_in_ns,
-                      key=global_stream_id)
+    :param sample_weight: number of tuples represented by this measured one
+    """
+    handles = self._stream_metrics.get((stream_id, source_component), None) or \
+              self._get_stream_metrics(stream_id, source_component)
+    handles.deserialization_time_ns.incr(latency_in_ns * sample_weight)
 
   def acked_tuple(self, stream_id, source_component, latency_in_ns):
-    """Apply updates to the ack metrics"""
-    self.update_count(self.ACK_COUNT, key=stream_id)
-    self.update_reduced_metric(self.PROCESS_LATENCY, latency_in_ns, stream_id)
-    global_stream_id = source_component + '/' + stream_id
-    self.update_count(self.ACK_COUNT, key=global_stream_id)
-    self.update_reduced_metric(self.PROCESS_LATENCY, latency_in_ns, global_stream_id)
+    """Apply updates to the ack metrics
+
+    :param latency_in_ns: process latency, or ``None`` if it was not measured for this tuple
+    """
+    handles = self._stream_metrics.get((stream_id, source_component), None) or \
+              self._get_stream_metrics(stream_id, source_component)
+    handles.ack_count.incr()
+    if latency_in_ns is not None:
+      handles.process_latency.update(latency_in_ns)
+      handles.process_latency_histogram.update(latency_in_ns)
 
   def failed_tuple(self, stream_id, source_component, latency_in_ns):
-    """Apply updates to the fail metrics"""
-    self.update_count(self.FAIL_COUNT, key=stream_id)
-    self.update_reduced_metric(self.FAIL_LATENCY, latency_in_ns, stream_id)
-    global_stream_id = source_component + '/' + stream_id
-    self.update_count(self.FAIL_COUNT, key=global_stream_id)
-    self.update_reduced_metric(self.FAIL_LATENCY, latency_in_ns, global_stream_id)
+    """Apply updates to the fail metrics
+
+    :param latency_in_ns: fail latency, or ``None`` if it was not measured for this tuple
+    """
+    handles = self._stream_metrics.get((stream_id, source_component), None) or \
+              self._get_stream_metrics(stream_id, source_component)
+    handles.fail_count.incr()
+    if latency_in_ns is not None:
+      handles.fail_latency.update(latency_in_ns)
 
 class MetricsCollector(object):
   """Helper class for pushing metrics to Out-Metrics queue"""
@@ -325,6 +499,8 @@ class MetricsCollector(object):
     self.metrics_map = dict()
     # map <time_bucket_sec -> metrics name>
     self.time_bucket_in_sec_to_metrics_name = dict()
+    # map <metrics name -> map <key -> "name/key">>, so that datum names are built only once
+    self._datum_names = dict()
     # out metrics queue
     self.out_metrics = out_metrics
 
@@ -371,10 +547,22 @@ class MetricsCollector(object):
     if metric_value is None:
       return
     elif isinstance(metric_value, dict):
+      datum_names = self._datum_names.get(name, None)
+      if datum_names is None:
+        datum_names = self._datum_names[name] = dict()
       for key, value in metric_value.iteritems():
-        if key is not None and value is not None:
-          self._add_data_to_message(message, name + "/" + str(key), value)
-          self._add_data_to_message(message, "%s/%s" % (name, str(key)), value)
+        if isinstance(value, dict):
+          # statistics of a key, e.g. percentiles of a histogram, as <name>-<statistic>/<key>
+          for stat, stat_value in value.iteritems():
+            datum_name = datum_names.get((stat, key), None)
+            if datum_name is None:
+              datum_name = datum_names[(stat, key)] = "%s-%s/%s" % (name, stat, str(key))
+            self._add_data_to_message(message, datum_name, stat_value)
+        elif key is not None and value is not None:
+          datum_name = datum_names.get(key, None)
+          if datum_name is None:
+            datum_name = datum_names[key] = "%s/%s" % (name, str(key))
+          self._add_data_to_message(message, datum_name, value)
         else:
           Log.info("When gathering metric: %s, <%s:%s> is not a valid key-value to output "
                    "as metric. Skipping...", name, str(key), str(value))
@@ -392,8 +580,6 @@ class MetricsCollector(object):
       to_add.CopyFrom(metric_value)
     else:
       assert metric_value is not None
-      datum = metrics_pb2.MetricDatum()
-      datum.name = metric_name
-      datum.value = str(metric_value)
       to_add = message.metrics.add()
-      to_add.CopyFrom(datum)
+      to_add.name = metric_name
+      to_add.value = str(metric_value)
@@ -1,10 +1,15 @@
 '''common module for miscellaneous classes'''
 __all__ = ['pplan_helper', 'serializer', 'communicator',
-           'outgoing_tuple_helper', 'custom_grouping_helper', 'serializer_helper']
+           'outgoing_tuple_helper', 'custom_grouping_helper', 'serializer_helper',
+           'pending_tuple_table', 'batch_controller']
 
 from .pplan_helper import PhysicalPlanHelper
-from .serializer import PythonSerializer, IHeronSerializer, default_serializer
+from .serializer import (PythonSerializer, IHeronSerializer, HighestProtocolPickleSerializer,
+                         MarshalSerializer, MsgpackSerializer, StructSerializer,
+                         default_serializer)
 from .serializer_helper import SerializerHelper
-from .communicator import HeronCommunicator
+from .communicator import HeronCommunicator, SingleThreadHeronCommunicator, create_communicator
 from .outgoing_tuple_helper import OutgoingTupleHelper
 from .custom_grouping_helper import CustomGroupingHelper, Target
+from .pending_tuple_table import PendingTupleTable
+from .batch_controller import AdaptiveBatchController
@@ -0,0 +1,160 @@
+# Copyright 2016 Twitter. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+'''batch_controller.py: adaptive controller of the batch limits of an instance'''
+from heron.common.src.python.utils.log import Log
+
+import heron.common.src.python.constants as constants
+
+# pylint: disable=too-many-instance-attributes
+class AdaptiveBatchController(object):
+  """Tunes the batch limits of a spout/bolt instance at runtime to meet a latency SLO
+
+  All the limits are the values given in the system config multiplied by a common ``scale``,
+  and time limits never exceed the SLO. If the SLO is not given, the controller is disabled and
+  the limits stay at the system config values.
+
+  ``update()`` is called every ``CONTROL_INTERVAL_SEC`` seconds with the current in/out queue
+  sizes, and adjusts ``scale`` in an AIMD fashion, using the per-batch latencies and the number of
+  times the out queue was full since the previous call:
+
+  1. If a batch took longer than the SLO, the out queue got full, or the out queue grew in
+     each of the last ``OUT_QUEUE_GROWTH_PERIODS`` calls, ``scale`` is multiplied by
+     ``DECREASE_FACTOR``. A single growth is tolerated, as the out queue size fluctuates with
+     the timing of the gateway thread.
+  2. Otherwise, if every batch took less than ``HEADROOM`` of the SLO and tuples are waiting in
+     the in queue, ``scale`` is increased by ``INCREASE_STEP``, so that the backlog is drained
+     with less per-batch overhead.
+  3. Otherwise, ``scale`` moves back toward 1.0 by ``INCREASE_STEP``.
+
+  :ivar enabled: (bool) whether the limits are tuned
+  :ivar scale: (float) current multiplier of the batch limits
+  """
+  CONTROL_INTERVAL_SEC = 1.0
+  MIN_SCALE = 1.0 / 16
+  MAX_SCALE = 16.0
+  DECREASE_FACTOR = 0.5
+  INCREASE_STEP = 0.25
+  HEADROOM = 0.5
+  OUT_QUEUE_GROWTH_PERIODS = 3
+
+  def __init__(self, sys_config, latency_slo_ms=None):
+    """Initializes AdaptiveBatchController
+
+    :param sys_config: system config, from which the initial batch limits are read
+    :param latency_slo_ms: target latency of a batch in ms, or ``None`` to disable the controller
+    """
+    self.enabled = latency_slo_ms is not None and float(latency_slo_ms) > 0
+    self.latency_slo_ms = float(latency_slo_ms) if self.enabled else None
+    self.latency_slo_sec = self.latency_slo_ms * constants.MS_TO_SEC if self.enabled else None
+    self.scale = 1.0
+
+    self._base_emit_batch_time_sec = \
+      float(sys_config[constants.INSTANCE_EMIT_BATCH_TIME_MS]) * constants.MS_TO_SEC
+    self._base_emit_batch_size_bytes = int(sys_config[constants.INSTANCE_EMIT_BATCH_SIZE_BYTES])
+    self._base_execute_batch_time_sec = \
+      float(sys_config[constants.INSTANCE_EXECUTE_BATCH_TIME_MS]) * constants.MS_TO_SEC
+    self._base_execute_batch_size_bytes = \
+      int(sys_config[constants.INSTANCE_EXECUTE_BATCH_SIZE_BYTES])
+    self._base_data_tuple_set_capacity = int(sys_config[constants.INSTANCE_SET_DATA_TUPLE_CAPACITY])
+
+    # observations since the previous update()
+    self._max_batch_latency_sec = 0.0
+    self._out_queue_full_count = 0
+    self._last_out_queue_size = 0
+    # number of consecutive calls of update() in which the out queue grew
+    self._out_queue_growth_count = 0
+
+    self._listeners = []
+    self._apply_scale()
+
+  def add_listener(self, callback):
+    """Registers a callback, called with this controller every time the limits change"""
+    self._listeners.append(callback)
+
+  def record_batch(self, latency_sec):
+    """Records the time taken by one emit/execute batch"""
+    if latency_sec > self._max_batch_latency_sec:
+      self._max_batch_latency_sec = latency_sec
+
+  def record_out_queue_full(self):
+    """Records that a batch was skipped because the out queue was full"""
+    self._out_queue_full_count += 1
+
+  def update(self, in_queue_size, out_queue_size):
+    """Adjusts the batch limits based on the observations since the previous call
+
+    :param in_queue_size: current number of items in the in stream
+    :param out_queue_size: current number of items in the out stream
+    :returns: ``True`` if the limits changed
+    """
+    if not self.enabled:
+      return False
+
+    max_latency = self._max_batch_latency_sec
+    if out_queue_size > self._last_out_queue_size:
+      self._out_queue_growth_count += 1
+    else:
+      self._out_queue_growth_count = 0
+    congested = self._out_queue_full_count > 0 or \
+                self._out_queue_growth_count >= self.OUT_QUEUE_GROWTH_PERIODS
+    self._max_batch_latency_sec = 0.0
+    self._out_queue_full_count = 0
+    self._last_out_queue_size = out_queue_size
+
+    if congested or max_latency > self.latency_slo_sec:
+      new_scale = self.scale * self.DECREASE_FACTOR
+    elif max_latency < self.latency_slo_sec * self.HEADROOM and in_queue_size > 0:
+      new_scale = self.scale + self.INCREASE_STEP
+    elif self.scale < 1.0:
+      new_scale = min(1.0, self.scale + self.INCREASE_STEP)
+    else:
+      new_scale = max(1.0, self.scale - self.INCREASE_STEP)
+    new_scale = min(self.MAX_SCALE, max(self.MIN_SCALE, new_scale))
+
+    if new_scale == self.scale:
+      return False
+
+    Log.debug("Batch limits scaled from %f to %f (max batch latency: %f sec, in: %d, out: %d)",
+              self.scale, new_scale, max_latency, in_queue_size, out_queue_size)
+    self.scale = new_scale
+    self._apply_scale()
+    for callback in self._listeners:
+      callback(self)
+    return True
+
+  def scale_socket_options(self, socket_options):
+    """Returns the given ``SocketOptions`` with the network batch limits scaled"""
+    if not self.enabled:
+      return socket_options
+    slo_ms = self.latency_slo_ms
+    return socket_options._replace(
+        nw_write_batch_size_bytes=self._scale_int(socket_options.nw_write_batch_size_bytes),
+        nw_write_batch_time_ms=min(socket_options.nw_write_batch_time_ms * self.scale, slo_ms),
+        nw_read_batch_size_bytes=self._scale_int(socket_options.nw_read_batch_size_bytes),
+        nw_read_batch_time_ms=min(socket_options.nw_read_batch_time_ms * self.scale, slo_ms))
+
+  def _scale_int(self, value):
+    return max(1, int(value * self.scale))
+
+  def _scale_time(self, value_sec):
+    if self.enabled:
+      return min(value_sec * self.scale, self.latency_slo_sec)
+    return value_sec
+
+  def _apply_scale(self):
+    self.emit_batch_time_sec = self._scale_time(self._base_emit_batch_time_sec)
+    self.emit_batch_size_bytes = self._scale_int(self._base_emit_batch_size_bytes)
+    self.execute_batch_time_sec = self._scale_time(self._base_execute_batch_time_sec)
+    self.execute_batch_size_bytes = self._scale_int(self._base_execute_batch_size_bytes)
+    self.data_tuple_set_capacity = self._scale_int(self._base_data_tuple_set_capacity)
@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 '''communicator.py: module responsible for communication between Python heron modules'''
+import collections
 import sys
 import Queue
 
@@ -84,5 +85,119 @@ class HeronCommunicator(object):
       Log.debug("%s: Full in offer()" % str(self))
       return False
 
+  def drain(self, max_items=None):
+    """Polls up to ``max_items`` items (or all the items if ``None``) from the buffer
+
+    It is a non-blocking operation, and returns an empty list when the buffer is empty
+    """
+    ret = []
+    while max_items is None or len(ret) < max_items:
+      try:
+        ret.append(self._buffer.get(block=False))
+      except Queue.Empty:
+        break
+    if len(ret) > 0 and self._producer_callback is not None:
+      self._producer_callback()
+    return ret
+
+  def offer_many(self, items):
+    """Offers a list of items to the buffer
+
+    :returns: number of items successfully offered
+    """
+    count = 0
+    for item in items:
+      try:
+        self._buffer.put(item, block=False)
+      except Queue.Full:
+        Log.debug("%s: Full in offer_many()" % str(self))
+        break
+      count += 1
+    if count > 0 and self._consumer_callback is not None:
+      self._consumer_callback()
+    return count
+
   def __str__(self):
     return "HeronCommunicator"
+
+class SingleThreadHeronCommunicator(object):
+  """SingleThreadHeronCommunicator: a non-blocking, lock-free queue for a single thread
+
+  It has the same interface as ``HeronCommunicator``, but is backed by ``collections.deque``
+  instead of ``Queue.Queue``, so no lock is taken on any of its methods. Therefore, it must
+  be offered to and polled from the same thread, which is the case for single thread instance.
+  """
+  def __init__(self):
+    self._buffer = collections.deque()
+    self.capacity = sys.maxint
+
+  def register_capacity(self, capacity):
+    """Registers the capacity of this communicator
+
+    By default, the capacity of SingleThreadHeronCommunicator is set to be ``sys.maxint``
+    """
+    self.capacity = capacity
+
+  def get_available_capacity(self):
+    return max(self.capacity - len(self._buffer), 0)
+
+  def get_size(self):
+    """Returns the size of the buffer"""
+    return len(self._buffer)
+
+  def is_empty(self):
+    """Returns whether the buffer is empty"""
+    return len(self._buffer) == 0
+
+  def poll(self):
+    """Poll from the buffer
+
+    It is a non-blocking operation, and when the buffer is empty, it raises Queue.Empty exception
+    """
+    try:
+      return self._buffer.popleft()
+    except IndexError:
+      raise Queue.Empty
+
+  def offer(self, item):
+    """Offer to the buffer
+
+    It is a non-blocking operation, and always succeeds
+    """
+    self._buffer.append(item)
+    return True
+
+  def drain(self, max_items=None):
+    """Polls up to ``max_items`` items (or all the items if ``None``) from the buffer
+
+    It is a non-blocking operation, and returns an empty list when the buffer is empty
+    """
+    if max_items is None or max_items >= len(self._buffer):
+      ret = list(self._buffer)
+      self._buffer.clear()
+      return ret
+    popleft = self._buffer.popleft
+    return [popleft() for _ in xrange(max_items)]
+
+  def offer_many(self, items):
+    """Offers a list of items to the buffer
+
+    :returns: number of items successfully offered
+    """
+    before = len(self._buffer)
+    self._buffer.extend(items)
+    return len(self._buffer) - before
+
+  def __str__(self):
+    return "SingleThreadHeronCommunicator"
+
+def create_communicator(producer_cb=None, consumer_cb=None):
+  """Creates a communicator for passing items between Python heron modules
+
+  When neither a producer nor a consumer callback is given, no other thread needs to be notified
+  of the communicator's events, so a lock-free ``SingleThreadHeronCommunicator`` is returned.
+  Otherwise, a thread-safe ``HeronCommunicator`` is returned.
+  """
+  if producer_cb is None and consumer_cb is None:
+    return SingleThreadHeronCommunicator()
+  return HeronCommunicator(producer_cb=producer_cb, consumer_cb=consumer_cb)
@@ -16,7 +16,7 @@ import sys
 
 from heron.common.src.python.config import system_config
 from heron.common.src.python.utils.log import Log
-from heron.proto import tuple_pb2, topology_pb2
+from heron.proto import tuple_pb2
 
 import heron.common.src.python.constants as constants
 
@@ -34,20 +34,27 @@ class OutgoingTupleHelper(object):
 
   :ivar out_stream: (HeronCommunicator) Out-Stream. Pushed message is an instance of HeronTupleSet
   :ivar pplan_helper: (PhysicalPlanHelper) Physical Plan Helper for this component
-  :ivar current_data_tuple_set: (HeronDataTupleSet) currently buffered data tuple
-  :ivar current_control_tuple_set: (HeronControlTupleSet) currently buffered control tuple
+  :ivar current_data_tuple_set: (HeronDataTupleSet) currently buffered data tuple,
+                                which is the ``data`` field of ``current_data_set_msg``
+  :ivar current_control_tuple_set: (HeronControlTupleSet) currently buffered control tuple,
+                                   which is the ``control`` field of ``current_control_set_msg``
+  :ivar coalesce_control_tuples: (bool) whether acks and fails of the same root are merged
+                                 while they are buffered
   """
-  make_data_tuple_set = lambda _: tuple_pb2.HeronDataTupleSet()
-  make_control_tuple_set = lambda _: tuple_pb2.HeronControlTupleSet()
   make_tuple_set = lambda _: tuple_pb2.HeronTupleSet()
-  make_stream_id = lambda _: topology_pb2.StreamId()
 
-  def __init__(self, pplan_helper, out_stream):
+  def __init__(self, pplan_helper, out_stream, coalesce_control_tuples=False):
     self.out_stream = out_stream
     self.pplan_helper = pplan_helper
 
     self.current_data_tuple_set = None
+    self.current_data_set_msg = None
     self.current_control_tuple_set = None
+    self.current_control_set_msg = None
+
+    self.coalesce_control_tuples = coalesce_control_tuples
+    # map <(taskid, key) of root -> AckTuple in current_control_tuple_set>, used for coalescing
+    self.current_control_tuple_roots = {}
 
     self.current_data_tuple_size_in_bytes = 0
     self.total_data_emitted_in_bytes = 0
@@ -66,23 +73,113 @@ class OutgoingTupleHelper(object):
 
   def add_data_tuple(self, stream_id, new_data_tuple, tuple_size_in_bytes):
     """Add a new data tuple to the currently buffered set of tuples"""
+    added_tuple = self._get_data_tuples(stream_id).add()
+    added_tuple.CopyFrom(new_data_tuple)
+
+    self.current_data_tuple_size_in_bytes += tuple_size_in_bytes
+    self.total_data_emitted_in_bytes += tuple_size_in_bytes
+
+  def add_new_data_tuple(self, stream_id, serialized_values, tuple_size_in_bytes,
+                         roots=None, dest_task_ids=None):
+    """Add a new data tuple, built directly in the currently buffered set of tuples
+
+    :param serialized_values: list of serialized values of the tuple
+    :param tuple_size_in_bytes: total size of the serialized values
+    :param roots: list of (taskid, key) of the roots to which the tuple is anchored
+    :param dest_task_ids: list of destination task ids, for direct emit or custom grouping
+    """
+    added_tuple = self._get_data_tuples(stream_id).add(key=0)
+    if roots:
+      for taskid, key in roots:
+        added_tuple.roots.add(taskid=taskid, key=key)
+    if dest_task_ids:
+      added_tuple.dest_task_ids.extend(dest_task_ids)
+    added_tuple.values.extend(serialized_values)
+
+    self.current_data_tuple_size_in_bytes += tuple_size_in_bytes
+    self.total_data_emitted_in_bytes += tuple_size_in_bytes
+
+  def _get_data_tuples(self, stream_id):
+    """Returns the list of tuples of the data tuple set that new tuples are added to
+
+    A new data tuple set is started if there is none, if the current one is of another stream
+    or if it is full.
+    """
     if (self.current_data_tuple_set is None) or \
         (self.current_data_tuple_set.stream.id != stream_id) or \
         (len(self.current_data_tuple_set.tuples) >= self.data_tuple_set_capacity) or \
         (self.current_data_tuple_size_in_bytes >= self.max_data_tuple_size_in_bytes):
       self._init_new_data_tuple(stream_id)
-
-    added_tuple = self.current_data_tuple_set.tuples.add()
-    added_tuple.CopyFrom(new_data_tuple)
-
-    self.current_data_tuple_size_in_bytes += tuple_size_in_bytes
-    self.total_data_emitted_in_bytes += tuple_size_in_bytes
+    return self.current_data_tuple_set.tuples
 
   def add_control_tuple(self, new_control_tuple, tuple_size_in_bytes, is_ack):
     """Add a new control (Ack/Fail) tuple to the currently buffered set of tuples
 
     :param is_ack: ``True`` if Ack, ``False`` if Fail
     """
+    added_tuple = self._get_control_tuples(is_ack).add()
+    added_tuple.CopyFrom(new_control_tuple)
+
+    self.total_data_emitted_in_bytes += tuple_size_in_bytes
+
+  def add_ack_tuple(self, acked_tuple_id, roots):
+    """Add a new ack tuple, built directly in the currently buffered set of tuples
+
+    :param acked_tuple_id: key of the acked data tuple
+    :param roots: list of RootId to which the acked data tuple is anchored
+    """
+    if self.coalesce_control_tuples:
+      self._coalesce_control_tuple(acked_tuple_id, roots, True)
+    else:
+      self._add_control_tuple(acked_tuple_id, roots, True)
+
+  def add_fail_tuple(self, failed_tuple_id, roots):
+    """Add a new fail tuple, built directly in the currently buffered set of tuples
+
+    :param failed_tuple_id: key of the failed data tuple
+    :param roots: list of RootId to which the failed data tuple is anchored
+    """
+    if self.coalesce_control_tuples:
+      self._coalesce_control_tuple(failed_tuple_id, roots, False)
+    else:
+      self._add_control_tuple(failed_tuple_id, roots, False)
+
+  def _add_control_tuple(self, tuple_id, roots, is_ack):
+    added_tuple = self._get_control_tuples(is_ack).add(ackedtuple=tuple_id)
+    tuple_size_in_bytes = 0
+    for rt in roots:
+      added_tuple.roots.add(taskid=rt.taskid, key=rt.key)
+      tuple_size_in_bytes += root_id_size(rt.taskid)
+
+    self.total_data_emitted_in_bytes += tuple_size_in_bytes
+
+  def _coalesce_control_tuple(self, tuple_id, roots, is_ack):
+    """Merges an ack (or fail) into the buffered one of the same root, one root at a time
+
+    Stream Manager XORs ``ackedtuple`` of an ack into each of its roots, and fails a root on its
+    first fail. So an ack is merged by XOR-ing its tuple id into the buffered ack of the same
+    root, and a fail of a root that already has a buffered fail is dropped.
+    """
+    for rt in roots:
+      control_tuples = self._get_control_tuples(is_ack)
+      root = (rt.taskid, rt.key)
+      buffered_tuple = self.current_control_tuple_roots.get(root, None)
+      if buffered_tuple is not None:
+        if is_ack:
+          buffered_tuple.ackedtuple ^= tuple_id
+        continue
+
+      added_tuple = control_tuples.add(ackedtuple=tuple_id)
+      added_tuple.roots.add(taskid=rt.taskid, key=rt.key)
+      self.current_control_tuple_roots[root] = added_tuple
+      self.total_data_emitted_in_bytes += root_id_size(rt.taskid)
+
+  def _get_control_tuples(self, is_ack):
+    """Returns the list of acks (or fails) of the control tuple set that new tuples are added to
+
+    A new control tuple set is started if there is none, if the current one is of the other kind
+    or if it is full.
+    """
     if self.current_control_tuple_set is None:
       self._init_new_control_tuple()
     elif is_ack and (len(self.current_control_tuple_set.fails) > 0 or
@@ -94,49 +191,56 @@ class OutgoingTupleHelper(object):
       self._init_new_control_tuple()
 
     if is_ack:
-      added_tuple = self.current_control_tuple_set.acks.add()
+      return self.current_control_tuple_set.acks
     else:
-      added_tuple = self.current_control_tuple_set.fails.add()
-
-    added_tuple.CopyFrom(new_control_tuple)
-
-    self.total_data_emitted_in_bytes += tuple_size_in_bytes
+      return self.current_control_tuple_set.fails
 
   def _init_new_data_tuple(self, stream_id):
     self._flush_remaining()
     self.current_data_tuple_size_in_bytes = 0
 
-    new_stream_id = self.make_stream_id()
-    new_stream_id.id = stream_id
-    new_stream_id.component_name = self.pplan_helper.my_component_name
-
-    new_data_tuple_set = self.make_data_tuple_set()
-    new_data_tuple_set.stream.CopyFrom(new_stream_id)
-    self.current_data_tuple_set = new_data_tuple_set
+    # data tuples are added directly to the message to be pushed
+    self.current_data_set_msg = self.make_tuple_set()
+    self.current_data_tuple_set = self.current_data_set_msg.data
+    self.current_data_tuple_set.stream.id = stream_id
+    self.current_data_tuple_set.stream.component_name = self.pplan_helper.my_component_name
 
   def _init_new_control_tuple(self):
     self._flush_remaining()
-    self.current_control_tuple_set = self.make_control_tuple_set()
+    # control tuples are added directly to the message to be pushed
+    self.current_control_set_msg = self.make_tuple_set()
+    self.current_control_tuple_set = self.current_control_set_msg.control
 
   def _flush_remaining(self):
     if self.current_data_tuple_set is not None:
       Log.debug("In flush_remaining() - flush data tuple set")
-      tuple_set = self.make_tuple_set()
-      tuple_set.data.CopyFrom(self.current_data_tuple_set)
-      self._push_tuple_to_stream(tuple_set)
+      self._push_tuple_to_stream(self.current_data_set_msg)
       self.current_data_tuple_set = None
+      self.current_data_set_msg = None
       self.current_data_tuple_size_in_bytes = 0
 
-
     if self.current_control_tuple_set is not None:
       Log.debug("In flush_remaining() - flush control tuple set")
-      tuple_set = self.make_tuple_set()
-      tuple_set.control.CopyFrom(self.current_control_tuple_set)
-      self._push_tuple_to_stream(tuple_set)
+      self._push_tuple_to_stream(self.current_control_set_msg)
       self.current_control_tuple_set = None
+      self.current_control_set_msg = None
+      self.current_control_tuple_roots.clear()
 
   def _push_tuple_to_stream(self, tuple_set):
     self.out_stream.offer(tuple_set)
 
   def is_out_queue_available(self):
     return self.out_stream.get_available_capacity() > 0
+
+def root_id_size(taskid):
+  """Returns the serialized size of a RootId of a given task id, i.e. ``RootId.ByteSize()``"""
+  # tags of taskid and key (1 byte each), and sfixed64 key (8 bytes)
+  size = 10
+  if taskid < 0:
+    # negative int32 is encoded as a 10-byte varint
+    return size + 10
+  while True:
+    size += 1
+    taskid >>= 7
+    if taskid == 0:
+      return size
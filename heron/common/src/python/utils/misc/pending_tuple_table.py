@@ -0,0 +1,140 @@
+# Copyright 2016 Twitter. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+'''pending_tuple_table.py: table of in-flight tuples of a spout'''
+import random
+import time
+from array import array
+
+# 'l' is 64-bit on the platforms supported by Heron (Linux and macOS), and fits the 61-bit keys
+KEY_TYPECODE = 'l'
+
+class PendingTupleTable(object):
+  """Array-backed table of in-flight (pending) tuples of a spout
+
+  Each pending tuple occupies a slot of parallel arrays of insertion times, stream ids and tuple
+  ids. A key is a random number of ``KEY_BITS`` bits, which is mapped to its slot by a dict, so
+  that an ack for a stale key (i.e. whose tuple was already removed) is ignored. Freed slots are
+  reused in LIFO order.
+
+  If ``n_buckets`` is given, keys are also recorded in a timing wheel of ``n_buckets + 1``
+  buckets, and ``expire_bucket()`` needs to be called every ``timeout / n_buckets`` seconds.
+  Each call expires the whole oldest bucket, whose tuples were added between ``timeout`` and
+  ``timeout + timeout / n_buckets`` seconds ago. Keys in a bucket that were already acked are
+  skipped when the bucket is expired.
+  """
+  # root keys are sfixed64, with the last three bits used for type
+  KEY_BITS = 61
+
+  def __init__(self, n_buckets=None):
+    """Initializes PendingTupleTable
+
+    :type n_buckets: int
+    :param n_buckets: number of buckets of the timing wheel, or ``None`` to disable timeouts
+    """
+    # map <key -> slot>
+    self._slots = {}
+    self._insertion_times = array('d')
+    self._stream_ids = []
+    self._tuple_ids = []
+    self._free_slots = array('l')
+
+    if n_buckets is not None:
+      self._wheel = [array(KEY_TYPECODE) for _ in range(int(n_buckets) + 1)]
+    else:
+      self._wheel = None
+    self._current_bucket = 0
+
+  def __len__(self):
+    return len(self._slots)
+
+  @property
+  def capacity(self):
+    """Returns the number of allocated slots"""
+    return len(self._insertion_times)
+
+  def get_occupancy(self):
+    """Returns the fraction of allocated slots that are in use"""
+    if len(self._insertion_times) == 0:
+      return 0.0
+    return float(len(self._slots)) / len(self._insertion_times)
+
+  def add(self, stream_id, tuple_id, insertion_time=None):
+    """Adds a pending tuple and returns its key
+
+    :param stream_id: stream id to which the tuple is emitted
+    :param tuple_id: user-supplied tuple id
+    :param insertion_time: time when the tuple is emitted, or ``None`` to use the current time
+    :returns: (int) key of the tuple, which is used as the key of its root
+    """
+    if insertion_time is None:
+      insertion_time = time.time()
+
+    if len(self._free_slots) > 0:
+      slot = self._free_slots.pop()
+    else:
+      slot = len(self._insertion_times)
+      self._insertion_times.append(0.0)
+      self._stream_ids.append(None)
+      self._tuple_ids.append(None)
+
+    slots = self._slots
+    key = random.getrandbits(self.KEY_BITS)
+    while key == 0 or key in slots:
+      key = random.getrandbits(self.KEY_BITS)
+    slots[key] = slot
+    self._insertion_times[slot] = insertion_time
+    self._stream_ids[slot] = stream_id
+    self._tuple_ids[slot] = tuple_id
+
+    if self._wheel is not None:
+      self._wheel[self._current_bucket].append(key)
+    return key
+
+  def pop(self, key):
+    """Removes a pending tuple of a given key
+
+    :returns: (stream_id, tuple_id, insertion_time), or ``None`` if the key is not pending,
+              e.g. because it was already removed due to timeout
+    """
+    slot = self._slots.pop(key, None)
+    if slot is None:
+      return None
+    return self._free(slot)
+
+  def expire_bucket(self):
+    """Advances the timing wheel and removes the tuples in the oldest bucket
+
+    :returns: list of (stream_id, tuple_id, insertion_time) of the timed out tuples
+    """
+    if self._wheel is None:
+      return []
+
+    self._current_bucket = (self._current_bucket + 1) % len(self._wheel)
+    expired_keys = self._wheel[self._current_bucket]
+    self._wheel[self._current_bucket] = array(KEY_TYPECODE)
+
+    slots = self._slots
+    ret = []
+    for key in expired_keys:
+      slot = slots.pop(key, None)
+      if slot is not None:
+        ret.append(self._free(slot))
+    return ret
+
+  def _free(self, slot):
+    ret = (self._stream_ids[slot], self._tuple_ids[slot], self._insertion_times[slot])
+    self._stream_ids[slot] = None
+    self._tuple_ids[slot] = None
+    self._free_slots.append(slot)
+    return ret
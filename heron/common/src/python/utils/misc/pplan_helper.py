@@ -101,13 +101,29 @@ class PhysicalPlanHelper(object):
     :param tup: tuple that is going to be sent
     """
     # do some checking to make sure that the number of fields match what's expected
+    size = self.get_output_schema_size(stream_id)
+    if size != len(tup):
+      raise RuntimeError("Number of fields emitted in stream %s does not match what's expected. "
+                         "Expected: %s, Observed: %s" % (stream_id, size, len(tup)))
+
+  def get_output_schema_size(self, stream_id):
+    """Returns the number of fields in the output schema of a given stream_id
+
+    :raises RuntimeError: if the stream is not declared in output fields
+    """
     size = self._output_schema.get(stream_id, None)
     if size is None:
       raise RuntimeError("%s emitting to stream %s but was not declared in output fields"
                          % (self.my_component_name, stream_id))
-    elif size != len(tup):
-      raise RuntimeError("Number of fields emitted in stream %s does not match what's expected. "
-                         "Expected: %s, Observed: %s" % (stream_id, size, len(tup)))
+    return size
+
+  def get_output_stream_ids(self):
+    """Returns a list of ids of the declared output streams"""
+    return self._output_schema.keys()
+
+  def has_custom_grouping(self, stream_id):
+    """Returns whether any bolt consumes a given stream_id with custom grouping"""
+    return stream_id in self.custom_grouper.targets
 
   def get_my_spout(self):
     """Returns spout instance, or ``None`` if bolt is assigned"""
@@ -12,6 +12,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 '''serializer.py: common python serializer for heron'''
+import marshal
+import re
+import struct
 from abc import abstractmethod
 
 try:
@@ -19,6 +22,11 @@ try:
 except:
   import pickle
 
+try:
+  import msgpack
+except ImportError:
+  msgpack = None
+
 class IHeronSerializer(object):
   """Serializer interface for Heron"""
   @abstractmethod
@@ -44,6 +52,40 @@ class IHeronSerializer(object):
     """
     pass
 
+  def serialize_values(self, values):
+    """Serialize each field of a tuple
+
+    :param values: list or tuple of fields to be serialized
+    :returns: list of serialized fields as byte strings
+    """
+    serialize = self.serialize
+    return [serialize(obj) for obj in values]
+
+  def deserialize_values(self, input_strs):
+    """Deserialize each field of a tuple
+
+    :param input_strs: list of serialized fields as byte strings
+    :returns: list of deserialized fields
+    """
+    deserialize = self.deserialize
+    return [deserialize(input_str) for input_str in input_strs]
+
+  def serialize_tuple(self, values):
+    """Serialize all the fields of a tuple into one byte string
+
+    :param values: list or tuple of fields to be serialized
+    :returns: Serialized tuple as byte string
+    """
+    return self.serialize(tuple(values))
+
+  def deserialize_tuple(self, input_str):
+    """Deserialize all the fields of a tuple serialized by ``serialize_tuple()``
+
+    :param input_str: Serialized tuple as byte string
+    :returns: list of deserialized fields
+    """
+    return list(self.deserialize(input_str))
+
 class PythonSerializer(IHeronSerializer):
   """Default serializer"""
   def initialize(self, config=None):
@@ -55,4 +97,110 @@ class PythonSerializer(IHeronSerializer):
   def deserialize(self, input_str):
     return pickle.loads(input_str)
 
+class HighestProtocolPickleSerializer(IHeronSerializer):
+  """Serializer using the highest (binary) pickle protocol
+
+  It is faster and more compact than ``PythonSerializer``, which uses the text protocol.
+  """
+  def initialize(self, config=None):
+    pass
+
+  def serialize(self, obj):
+    return pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+
+  def deserialize(self, input_str):
+    return pickle.loads(input_str)
+
+class MarshalSerializer(IHeronSerializer):
+  """Serializer using ``marshal``, for tuples containing only Python's primitive types
+
+  Note that only built-in types such as numbers, strings, lists, tuples and dicts are supported,
+  and the serialized format may change between Python versions.
+  """
+  def initialize(self, config=None):
+    pass
+
+  def serialize(self, obj):
+    return marshal.dumps(obj)
+
+  def deserialize(self, input_str):
+    return marshal.loads(input_str)
+
+class MsgpackSerializer(IHeronSerializer):
+  """Serializer using ``msgpack``, which needs to be installed separately"""
+  def __init__(self):
+    if msgpack is None:
+      raise RuntimeError("msgpack is not installed, so MsgpackSerializer is not available")
+
+  def initialize(self, config=None):
+    pass
+
+  def serialize(self, obj):
+    return msgpack.packb(obj, use_bin_type=True)
+
+  def deserialize(self, input_str):
+    return msgpack.unpackb(input_str, raw=False)
+
+class StructSerializer(IHeronSerializer):
+  """Serializer packing each field with ``struct``, driven by the declared schema of a stream
+
+  The schema is given as a struct format string, which has one format code for each field of the
+  output fields, in order. For example, ``"<q d 16s ?"`` is for (int, float, str, bool) fields.
+  As the format of a field depends on its position in a tuple, ``serialize()`` and
+  ``deserialize()`` take a whole sequence of field values, like ``serialize_tuple()`` does.
+  Note that ``s`` fields come back padded with null bytes up to their declared length, so a
+  ``"5s"`` field serialized from ``"ab"`` is deserialized as ``"ab\\x00\\x00\\x00"``.
+  """
+  BYTE_ORDER_CHARS = "@=<>!"
+  FIELD_FORMAT_PATTERN = re.compile(r"\s*(\d*[cbB?hHiIlLqQfdsp])")
+
+  def __init__(self, schema):
+    byte_order = ""
+    if len(schema) > 0 and schema[0] in self.BYTE_ORDER_CHARS:
+      byte_order, schema = schema[0], schema[1:]
+    field_formats = self.FIELD_FORMAT_PATTERN.findall(schema)
+    if "".join(field_formats) != re.sub(r"\s", "", schema):
+      raise ValueError("Invalid struct schema: %s" % schema)
+    self.structs = [struct.Struct(byte_order + fmt) for fmt in field_formats]
+    self.tuple_struct = struct.Struct(byte_order + "".join(field_formats))
+
+  def initialize(self, config=None):
+    pass
+
+  def serialize(self, obj):
+    """Serializes a sequence of field values, which must match the schema"""
+    return self.serialize_tuple(obj)
+
+  def deserialize(self, input_str):
+    """Deserializes into a list of field values"""
+    return self.deserialize_tuple(input_str)
+
+  def serialize_values(self, values):
+    if len(values) != len(self.structs):
+      raise ValueError("Number of fields does not match the struct schema. Expected: %d, "
+                       "Observed: %d" % (len(self.structs), len(values)))
+    return [st.pack(obj) for st, obj in zip(self.structs, values)]
+
+  def deserialize_values(self, input_strs):
+    return [st.unpack(input_str)[0] for st, input_str in zip(self.structs, input_strs)]
+
+  def serialize_tuple(self, values):
+    if len(values) != len(self.structs):
+      raise ValueError("Number of fields does not match the struct schema. Expected: %d, "
+                       "Observed: %d" % (len(self.structs), len(values)))
+    return self.tuple_struct.pack(*values)
+
+  def deserialize_tuple(self, input_str):
+    return list(self.tuple_struct.unpack(input_str))
+
 default_serializer = PythonSerializer()
+
+# map <name -> serializer class> of built-in serializers, which can be specified by name
+builtin_serializers = {"pickle": PythonSerializer,
+                       "pickle-highest": HighestProtocolPickleSerializer,
+                       "marshal": MarshalSerializer,
+                       "msgpack": MsgpackSerializer,
+                       "struct": StructSerializer}
+
+# names of built-in serializers which take an argument, given as ``<name>:<argument>``
+builtin_serializers_with_arg = frozenset(["struct"])
@@ -14,6 +14,8 @@
 '''serializer_helper.py'''
 
 from heron.common.src.python.utils.misc import PythonSerializer
+from heron.common.src.python.utils.misc.serializer import (builtin_serializers,
+                                                           builtin_serializers_with_arg)
 
 import heron.common.src.python.constants as constants
 import heron.common.src.python.pex_loader as pex_loader
@@ -28,12 +30,60 @@ class SerializerHelper(object):
     if serializer_clsname is None:
       return PythonSerializer()
     else:
-      try:
-        topo_pex_path = context.get_topology_pex_path()
-        pex_loader.load_pex(topo_pex_path)
-        serializer_cls = pex_loader.import_and_get_class(topo_pex_path, serializer_clsname)
-        serializer = serializer_cls()
-        return serializer
-      except Exception as e:
-        raise RuntimeError("Error with loading custom serializer class: %s, with error message: %s"
-                           % (serializer_clsname, e.message))
+      return SerializerHelper._load_serializer_class(context, serializer_clsname)()
+
+  @staticmethod
+  def get_stream_serializers(context):
+    """Returns serializers specified for each stream by ``topology.stream.serializers``
+
+    The config value is a dict <component name -> <stream id -> serializer>>, where serializer is
+    either a name of a built-in serializer (``pickle``, ``pickle-highest``, ``marshal``,
+    ``msgpack`` or ``struct:<struct format of the output fields>``) or a serializer class name.
+    Note that this needs to be specified in the topology-wide config, so that both emitting and
+    receiving components use the same serializer for a stream.
+
+    :returns: dict <component name -> <stream id -> IHeronSerializer object>>
+    """
+    cluster_config = context.get_cluster_config()
+    stream_serializers = cluster_config.get(constants.TOPOLOGY_STREAM_SERIALIZERS, None)
+    if not stream_serializers:
+      return {}
+
+    ret = {}
+    for component_name, streams in stream_serializers.iteritems():
+      ret[component_name] = {}
+      for stream_id, serializer_name in streams.iteritems():
+        serializer = SerializerHelper._create_serializer(context, serializer_name)
+        serializer.initialize(cluster_config)
+        ret[component_name][stream_id] = serializer
+    return ret
+
+  @staticmethod
+  def _create_serializer(context, serializer_name):
+    """Creates a built-in serializer by name, or a custom serializer by class name
+
+    :raises ValueError: if an argument is given to a built-in serializer which takes none, or is
+                        missing for one which needs it
+    """
+    name, _, arg = serializer_name.partition(":")
+    if name not in builtin_serializers:
+      return SerializerHelper._load_serializer_class(context, serializer_name)()
+    elif name in builtin_serializers_with_arg:
+      if not arg:
+        raise ValueError("Serializer %s needs an argument, given as %s:<argument>: %s"
+                         % (name, name, serializer_name))
+      return builtin_serializers[name](arg)
+    else:
+      if arg:
+        raise ValueError("Serializer %s does not take an argument: %s" % (name, serializer_name))
+      return builtin_serializers[name]()
+
+  @staticmethod
+  def _load_serializer_class(context, serializer_clsname):
+    try:
+      topo_pex_path = context.get_topology_pex_path()
+      pex_loader.load_pex(topo_pex_path)
+      return pex_loader.import_and_get_class(topo_pex_path, serializer_clsname)
+    except Exception as e:
+      raise RuntimeError("Error with loading custom serializer class: %s, with error message: %s"
+                         % (serializer_clsname, e.message))
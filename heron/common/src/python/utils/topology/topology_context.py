@@ -297,6 +297,25 @@ class TopologyContext(dict):
       for task_hook in self[self.TASK_HOOKS]:
         task_hook.bolt_execute(bolt_execute_info)
 
+  def invoke_hook_bolt_execute_batch(self, heron_tuples, execute_latency_ns):
+    """invoke task hooks for every time bolt processes a batch of tuples
+
+    Each tuple is reported with the average execute latency of the batch.
+
+    :type heron_tuples: list of HeronTuple
+    :param heron_tuples: tuples that are executed
+    :type execute_latency_ns: float
+    :param execute_latency_ns: execute latency of the whole batch in nano seconds
+    """
+    if self.hook_exists and len(heron_tuples) > 0:
+      execute_latency_ms = execute_latency_ns * constants.NS_TO_MS / len(heron_tuples)
+      for heron_tuple in heron_tuples:
+        bolt_execute_info = BoltExecuteInfo(heron_tuple=heron_tuple,
+                                            executing_task_id=self.task_id,
+                                            execute_latency_ms=execute_latency_ms)
+        for task_hook in self[self.TASK_HOOKS]:
+          task_hook.bolt_execute(bolt_execute_info)
+
   def invoke_hook_bolt_ack(self, heron_tuple, process_latency_ns):
     """invoke task hooks for every time bolt acks a tuple
 
@@ -46,7 +46,8 @@ HeronTuple = namedtuple('Tuple', StreamParseTuple._fields + ('creation_time', 'r
 :type task: int
 :ivar values: the payload of the Tuple where data is stored.
 :type values: tuple or list
-:ivar creation_time: the time the Tuple was created
+:ivar creation_time: the time the Tuple was created, or ``None`` if its latencies are not
+                     measured (see ``topology.latency.sampling.interval``)
 :type creation_time: float
 :ivar roots: a list of RootId (protobuf)
 :type roots: list
@@ -66,19 +67,24 @@ class TupleHelper(object):
   MAX_SFIXED64_RAND_BITS = 61
 
   @staticmethod
-  def make_tuple(stream, tuple_key, values, roots=None):
+  def make_tuple(stream, tuple_key, values, roots=None, creation_time=None, timed=True):
     """Creates a HeronTuple
 
     :param stream: protobuf message ``StreamId``
     :param tuple_key: tuple id
     :param values: a list of values
     :param roots: a list of protobuf message ``RootId``
+    :param creation_time: creation time of the tuple, or ``None`` to use the current time
+    :param timed: if ``False``, creation time is ``None``, i.e. latencies of the tuple are not
+                  measured
     """
     component_name = stream.component_name
     stream_id = stream.id
     gen_task = roots[0].taskid if roots is not None and len(roots) > 0 else None
+    if creation_time is None and timed:
+      creation_time = time.time()
     return HeronTuple(id=str(tuple_key), component=component_name, stream=stream_id,
-                      task=gen_task, values=values, creation_time=time.time(), roots=roots)
+                      task=gen_task, values=values, creation_time=creation_time, roots=roots)
   @staticmethod
   def make_tick_tuple():
     """Creates a TickTuple"""
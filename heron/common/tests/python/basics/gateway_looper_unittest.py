@@ -12,6 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 '''Unittest for GatewayLooper'''
+import asyncore
+import socket
 import threading
 import time
 import unittest2 as unittest
@@ -19,6 +21,23 @@ import unittest2 as unittest
 from heron.common.src.python.basics.gateway_looper import GatewayLooper
 
 # pylint: disable=missing-docstring
+class MockDispatcher(asyncore.dispatcher):
+  def __init__(self, sock, socket_map):
+    asyncore.dispatcher.__init__(self, sock=sock, map=socket_map)
+    self.received = ""
+    self.want_write = False
+    self.write_count = 0
+
+  def handle_read(self):
+    self.received += self.recv(1024)
+
+  def writable(self):
+    return self.want_write
+
+  def handle_write(self):
+    self.write_count += 1
+    self.want_write = False
+
 class GatewayLooperTest(unittest.TestCase):
   def setUp(self):
     pass
@@ -46,3 +65,59 @@ class GatewayLooperTest(unittest.TestCase):
     looper.poll(timeout=poll_timeout)
     end_time = time.time()
     return start_time, end_time
+
+  def test_wakeup_with_select(self):
+    looper = GatewayLooper(socket_map={}, use_epoll=False)
+    waker = threading.Thread(target=self.sleep_and_call_wakeup, args=(0.3, looper))
+    waker.start()
+    start_time = time.time()
+    looper.poll(timeout=30.0)
+    self.assertAlmostEqual(start_time + 0.3, time.time(), delta=0.02)
+
+  def test_wakeup_pipe_drained(self):
+    for use_epoll in (True, False):
+      looper = GatewayLooper(socket_map={}, use_epoll=use_epoll)
+      for _ in range(5):
+        looper.wake_up()
+      looper.poll(timeout=0.0)
+      # all the wakeups were consumed by the previous poll
+      start_time = time.time()
+      looper.poll(timeout=0.2)
+      self.assertAlmostEqual(start_time + 0.2, time.time(), delta=0.05)
+
+  def test_wakeup_after_exit(self):
+    looper = GatewayLooper(socket_map={})
+    looper.exit_loop()
+    looper.loop()
+    # the wake up pipe is closed, and waking up an exited looper is a no-op
+    self.assertIsNone(looper.pipe_w)
+    looper.wake_up()
+    looper.exit_loop()
+
+  def test_dispatch(self):
+    for use_epoll in (True, False):
+      socket_map = {}
+      looper = GatewayLooper(socket_map=socket_map, use_epoll=use_epoll)
+      local, remote = socket.socketpair()
+      dispatcher = MockDispatcher(local, socket_map)
+
+      remote.send("hello")
+      looper.poll(timeout=1.0)
+      self.assertEqual(dispatcher.received, "hello")
+      self.assertEqual(dispatcher.write_count, 0)
+
+      # interest changes on writable()
+      dispatcher.want_write = True
+      looper.poll(timeout=1.0)
+      self.assertEqual(dispatcher.write_count, 1)
+      looper.poll(timeout=0.0)
+      self.assertEqual(dispatcher.write_count, 1)
+
+      remote.send("world")
+      looper.poll(timeout=1.0)
+      self.assertEqual(dispatcher.received, "helloworld")
+
+      dispatcher.close()
+      remote.close()
+      self.assertEqual(len(socket_map), 0)
+      looper.poll(timeout=0.0)
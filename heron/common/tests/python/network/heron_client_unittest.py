@@ -16,7 +16,7 @@
 # pylint: disable=protected-access
 
 import unittest2 as unittest
-from heron.common.src.python.network import StatusCode
+from heron.common.src.python.network import StatusCode, OutgoingPacket, REQID
 import heron.common.tests.python.network.mock_generator as mock_generator
 import heron.common.tests.python.mock_protobuf as mock_protobuf
 
@@ -65,10 +65,60 @@ class ClientTest(unittest.TestCase):
     self.mock_client.dispatcher.prepare_valid_response()
     self.mock_client.handle_read()
     self.assertTrue(self.mock_client.called_handle_packet)
+    self.assertEqual(self.mock_client.total_pkt_received, 4)
+    self.assertEqual(self.mock_client.packet_reader.pending_size, 0)
 
     # header only
+    self.mock_client.called_handle_packet = False
     self.mock_client.dispatcher.prepare_header_only()
     self.mock_client.handle_read()
-    self.assertIsNotNone(self.mock_client.incomplete_pkt)
-    self.assertTrue(self.mock_client.incomplete_pkt.is_header_read)
-    self.assertFalse(self.mock_client.incomplete_pkt.is_complete)
+    self.assertFalse(self.mock_client.called_handle_packet)
+    self.assertEqual(self.mock_client.packet_reader.pending_size, 4)
+
+  def test_handle_read_many_messages(self):
+    pkt_list, msg_list, builder, typename = mock_generator.get_a_mock_message_list_and_builder()
+    self.mock_client.registered_message_map[typename] = builder
+    received = []
+    self.mock_client.on_incoming_message = received.append
+
+    raw = ''.join([pkt.convert_to_raw() for pkt in pkt_list])
+    # packets arrive split at arbitrary points
+    for i in range(0, len(raw), 100):
+      self.mock_client.dispatcher.prepare_with_raw(raw[i:i + 100])
+      self.mock_client.handle_read()
+    self.assertEqual(received, msg_list)
+    self.assertEqual(self.mock_client.packet_reader.pending_size, 0)
+
+  def _queue_mock_packets(self):
+    raw = ""
+    for message in mock_protobuf.get_many_mock_pplans():
+      pkt = OutgoingPacket.create_packet(REQID.generate_zero(), message)
+      raw += pkt.raw
+      self.mock_client._send_packet(pkt)
+    return raw
+
+  def test_handle_write(self):
+    # all the packets are coalesced into one send() call
+    raw = self._queue_mock_packets()
+    self.mock_client.handle_write()
+    self.assertEqual(self.mock_client.dispatcher.sent_data, raw)
+    self.assertEqual(self.mock_client.dispatcher.send_calls, 1)
+    self.assertEqual(len(self.mock_client.out_buffer), 0)
+    self.assertEqual(self.mock_client.total_bytes_written, len(raw))
+    self.assertFalse(self.mock_client.writable())
+
+  def test_handle_write_partial(self):
+    raw = self._queue_mock_packets()
+    num_pkts = len(self.mock_client.out_buffer)
+    self.mock_client.dispatcher.max_send_size = 7
+    self.mock_client.handle_write()
+    # partially sent
+    self.assertEqual(self.mock_client.dispatcher.sent_data, raw[:7])
+    self.assertEqual(self.mock_client.out_buffer[0].offset, 7)
+    self.assertTrue(self.mock_client.writable())
+
+    self.mock_client.dispatcher.max_send_size = None
+    self.mock_client.handle_write()
+    self.assertEqual(self.mock_client.dispatcher.sent_data, raw)
+    self.assertEqual(len(self.mock_client.out_buffer), 0)
+    self.assertEqual(self.mock_client.total_pkt_written, num_pkts)
@@ -97,6 +97,9 @@ class MockDispatcher(object):
     self.to_be_received = ""
     self.eagain_test = False
     self.fatal_error_test = False
+    self.sent_data = ""
+    self.send_calls = 0
+    self.max_send_size = None
 
   def prepare_with_raw(self, raw):
     """the content of ``raw`` will be prepared in the recv buffer"""
@@ -137,9 +140,18 @@ class MockDispatcher(object):
     self.to_be_received = self.to_be_received[numbytes:]
     return ret
 
-  # pylint: disable=no-self-use
+  def recv_into(self, buf):
+    """reads up to ``len(buf)`` bytes from the recv buffer into ``buf``"""
+    data = self.recv(len(buf))
+    buf[:len(data)] = data
+    return len(data)
+
   def send(self, buf):
-    """mock sends the content of a given buffer"""
+    """mock sends the content of a given buffer, up to ``max_send_size`` bytes if specified"""
+    if self.max_send_size is not None:
+      buf = buf[:self.max_send_size]
+    self.sent_data += str(buf) if not isinstance(buf, memoryview) else buf.tobytes()
+    self.send_calls += 1
     return len(buf)
 
 class MockHeronClient(HeronClient):
@@ -167,7 +179,13 @@ class MockHeronClient(HeronClient):
   def recv(self, numbytes):
     return self.dispatcher.recv(numbytes)
 
-  def _handle_packet(self, packet):
+  def recv_into(self, buf):
+    return self.dispatcher.recv_into(buf)
+
+  def send(self, data):
+    return self.dispatcher.send(data)
+
+  def _dispatch_packet(self, typename, reqid, serialized_msg):
     # should only be called when packet is complete
     self.called_handle_packet = True
-    HeronClient._handle_packet(self, packet)
+    HeronClient._dispatch_packet(self, typename, reqid, serialized_msg)
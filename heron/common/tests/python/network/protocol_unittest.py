@@ -14,7 +14,8 @@
 
 # pylint: disable=missing-docstring
 import unittest2 as unittest
-from heron.common.src.python.network import REQID, HeronProtocol, IncomingPacket
+from heron.common.src.python.network import (REQID, HeronProtocol, IncomingPacket, OutgoingPacket,
+                                             PacketReader)
 import heron.common.tests.python.network.mock_generator as mock_generator
 
 class ProtocolTest(unittest.TestCase):
@@ -35,6 +36,21 @@ class ProtocolTest(unittest.TestCase):
     self.assertEqual(packed_zero, bytearray(0 for i in range(32)))
     self.assertTrue(zero_reqid.is_zero())
 
+  def test_reqid_zero_and_hash(self):
+    zero_reqid = REQID.generate_zero()
+    self.assertIs(zero_reqid, REQID.ZERO)
+    self.assertIs(REQID.unpack(bytearray(32)), REQID.ZERO)
+    self.assertIs(REQID.unpack(memoryview(REQID.ZERO.pack())), REQID.ZERO)
+    self.assertEqual(str(zero_reqid), "ZERO")
+
+    reqid = REQID.generate()
+    self.assertEqual(len(reqid.pack()), REQID.REQID_SIZE)
+    unpacked_reqid = REQID.unpack(memoryview(bytearray(reqid.pack())))
+    self.assertEqual(hash(reqid), hash(unpacked_reqid))
+    self.assertFalse(reqid != unpacked_reqid)
+    self.assertNotEqual(reqid, zero_reqid)
+    self.assertEqual({reqid: 1}[unpacked_reqid], 1)
+
   def test_encode_decode_packet(self):
     # get_mock_packets() uses OutgoingPacket.create_packet() to encode
     pkt_list, raw_list = mock_generator.get_mock_requst_packets(is_message=False)
@@ -45,6 +61,20 @@ class ProtocolTest(unittest.TestCase):
       self.assertEqual(typename, raw_message.DESCRIPTOR.full_name)
       self.assertEqual(seriazelid_msg, raw_message.SerializeToString())
 
+  def test_outgoing_packet_send(self):
+    pkt = OutgoingPacket("0123456789")
+    dispatcher = mock_generator.MockDispatcher()
+    dispatcher.max_send_size = 4
+    pkt.send(dispatcher)
+    self.assertEqual(pkt.offset, 4)
+    self.assertEqual(pkt.remaining_size, 6)
+    self.assertFalse(pkt.sent_complete)
+    pkt.send(dispatcher)
+    pkt.send(dispatcher)
+    self.assertTrue(pkt.sent_complete)
+    self.assertEqual(dispatcher.sent_data, "0123456789")
+    self.assertEqual(pkt.advance(3), 0)
+
   def test_fail_decode_packet(self):
     packet = mock_generator.get_fail_packet()
     with self.assertRaises(RuntimeError):
@@ -91,3 +121,39 @@ class ProtocolTest(unittest.TestCase):
       fatal_dispatcher.prepare_fatal()
       pkt = IncomingPacket()
       pkt.read(fatal_dispatcher)
+
+  def test_packet_reader(self):
+    pkt_list, raw_list = mock_generator.get_mock_requst_packets(is_message=False)
+    dispatcher = mock_generator.MockDispatcher()
+    dispatcher.prepare_with_raw(''.join([pkt.convert_to_raw() for pkt in pkt_list]))
+    # small buffer that needs to grow to fit a packet
+    reader = PacketReader(buffer_size=16)
+
+    decoded = []
+    while reader.read(dispatcher) > 0:
+      decoded.extend(reader.decode_packets())
+    self.assertEqual(reader.pending_size, 0)
+    self.assertEqual(len(decoded), len(raw_list))
+    for pkt, raw, (typename, reqid, serialized_msg, pktsize) in zip(pkt_list, raw_list, decoded):
+      raw_reqid, raw_message = raw
+      self.assertEqual(reqid, raw_reqid)
+      self.assertEqual(typename, raw_message.DESCRIPTOR.full_name)
+      self.assertEqual(serialized_msg, raw_message.SerializeToString())
+      self.assertEqual(pktsize, pkt.get_pktsize())
+
+  def test_packet_reader_partial(self):
+    partial_data_dispatcher = mock_generator.MockDispatcher()
+    partial_data_dispatcher.prepare_partial_data()
+    reader = PacketReader()
+    reader.read(partial_data_dispatcher)
+    self.assertEqual(reader.decode_packets(), [])
+    self.assertEqual(reader.pending_size, 4 + partial_data_dispatcher.PARTIAL_DATA_SIZE)
+
+    eagain_dispatcher = mock_generator.MockDispatcher()
+    eagain_dispatcher.prepare_eagain()
+    self.assertEqual(reader.read(eagain_dispatcher), 0)
+
+    with self.assertRaises(RuntimeError):
+      fatal_dispatcher = mock_generator.MockDispatcher()
+      fatal_dispatcher.prepare_fatal()
+      reader.read(fatal_dispatcher)
@@ -0,0 +1,106 @@
+# Copyright 2016 Twitter. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# pylint: disable=missing-docstring
+import unittest
+
+from heron.common.src.python.network.socket_options import SocketOptions
+from heron.common.src.python.utils.misc import AdaptiveBatchController
+
+import heron.common.src.python.constants as constants
+
+class AdaptiveBatchControllerTest(unittest.TestCase):
+  sys_config = {constants.INSTANCE_EMIT_BATCH_TIME_MS: 16,
+                constants.INSTANCE_EMIT_BATCH_SIZE_BYTES: 32768,
+                constants.INSTANCE_EXECUTE_BATCH_TIME_MS: 16,
+                constants.INSTANCE_EXECUTE_BATCH_SIZE_BYTES: 32768,
+                constants.INSTANCE_SET_DATA_TUPLE_CAPACITY: 1024}
+
+  def test_disabled(self):
+    controller = AdaptiveBatchController(self.sys_config)
+    self.assertFalse(controller.enabled)
+    controller.record_batch(10.0)
+    controller.record_out_queue_full()
+    self.assertFalse(controller.update(100, 100))
+    self.assertEqual(controller.emit_batch_time_sec, 0.016)
+    self.assertEqual(controller.execute_batch_size_bytes, 32768)
+    self.assertEqual(controller.data_tuple_set_capacity, 1024)
+
+    options = SocketOptions(1, 2, 3, 4, 5, 6)
+    self.assertIs(controller.scale_socket_options(options), options)
+
+  def test_decrease_on_slo_violation_and_congestion(self):
+    controller = AdaptiveBatchController(self.sys_config, latency_slo_ms=10)
+    self.assertTrue(controller.enabled)
+    # time limits never exceed the SLO
+    self.assertAlmostEqual(controller.emit_batch_time_sec, 0.010)
+    self.assertEqual(controller.emit_batch_size_bytes, 32768)
+
+    called = []
+    controller.add_listener(called.append)
+
+    controller.record_batch(0.020)
+    self.assertTrue(controller.update(0, 0))
+    self.assertEqual(controller.scale, 0.5)
+    self.assertEqual(controller.emit_batch_size_bytes, 16384)
+    self.assertEqual(controller.data_tuple_set_capacity, 512)
+    self.assertEqual(called, [controller])
+
+    controller.record_out_queue_full()
+    controller.update(0, 0)
+    self.assertEqual(controller.scale, 0.25)
+
+    # a single growth of the out queue is tolerated, while a steadily growing one is not
+    controller.update(0, 5)
+    self.assertEqual(controller.scale, 0.5)
+    controller.update(0, 4)
+    controller.update(0, 5)
+    controller.update(0, 6)
+    self.assertEqual(controller.scale, 1.0)
+    controller.update(0, 7)
+    self.assertEqual(controller.scale, 0.5)
+
+    for i in range(10):
+      controller.update(0, 10 + i)
+    self.assertEqual(controller.scale, AdaptiveBatchController.MIN_SCALE)
+
+  def test_increase_on_backlog(self):
+    controller = AdaptiveBatchController(self.sys_config, latency_slo_ms=100)
+    controller.record_batch(0.001)
+    self.assertTrue(controller.update(50, 0))
+    self.assertEqual(controller.scale, 1.25)
+    self.assertEqual(controller.execute_batch_size_bytes, 40960)
+    self.assertAlmostEqual(controller.execute_batch_time_sec, 0.020)
+
+    # no backlog: back to the system config values
+    self.assertTrue(controller.update(0, 0))
+    self.assertEqual(controller.scale, 1.0)
+    self.assertFalse(controller.update(0, 0))
+
+    for _ in range(100):
+      controller.update(50, 0)
+    self.assertEqual(controller.scale, AdaptiveBatchController.MAX_SCALE)
+    self.assertAlmostEqual(controller.execute_batch_time_sec, 0.100)
+
+    # batches taking more than the headroom but within SLO do not grow the limits
+    controller.record_batch(0.080)
+    controller.update(50, 0)
+    self.assertEqual(controller.scale, AdaptiveBatchController.MAX_SCALE - 0.25)
+
+  def test_scale_socket_options(self):
+    controller = AdaptiveBatchController(self.sys_config, latency_slo_ms=20)
+    controller.record_batch(0.030)
+    controller.update(0, 0)
+    options = controller.scale_socket_options(SocketOptions(1000, 16, 2000, 64, 5, 6))
+    self.assertEqual(options, SocketOptions(500, 8, 1000, 20, 5, 6))
@@ -16,7 +16,8 @@
 import Queue
 import unittest
 
-from heron.common.src.python.utils.misc import HeronCommunicator
+from heron.common.src.python.utils.misc import (HeronCommunicator, SingleThreadHeronCommunicator,
+                                                create_communicator)
 import heron.common.tests.python.utils.mock_generator as mock_generator
 
 class CommunicatorTest(unittest.TestCase):
@@ -58,3 +59,50 @@ class CommunicatorTest(unittest.TestCase):
     self.assertEqual(self.global_value, 6)
     communicator.offer("object")
     self.assertEqual(self.global_value, 10)
+
+  def test_drain_and_offer_many(self):
+    communicator = HeronCommunicator(producer_cb=None, consumer_cb=None)
+    self.assertEqual(communicator.offer_many(mock_generator.prim_list),
+                     len(mock_generator.prim_list))
+    self.assertEqual(communicator.drain(2), mock_generator.prim_list[:2])
+    self.assertEqual(communicator.drain(), mock_generator.prim_list[2:])
+    self.assertEqual(communicator.drain(), [])
+
+class SingleThreadCommunicatorTest(unittest.TestCase):
+  def test_generic(self):
+    communicator = SingleThreadHeronCommunicator()
+    for obj in mock_generator.prim_list:
+      communicator.offer(obj)
+    self.assertEqual(communicator.get_size(), len(mock_generator.prim_list))
+
+    for obj in mock_generator.prim_list:
+      self.assertEqual(obj, communicator.poll())
+    self.assertTrue(communicator.is_empty())
+
+  def test_empty(self):
+    communicator = SingleThreadHeronCommunicator()
+    with self.assertRaises(Queue.Empty):
+      communicator.poll()
+
+  def test_capacity(self):
+    communicator = SingleThreadHeronCommunicator()
+    communicator.register_capacity(3)
+    communicator.offer("object")
+    self.assertEqual(communicator.get_available_capacity(), 2)
+    communicator.offer_many(["a", "b", "c"])
+    self.assertEqual(communicator.get_available_capacity(), 0)
+
+  def test_drain_and_offer_many(self):
+    communicator = SingleThreadHeronCommunicator()
+    self.assertEqual(communicator.offer_many(mock_generator.prim_list),
+                     len(mock_generator.prim_list))
+    self.assertEqual(communicator.drain(2), mock_generator.prim_list[:2])
+    self.assertEqual(communicator.get_size(), len(mock_generator.prim_list) - 2)
+    self.assertEqual(communicator.drain(), mock_generator.prim_list[2:])
+    self.assertEqual(communicator.drain(), [])
+    self.assertTrue(communicator.is_empty())
+
+  def test_create_communicator(self):
+    self.assertIsInstance(create_communicator(), SingleThreadHeronCommunicator)
+    self.assertIsInstance(create_communicator(producer_cb=lambda: None), HeronCommunicator)
+    self.assertIsInstance(create_communicator(consumer_cb=lambda: None), HeronCommunicator)
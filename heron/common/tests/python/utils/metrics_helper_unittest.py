@@ -18,7 +18,7 @@ import unittest
 
 from heron.common.src.python.utils.metrics import (CountMetric, MultiCountMetric,
                                                    MeanReducedMetric, MultiMeanReducedMetric,
-                                                   BaseMetricsHelper)
+                                                   MultiHistogramMetric, BaseMetricsHelper)
 from heron.proto import metrics_pb2
 import heron.common.tests.python.utils.mock_generator as mock_generator
 
@@ -116,3 +116,30 @@ class MetricsCollectorTest(unittest.TestCase):
     self.assertEqual(message.metrics[0].name, name)
     self.assertEqual(message.metrics[0].value, str(10))
     self.assertEqual(metric.get_value_and_reset(), 0)
+
+  # pylint: disable=protected-access
+  def test_gather_multi_metrics(self):
+    name = "multi-metric"
+    metric = MultiCountMetric()
+    metric.incr("key1", to_add=3)
+    metric.incr("key2")
+    self.metrics_collector.register_metric(name, metric, 60)
+    self.metrics_collector._gather_metrics(60)
+
+    message = self.metrics_collector.out_metrics.poll()
+    # exactly one datum per key
+    self.assertEqual(sorted((datum.name, datum.value) for datum in message.metrics),
+                     [(name + "/key1", "3"), (name + "/key2", "1")])
+
+  # pylint: disable=protected-access
+  def test_gather_histogram_metrics(self):
+    name = "histogram"
+    metric = MultiHistogramMetric()
+    metric.update("key1", 10)
+    self.metrics_collector.register_metric(name, metric, 60)
+    self.metrics_collector._gather_metrics(60)
+
+    message = self.metrics_collector.out_metrics.poll()
+    self.assertEqual(sorted(datum.name for datum in message.metrics),
+                     [name + "-max/key1", name + "-p50/key1", name + "-p95/key1",
+                      name + "-p99/key1"])
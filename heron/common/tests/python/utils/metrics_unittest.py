@@ -17,7 +17,12 @@
 import unittest
 
 from heron.common.src.python.utils.metrics import (CountMetric, MultiCountMetric,
-                                                   MeanReducedMetric, MultiMeanReducedMetric)
+                                                   MeanReducedMetric, MultiMeanReducedMetric,
+                                                   HistogramMetric, MultiHistogramMetric)
+from heron.common.src.python.utils.metrics.metrics import (get_bucket_index,
+                                                           get_bucket_upper_bound,
+                                                           MAX_HISTOGRAM_VALUE,
+                                                           NUM_HISTOGRAM_BUCKETS, SUB_BUCKETS)
 
 class MetricsTest(unittest.TestCase):
   def test_count_metric(self):
@@ -45,6 +50,20 @@ class MetricsTest(unittest.TestCase):
     self.assertIn("key4", ret)
     self.assertEqual(ret["key4"], 0)
 
+    # a counter stays bound to its key across resets
+    counter = metric.get_counter("key5")
+    counter.incr(3)
+    self.assertEqual(metric.get_value_and_reset()["key5"], 3)
+    counter.incr()
+    self.assertEqual(metric.get_value_and_reset()["key5"], 1)
+
+    # a counter bound to multiple keys increments all of them
+    counter = metric.get_counter("key1", "key6")
+    counter.incr(2)
+    ret = metric.get_value_and_reset()
+    self.assertEqual(ret["key1"], 2)
+    self.assertEqual(ret["key6"], 2)
+
   def test_mean_reduced_metric(self):
     metric = MeanReducedMetric()
     # update from 1 to 10
@@ -71,3 +90,76 @@ class MetricsTest(unittest.TestCase):
     ret = metric.get_value_and_reset()
     self.assertIn("key4", ret)
     self.assertIsNone(ret["key4"])
+
+    # an updater stays bound to its keys across resets
+    updater = metric.get_updater("key1", "key5")
+    updater.update(2)
+    updater.update(4)
+    ret = metric.get_value_and_reset()
+    self.assertEqual(ret["key1"], 3)
+    self.assertEqual(ret["key5"], 3)
+    updater.update(1)
+    self.assertEqual(metric.get_value_and_reset()["key5"], 1)
+
+    # a total is weighted by the number of values it sums up
+    updater.update(10)
+    updater.update_total(20, 4)
+    self.assertEqual(metric.get_value_and_reset()["key1"], 6)
+
+  def test_histogram_buckets(self):
+    # buckets are contiguous, and narrower than 1 / SUB_BUCKETS of their values
+    previous_upper_bound = -1
+    for index in range(NUM_HISTOGRAM_BUCKETS):
+      upper_bound = get_bucket_upper_bound(index)
+      lower_bound = previous_upper_bound + 1
+      self.assertEqual(get_bucket_index(lower_bound), index)
+      self.assertEqual(get_bucket_index(upper_bound), index)
+      self.assertLessEqual(upper_bound - lower_bound, lower_bound / SUB_BUCKETS)
+      previous_upper_bound = upper_bound
+    self.assertEqual(previous_upper_bound, MAX_HISTOGRAM_VALUE)
+
+  def test_histogram_metric(self):
+    metric = HistogramMetric()
+    for i in range(1, 1001):
+      metric.update(i * 1000)
+    ret = metric.get_value_and_reset()
+    self.assertEqual(sorted(ret.keys()), ["max", "p50", "p95", "p99"])
+    for name, expected in [("p50", 500000), ("p95", 950000), ("p99", 990000)]:
+      self.assertGreaterEqual(ret[name], expected)
+      self.assertLessEqual(ret[name], expected * (1 + 1.0 / SUB_BUCKETS))
+    self.assertEqual(ret["max"], 1000000)
+    self.assertIsNone(metric.get_value_and_reset())
+
+    # out of range values are clamped
+    metric.update(-1)
+    metric.update(1 << 70)
+    ret = metric.get_value_and_reset()
+    self.assertEqual(ret["p50"], 0)
+    self.assertEqual(ret["max"], MAX_HISTOGRAM_VALUE)
+
+  def test_histogram_merge(self):
+    metric1 = HistogramMetric()
+    metric2 = HistogramMetric()
+    for i in range(100):
+      metric1.update(i)
+      metric2.update(i + 100)
+    metric1.merge(metric2)
+    ret = metric1.get_value_and_reset()
+    self.assertEqual(ret["max"], 199)
+    self.assertGreaterEqual(ret["p50"], 99)
+    self.assertLessEqual(ret["p50"], 99 * (1 + 1.0 / SUB_BUCKETS))
+
+  def test_multi_histogram_metric(self):
+    metric = MultiHistogramMetric()
+    metric.add_key("key1")
+    updater = metric.get_updater("key2", "key3")
+    metric.update("key1", 10)
+    updater.update(20)
+    self.assertEqual(metric.get_value_and_reset(),
+                     {"key1": {"p50": 10, "p95": 10, "p99": 10, "max": 10},
+                      "key2": {"p50": 20, "p95": 20, "p99": 20, "max": 20},
+                      "key3": {"p50": 20, "p95": 20, "p99": 20, "max": 20}})
+    # keys without values are omitted, and an updater stays bound across resets
+    self.assertEqual(metric.get_value_and_reset(), {})
+    updater.update(30)
+    self.assertEqual(sorted(metric.get_value_and_reset().keys()), ["key2", "key3"])
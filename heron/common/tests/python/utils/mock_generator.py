@@ -103,7 +103,7 @@ def make_data_tuple_from_list(lst, serializer=PythonSerializer()):
 class MockOutgoingTupleHelper(OutgoingTupleHelper):
   """Creates a mock OutgoingTupleHelper class, for unittesting"""
   SAMPLE_SUCCESS = 0
-  def __init__(self, mode=SAMPLE_SUCCESS):
+  def __init__(self, mode=SAMPLE_SUCCESS, coalesce_control_tuples=False):
     self.called_init_new_data = False
     self.called_init_new_control = False
     sample_sys_config = {constants.INSTANCE_SET_DATA_TUPLE_CAPACITY: 1000,
@@ -114,7 +114,8 @@ class MockOutgoingTupleHelper(OutgoingTupleHelper):
       pplan_helper, out_stream = self._prepare_sample_success()
       with patch("heron.common.src.python.config.system_config.get_sys_config",
                  side_effect=lambda: sample_sys_config):
-        super(MockOutgoingTupleHelper, self).__init__(pplan_helper, out_stream)
+        super(MockOutgoingTupleHelper, self).__init__(pplan_helper, out_stream,
+                                                      coalesce_control_tuples)
 
   @staticmethod
   def _prepare_sample_success():
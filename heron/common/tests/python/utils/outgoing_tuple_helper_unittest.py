@@ -15,6 +15,9 @@
 # pylint: disable=missing-docstring
 import unittest
 
+from heron.common.src.python.utils.misc.outgoing_tuple_helper import root_id_size
+from heron.proto import tuple_pb2
+
 import heron.common.tests.python.utils.mock_generator as mock_generator
 
 class OutgoingTupleHelperTest(unittest.TestCase):
@@ -44,3 +47,105 @@ class OutgoingTupleHelperTest(unittest.TestCase):
     sent_data_tuple_set = out_helper.out_stream.poll().data
     self.assertEqual(sent_data_tuple_set.stream.id, self.DEFAULT_STREAM_ID)
     self.assertEqual(sent_data_tuple_set.tuples[0], prim_data_tuple)
+
+  def test_add_new_data_tuple(self):
+    out_helper = mock_generator.MockOutgoingTupleHelper()
+    prim_data_tuple, size = mock_generator.make_data_tuple_from_list(mock_generator.prim_list)
+
+    out_helper.add_new_data_tuple(self.DEFAULT_STREAM_ID, list(prim_data_tuple.values), size)
+    out_helper.add_new_data_tuple(self.DEFAULT_STREAM_ID, ["value"], 5,
+                                  roots=[(1, 10)], dest_task_ids=[3, 4])
+    self.assertEqual(out_helper.current_data_tuple_size_in_bytes, size + 5)
+    # a new stream starts a new data tuple set
+    out_helper.add_new_data_tuple("another_stream", ["value"], 5)
+    out_helper.send_out_tuples()
+    self.assertIsNone(out_helper.current_data_tuple_set)
+    self.assertEqual(out_helper.total_data_emitted_in_bytes, size + 10)
+
+    sent_data_tuple_set = out_helper.out_stream.poll().data
+    self.assertEqual(sent_data_tuple_set.stream.id, self.DEFAULT_STREAM_ID)
+    self.assertEqual(sent_data_tuple_set.stream.component_name,
+                     out_helper.pplan_helper.my_component_name)
+    self.assertEqual(sent_data_tuple_set.tuples[0], prim_data_tuple)
+    anchored = sent_data_tuple_set.tuples[1]
+    self.assertEqual(anchored.key, 0)
+    self.assertEqual(list(anchored.values), ["value"])
+    self.assertEqual(list(anchored.dest_task_ids), [3, 4])
+    self.assertEqual(list(anchored.roots), self.make_roots((1, 10)))
+
+    self.assertEqual(out_helper.out_stream.poll().data.stream.id, "another_stream")
+
+  @staticmethod
+  def make_roots(*task_and_keys):
+    roots = []
+    for taskid, key in task_and_keys:
+      root = tuple_pb2.RootId()
+      root.taskid = taskid
+      root.key = key
+      roots.append(root)
+    return roots
+
+  def test_add_ack_and_fail_tuple(self):
+    out_helper = mock_generator.MockOutgoingTupleHelper()
+    roots = self.make_roots((1, 10), (2, -20))
+
+    out_helper.add_ack_tuple(100, roots)
+    out_helper.add_ack_tuple(200, roots[:1])
+    self.assertTrue(out_helper.called_init_new_control)
+    self.assertEqual(out_helper.total_data_emitted_in_bytes,
+                     2 * roots[0].ByteSize() + roots[1].ByteSize())
+
+    # a fail starts a new control tuple set
+    out_helper.add_fail_tuple(300, roots[1:])
+    out_helper.send_out_tuples()
+    self.assertIsNone(out_helper.current_control_tuple_set)
+
+    acks = out_helper.out_stream.poll().control.acks
+    self.assertEqual(len(acks), 2)
+    self.assertEqual(acks[0].ackedtuple, 100)
+    self.assertEqual(list(acks[0].roots), roots)
+    self.assertEqual(acks[1].ackedtuple, 200)
+    self.assertEqual(list(acks[1].roots), roots[:1])
+
+    sent = out_helper.out_stream.poll().control
+    self.assertEqual(len(sent.acks), 0)
+    self.assertEqual(len(sent.fails), 1)
+    self.assertEqual(sent.fails[0].ackedtuple, 300)
+    self.assertEqual(list(sent.fails[0].roots), roots[1:])
+
+  def test_coalesce_control_tuples(self):
+    out_helper = mock_generator.MockOutgoingTupleHelper(coalesce_control_tuples=True)
+    roots = self.make_roots((1, 10), (1, 11))
+
+    out_helper.add_ack_tuple(0b0011, roots)
+    out_helper.add_ack_tuple(0b0101, roots[:1])
+    out_helper.add_ack_tuple(-1, roots[1:])
+    out_helper.send_out_tuples()
+
+    # one ack per root, whose tuple id is XOR of all the acked tuple ids of the root
+    acks = out_helper.out_stream.poll().control.acks
+    self.assertEqual(len(acks), 2)
+    self.assertEqual(list(acks[0].roots), roots[:1])
+    self.assertEqual(acks[0].ackedtuple, 0b0110)
+    self.assertEqual(list(acks[1].roots), roots[1:])
+    self.assertEqual(acks[1].ackedtuple, 0b0011 ^ -1)
+
+    # duplicate fails of a root are dropped
+    out_helper.add_fail_tuple(1, roots[:1])
+    out_helper.add_fail_tuple(2, roots)
+    out_helper.send_out_tuples()
+    fails = out_helper.out_stream.poll().control.fails
+    self.assertEqual(len(fails), 2)
+    self.assertEqual(fails[0].ackedtuple, 1)
+    self.assertEqual(list(fails[0].roots), roots[:1])
+    self.assertEqual(list(fails[1].roots), roots[1:])
+
+    # coalescing does not go beyond a flush
+    out_helper.add_fail_tuple(1, roots[:1])
+    out_helper.send_out_tuples()
+    self.assertEqual(len(out_helper.out_stream.poll().control.fails), 1)
+
+  def test_root_id_size(self):
+    for taskid in (0, 1, 127, 128, 16383, 16384, 2 ** 31 - 1, -1, -2 ** 31):
+      root = self.make_roots((taskid, -1))[0]
+      self.assertEqual(root_id_size(taskid), root.ByteSize())
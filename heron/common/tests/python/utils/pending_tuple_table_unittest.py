@@ -0,0 +1,79 @@
+# Copyright 2016 Twitter. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# pylint: disable=missing-docstring
+import unittest
+
+from heron.common.src.python.utils.misc import PendingTupleTable
+
+class PendingTupleTableTest(unittest.TestCase):
+  def test_add_and_pop(self):
+    table = PendingTupleTable()
+    keys = [table.add("stream", "id%d" % i, insertion_time=float(i)) for i in range(10)]
+    self.assertEqual(len(table), 10)
+    self.assertEqual(table.capacity, 10)
+    self.assertEqual(len(set(keys)), 10)
+    for key in keys:
+      self.assertLess(key, 1 << PendingTupleTable.KEY_BITS)
+      self.assertNotEqual(key, 0)
+
+    self.assertEqual(table.pop(keys[3]), ("stream", "id3", 3.0))
+    self.assertIsNone(table.pop(keys[3]))
+    self.assertEqual(len(table), 9)
+    self.assertAlmostEqual(table.get_occupancy(), 0.9)
+
+    # freed slot is reused, and the stale key is not valid anymore
+    new_key = table.add("stream", "new")
+    self.assertEqual(table.capacity, 10)
+    self.assertNotEqual(new_key, keys[3])
+    self.assertIsNone(table.pop(keys[3]))
+    self.assertEqual(table.pop(new_key)[1], "new")
+
+    # key that was never added
+    self.assertIsNone(table.pop(12345))
+
+  def test_key_bits(self):
+    table = PendingTupleTable()
+    keys = [table.add("stream", i) for i in range(100)]
+    # keys use all of the random bits, regardless of their slots
+    self.assertGreaterEqual(max(keys), 1 << (PendingTupleTable.KEY_BITS - 4))
+    self.assertTrue(all(0 < key < 1 << PendingTupleTable.KEY_BITS for key in keys))
+
+  def test_timing_wheel(self):
+    n_buckets = 3
+    table = PendingTupleTable(n_buckets=n_buckets)
+    first = [table.add("stream", i) for i in range(5)]
+    table.expire_bucket()
+    second = [table.add("stream", i) for i in range(5, 10)]
+    table.pop(first[0])
+
+    # first bucket expires after n_buckets + 1 ticks
+    for _ in range(n_buckets - 1):
+      self.assertEqual(table.expire_bucket(), [])
+    expired = table.expire_bucket()
+    self.assertEqual([tuple_id for _, tuple_id, _ in expired], [1, 2, 3, 4])
+    self.assertEqual(len(table), 5)
+
+    expired = table.expire_bucket()
+    self.assertEqual([tuple_id for _, tuple_id, _ in expired], range(5, 10))
+    self.assertEqual(len(table), 0)
+    for key in second:
+      self.assertIsNone(table.pop(key))
+
+  def test_no_timeout(self):
+    table = PendingTupleTable(n_buckets=None)
+    table.add("stream", "id")
+    for _ in range(10):
+      self.assertEqual(table.expire_bucket(), [])
+    self.assertEqual(len(table), 1)
@@ -41,6 +41,26 @@ class PhysicalPlanHelperTest(unittest.TestCase):
     self.assertEqual(instance_1["task_id"], pplan_helper.my_task_id)
     self.assertEqual(instance_1["comp_name"], pplan_helper.my_component_name)
 
+  def test_output_schema(self):
+    pplan, instances = mock_generator.get_a_sample_pplan()
+    out_stream = pplan.topology.spouts[0].outputs.add()
+    out_stream.stream.CopyFrom(mock_protobuf.get_mock_stream_id(id="stream",
+                                                                component_name="spout1"))
+    for key in ("a", "b"):
+      added = out_stream.schema.keys.add()
+      added.key = key
+      added.type = topology_pb2.Type.Value("OBJECT")
+    pplan_helper = PhysicalPlanHelper(pplan, instances[0]["instance_id"], "topology.pex.path")
+
+    self.assertEqual(pplan_helper.get_output_stream_ids(), ["stream"])
+    self.assertEqual(pplan_helper.get_output_schema_size("stream"), 2)
+    self.assertFalse(pplan_helper.has_custom_grouping("stream"))
+    pplan_helper.check_output_schema("stream", ("a", "b"))
+    with self.assertRaises(RuntimeError):
+      pplan_helper.check_output_schema("stream", ("a",))
+    with self.assertRaises(RuntimeError):
+      pplan_helper.get_output_schema_size("undeclared")
+
   # pylint: disable=protected-access
   def test_number_autotype(self):
     # testing _is_number() and _get_number()
@@ -16,7 +16,10 @@
 
 import unittest
 
-from heron.common.src.python.utils.misc import PythonSerializer
+from heron.common.src.python.utils.misc import (PythonSerializer, HighestProtocolPickleSerializer,
+                                                MarshalSerializer, StructSerializer,
+                                                SerializerHelper)
+import heron.common.src.python.constants as constants
 import heron.common.tests.python.utils.mock_generator as mock_generator
 
 class SerializerTest(unittest.TestCase):
@@ -32,3 +35,71 @@ class SerializerTest(unittest.TestCase):
       self.assertIsInstance(serialized, str)
       deserialized = serializer.deserialize(serialized)
       self.assertEqual(deserialized, obj)
+
+  def test_fast_serializers(self):
+    for serializer in [HighestProtocolPickleSerializer(), MarshalSerializer()]:
+      serializer.initialize()
+      for obj in mock_generator.prim_list:
+        serialized = serializer.serialize(obj)
+        self.assertIsInstance(serialized, str)
+        self.assertEqual(serializer.deserialize(serialized), obj)
+      serialized_values = serializer.serialize_values(mock_generator.prim_list)
+      self.assertEqual(serializer.deserialize_values(serialized_values), mock_generator.prim_list)
+
+  def test_serialize_tuple(self):
+    for serializer in [PythonSerializer(), HighestProtocolPickleSerializer(), MarshalSerializer()]:
+      serialized = serializer.serialize_tuple(mock_generator.prim_list)
+      self.assertIsInstance(serialized, str)
+      self.assertEqual(serializer.deserialize_tuple(serialized), mock_generator.prim_list)
+      self.assertEqual(serializer.deserialize_tuple(serializer.serialize_tuple(())), [])
+
+  def test_struct_serializer(self):
+    serializer = StructSerializer("!q d 5s ?")
+    values = (-12345678901, 0.5, "abcde", True)
+    serialized_values = serializer.serialize_values(values)
+    self.assertEqual(len(serialized_values), len(values))
+    self.assertEqual(len(serialized_values[0]), 8)
+    self.assertEqual(serializer.deserialize_values(serialized_values), list(values))
+
+    serialized = serializer.serialize_tuple(values)
+    self.assertEqual(len(serialized), 8 + 8 + 5 + 1)
+    self.assertEqual(serializer.deserialize_tuple(serialized), list(values))
+    self.assertEqual(serializer.deserialize(serializer.serialize(values)), list(values))
+
+    # s fields are null-padded
+    self.assertEqual(serializer.deserialize(serializer.serialize((1, 0.5, "ab", False)))[2],
+                     "ab\x00\x00\x00")
+
+    with self.assertRaises(ValueError):
+      serializer.serialize((1, 0.5))
+    with self.assertRaises(ValueError):
+      serializer.serialize_values((1, 0.5))
+    with self.assertRaises(ValueError):
+      serializer.serialize_tuple((1, 0.5))
+    with self.assertRaises(ValueError):
+      StructSerializer("q z")
+
+  def test_get_stream_serializers(self):
+    class MockContext(object):
+      def __init__(self, config):
+        self.config = config
+
+      def get_cluster_config(self):
+        return self.config
+
+    self.assertEqual(SerializerHelper.get_stream_serializers(MockContext({})), {})
+
+    config = {constants.TOPOLOGY_STREAM_SERIALIZERS: {"spout": {"default": "marshal",
+                                                                "stream": "struct:qd"},
+                                                      "bolt": {"default": "pickle-highest"}}}
+    serializers = SerializerHelper.get_stream_serializers(MockContext(config))
+    self.assertIsInstance(serializers["spout"]["default"], MarshalSerializer)
+    self.assertIsInstance(serializers["spout"]["stream"], StructSerializer)
+    self.assertEqual(len(serializers["spout"]["stream"].structs), 2)
+    self.assertIsInstance(serializers["bolt"]["default"], HighestProtocolPickleSerializer)
+
+    # a built-in serializer given an argument it does not take, or missing the one it needs
+    for serializer_name in ["pickle:foo", "struct", "struct:"]:
+      config = {constants.TOPOLOGY_STREAM_SERIALIZERS: {"spout": {"default": serializer_name}}}
+      with self.assertRaisesRegexp(ValueError, serializer_name):
+        SerializerHelper.get_stream_serializers(MockContext(config))
@@ -45,6 +45,10 @@ class TopologyContextTest(unittest.TestCase):
     self.context.invoke_hook_bolt_execute(None, 0.1)
     self.assertTrue(task_hook.bolt_exec_called)
 
+    task_hook.bolt_exec_called = False
+    self.context.invoke_hook_bolt_execute_batch([None, None], 0.2)
+    self.assertTrue(task_hook.bolt_exec_called)
+
     self.context.invoke_hook_bolt_ack(None, 0.1)
     self.assertTrue(task_hook.bolt_ack_called)
 
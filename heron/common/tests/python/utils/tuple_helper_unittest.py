@@ -37,6 +37,14 @@ class TupleHelperTest(unittest.TestCase):
     self.assertAlmostEqual(tup.creation_time, time.time(), delta=0.01)
     self.assertIsNone(tup.roots)
 
+    # Explicit creation time
+    tup = TupleHelper.make_tuple(STREAM, TUPLE_KEY, VALUES, creation_time=12345.0)
+    self.assertEqual(tup.creation_time, 12345.0)
+
+    # Latencies not measured
+    tup = TupleHelper.make_tuple(STREAM, TUPLE_KEY, VALUES, timed=False)
+    self.assertIsNone(tup.creation_time)
+
   def test_tick_tuple(self):
     tup = TupleHelper.make_tick_tuple()
     self.assertEqual(tup.id, "__tick")
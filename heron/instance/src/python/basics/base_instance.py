@@ -14,15 +14,91 @@
 '''base_instance.py: module for base component (base for spout/bolt) and its spec'''
 
 import logging
+import random
+import time
 import traceback
 from abc import abstractmethod
 
 from heron.common.src.python.config import system_config
-from heron.common.src.python.utils.misc import OutgoingTupleHelper
+from heron.common.src.python.utils.log import Log
+from heron.common.src.python.utils.misc import OutgoingTupleHelper, AdaptiveBatchController
 from heron.proto import tuple_pb2
 
+import heron.common.src.python.constants as constants
 import heron.common.src.python.pex_loader as pex_loader
 
+class LatencySampler(object):
+  """Chooses the tuples whose latencies are measured, 1 in ``interval`` on average
+
+  Gaps between measured tuples are random, so that periodic patterns in the tuples do not bias
+  the measured latencies.
+  """
+  __slots__ = ('interval', '_countdown')
+
+  def __init__(self, interval):
+    self.interval = interval
+    self._countdown = 1
+
+  def sample(self):
+    """Returns the weight of the current tuple, i.e. the number of tuples represented by it if
+    its latencies are to be measured, or 0 if not
+
+    Total times (e.g. execute time) are scaled by the weight.
+    """
+    if self.interval == 1:
+      return 1
+    self._countdown -= 1
+    if self._countdown > 0:
+      return 0
+    self._countdown = random.randint(1, 2 * self.interval - 1)
+    return self.interval
+
+class EmitPlan(object):
+  """Per-stream plan for ``emit()``, precomputed when the instance starts
+
+  :ivar schema_size: number of fields in the output schema of the stream
+  :ivar has_custom_grouping: whether any bolt consumes the stream with custom grouping
+  :ivar serializer: serializer used for the stream
+  :ivar whole_tuple: whether all the fields of a tuple are serialized as a single value
+  :ivar emit_counter: CountMetric of emit count for the stream
+  :ivar serialization_time_counter: CountMetric of serialization time for the stream
+  :ivar serialization_sampler: LatencySampler choosing the tuples whose serialization is timed
+  """
+  __slots__ = ('schema_size', 'has_custom_grouping', 'serializer', 'whole_tuple',
+               'emit_counter', 'serialization_time_counter', 'serialization_sampler')
+
+  # pylint: disable=too-many-arguments
+  def __init__(self, schema_size, has_custom_grouping, serializer, whole_tuple,
+               emit_counter, serialization_time_counter, serialization_sampler):
+    self.schema_size = schema_size
+    self.has_custom_grouping = has_custom_grouping
+    self.serializer = serializer
+    self.whole_tuple = whole_tuple
+    self.emit_counter = emit_counter
+    self.serialization_time_counter = serialization_time_counter
+    self.serialization_sampler = serialization_sampler
+
+  def serialize(self, tup):
+    """Returns the serialized values of a tuple emitted to the stream
+
+    Serialization is timed only for the tuples chosen by ``serialization_sampler``.
+    """
+    sample_weight = self.serialization_sampler.sample()
+    if sample_weight:
+      start_time = time.time()
+
+    if self.whole_tuple:
+      # all the fields as one value; a tuple with one field is the same in either way
+      serialized_values = [self.serializer.serialize_tuple(tup)]
+    else:
+      serialized_values = self.serializer.serialize_values(tup)
+
+    if sample_weight:
+      self.serialization_time_counter.incr(
+          (time.time() - start_time) * constants.SEC_TO_NS * sample_weight)
+    return serialized_values
+
+# pylint: disable=too-many-instance-attributes
 class BaseInstance(object):
   """The base class for heron bolt/spout instance
 
@@ -34,15 +110,25 @@ class BaseInstance(object):
   :ivar in_stream:    In-Stream Heron Communicator
   :ivar output_helper: Outgoing Tuple Helper
   :ivar serializer: Implementation of Heron Serializer
+  :ivar emit_plans: map <stream id -> EmitPlan>
+  :ivar batch_controller: AdaptiveBatchController, holding the current batch limits
   """
   make_data_tuple = lambda _: tuple_pb2.HeronDataTuple()
 
   def __init__(self, pplan_helper, in_stream, out_stream, looper):
     self.pplan_helper = pplan_helper
     self.in_stream = in_stream
-    self.output_helper = OutgoingTupleHelper(self.pplan_helper, out_stream)
+    cluster_config = pplan_helper.context.get_cluster_config()
+    coalesce_acks = cluster_config.get(constants.TOPOLOGY_ACK_COALESCING, False)
+    self.output_helper = OutgoingTupleHelper(self.pplan_helper, out_stream,
+                                             coalesce_control_tuples=coalesce_acks)
     self.looper = looper
     self.sys_config = system_config.get_sys_config()
+    self.emit_plans = {}
+
+    # batch limits, tuned at runtime if a latency SLO is given
+    self.batch_controller = AdaptiveBatchController(
+        self.sys_config, cluster_config.get(constants.TOPOLOGY_ADAPTIVE_BATCHING_LATENCY_SLO_MS))
 
     # will set a root logger here
     self.logger = logging.getLogger()
@@ -80,6 +166,67 @@ class BaseInstance(object):
   def admit_control_tuple(self, control_tuple, tuple_size_in_bytes, is_ack):
     self.output_helper.add_control_tuple(control_tuple, tuple_size_in_bytes, is_ack)
 
+  def make_latency_sampler(self):
+    """Returns a LatencySampler, which should be made after the spout/bolt is initialized
+
+    Every tuple is measured if task hooks are registered, as hooks take the latency of every
+    tuple.
+    """
+    context = self.pplan_helper.context
+    if context.hook_exists:
+      return LatencySampler(1)
+    # latencies are measured for 1 in interval tuples
+    interval = context.get_cluster_config().get(constants.TOPOLOGY_LATENCY_SAMPLING_INTERVAL, 1)
+    return LatencySampler(max(1, int(interval)))
+
+  def start_batch_control(self):
+    """Starts tuning the batch limits periodically, if enabled; should be called in ``start()``"""
+    if self.batch_controller.enabled:
+      Log.info("Adaptive batching with latency SLO: %s ms"
+               % str(self.batch_controller.latency_slo_ms))
+      self.batch_controller.add_listener(self._apply_batch_limits)
+      self._update_batch_limits()
+
+  def _update_batch_limits(self):
+    self.batch_controller.update(self.in_stream.get_size(),
+                                 self.output_helper.out_stream.get_size())
+    self.looper.register_timer_task_in_sec(self._update_batch_limits,
+                                           self.batch_controller.CONTROL_INTERVAL_SEC)
+
+  def _apply_batch_limits(self, batch_controller):
+    self.output_helper.data_tuple_set_capacity = batch_controller.data_tuple_set_capacity
+
+  def prepare_emit_plans(self, component_metrics):
+    """Makes emit plans for all the output streams, should be called in ``start()``
+
+    :param component_metrics: SpoutMetrics or BoltMetrics of this instance
+    """
+    for stream_id in self.pplan_helper.get_output_stream_ids():
+      self.get_emit_plan(stream_id, component_metrics)
+
+  def get_emit_plan(self, stream_id, component_metrics):
+    """Returns the emit plan for a given stream, making it if not made yet
+
+    It uses ``serializer``, ``out_stream_serializers`` and ``whole_tuple_serialization``
+    of a spout/bolt instance.
+
+    :raises RuntimeError: if the stream is not declared in output fields
+    """
+    # pylint: disable=no-member
+    plan = self.emit_plans.get(stream_id, None)
+    if plan is None:
+      schema_size = self.pplan_helper.get_output_schema_size(stream_id)
+      emit_counter, serialization_time_counter = component_metrics.get_emit_counters(stream_id)
+      plan = EmitPlan(schema_size=schema_size,
+                      has_custom_grouping=self.pplan_helper.has_custom_grouping(stream_id),
+                      serializer=self.out_stream_serializers.get(stream_id, self.serializer),
+                      whole_tuple=self.whole_tuple_serialization and schema_size != 1,
+                      emit_counter=emit_counter,
+                      serialization_time_counter=serialization_time_counter,
+                      serialization_sampler=self.make_latency_sampler())
+      self.emit_plans[stream_id] = plan
+    return plan
+
   def get_total_data_emitted_in_bytes(self):
     return self.output_helper.total_data_emitted_in_bytes
 
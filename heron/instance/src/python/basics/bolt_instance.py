@@ -20,13 +20,30 @@ from heron.common.src.python.utils.log import Log
 from heron.common.src.python.utils.tuple import TupleHelper, HeronTuple
 from heron.common.src.python.utils.metrics import global_metrics, BoltMetrics
 from heron.common.src.python.utils.misc import SerializerHelper
+from heron.common.src.python.utils.topology import TopologyContext
 from heron.proto import tuple_pb2
 from heron.pyheron.src.python import Stream
 
 import heron.common.src.python.constants as constants
 
-from .base_instance import BaseInstance
+from .base_instance import BaseInstance, LatencySampler
+from .bolt_process_pool import BoltProcessPool, EMIT, ACK, FAIL, LOG
 
+def _parse_data_tuples(trunks):
+  """Lazily deserializes raw HeronDataTuple trunks of a HeronDataTupleSet2
+
+  Each trunk is parsed only when the returned generator reaches it.
+  """
+  for trunk in trunks:
+    data_tuple = tuple_pb2.HeronDataTuple()
+    try:
+      data_tuple.ParseFromString(trunk)
+    except Exception:
+      Log.exception("Fail to deserialize HeronDataTuple")
+      continue
+    yield data_tuple
+
+# pylint: disable=too-many-instance-attributes
 class BoltInstance(BaseInstance):
   """The base class for all heron bolts in Python"""
 
@@ -40,19 +57,59 @@ class BoltInstance(BaseInstance):
     context = self.pplan_helper.context
     self.bolt_metrics = BoltMetrics(self.pplan_helper)
     self.serializer = SerializerHelper.get_serializer(context)
+    # map <component name -> <stream id -> serializer>>, overriding self.serializer
+    self.stream_serializers = SerializerHelper.get_stream_serializers(context)
+    self.out_stream_serializers = \
+      self.stream_serializers.get(self.pplan_helper.my_component_name, {})
+    self.whole_tuple_serialization = \
+      context.get_cluster_config().get(constants.TOPOLOGY_WHOLE_TUPLE_SERIALIZATION, False)
+    # map <(component name, stream id) -> function to deserialize values of a data tuple>
+    self.values_deserializers = {}
+    # measures every tuple until replaced in start(), when the task hooks are known
+    self.execute_sampler = LatencySampler(1)
 
     # acking related
     self.acking_enabled = context.get_cluster_config().get(constants.TOPOLOGY_ENABLE_ACKING, False)
     Log.info("Enable ACK: %s" % str(self.acking_enabled))
+    Log.info("Whole tuple serialization: %s" % str(self.whole_tuple_serialization))
 
     # load user's bolt class
     bolt_impl_class = super(BoltInstance, self).load_py_instance(is_spout=False)
     self.bolt_impl = bolt_impl_class(delegate=self)
 
+    # optional pool of worker processes, which run process() of the bolt instead of this process
+    cluster_config = context.get_cluster_config()
+    pool_size = int(cluster_config.get(constants.TOPOLOGY_BOLT_PROCESS_POOL_SIZE, 0))
+    if pool_size > 0:
+      # tuples the bolt neither acks nor fails are dropped once the spout has timed them out
+      timeout_sec = None
+      if cluster_config.get(constants.TOPOLOGY_ENABLE_MESSAGE_TIMEOUTS):
+        timeout_sec = float(cluster_config.get(constants.TOPOLOGY_MESSAGE_TIMEOUT_SECS, 30))
+      self.process_pool = BoltProcessPool(
+          bolt_impl_class, pool_size,
+          ordered=cluster_config.get(constants.TOPOLOGY_BOLT_PROCESS_POOL_ORDERED, True),
+          max_pending_per_worker=cluster_config.get(
+              constants.TOPOLOGY_BOLT_PROCESS_POOL_MAX_PENDING, 100),
+          keep_until_acked=self.acking_enabled, tuple_timeout_sec=timeout_sec)
+    else:
+      self.process_pool = None
+    Log.info("Bolt process pool size: %d" % pool_size)
+
+    # whether user's bolt takes a whole tuple set at once, i.e. implements process_batch()
+    self.batch_execute = self.process_pool is None and \
+                         callable(getattr(self.bolt_impl, "process_batch", None))
+    Log.info("Batch execute: %s" % str(self.batch_execute))
+
   def start(self):
     context = self.pplan_helper.context
     self.bolt_metrics.register_metrics(context)
-    self.bolt_impl.initialize(config=context.get_cluster_config(), context=context)
+    if self.process_pool is not None:
+      # each worker initializes its own bolt
+      self.process_pool.start(context.get_cluster_config(), context, self.looper.wake_up)
+      self.looper.add_wakeup_task(self._handle_process_pool_results)
+      self._prepare_process_pool_timer()
+    else:
+      self.bolt_impl.initialize(config=context.get_cluster_config(), context=context)
     context.invoke_hook_prepare()
 
     # prepare global metrics
@@ -63,10 +120,17 @@ class BoltInstance(BaseInstance):
     # prepare for custom grouping
     self.pplan_helper.prepare_custom_grouping(context)
 
+    # precompute what emit() does for each output stream
+    self.prepare_emit_plans(self.bolt_metrics)
+    self.execute_sampler = self.make_latency_sampler()
+    self.start_batch_control()
+
     # prepare tick tuple
     self._prepare_tick_tup_timer()
 
   def stop(self):
+    if self.process_pool is not None:
+      self.process_pool.stop()
     self.pplan_helper.context.invoke_hook_cleanup()
     self.cleanup()
     self.looper.exit_loop()
@@ -96,52 +160,50 @@ class BoltInstance(BaseInstance):
     :type need_task_ids: bool
     :param need_task_ids: indicate whether or not you would like the task IDs the Tuple was emitted.
     """
+    plan = self.emit_plans.get(stream, None) or self.get_emit_plan(stream, self.bolt_metrics)
+
     # first check whether this tuple is sane
-    self.pplan_helper.check_output_schema(stream, tup)
+    if len(tup) != plan.schema_size:
+      self.pplan_helper.check_output_schema(stream, tup)
 
     # get custom grouping target task ids; get empty list if not custom grouping
-    custom_target_task_ids = self.pplan_helper.choose_tasks_for_custom_grouping(stream, tup)
-
-    self.pplan_helper.context.invoke_hook_emit(tup, stream, None)
+    if plan.has_custom_grouping:
+      custom_target_task_ids = self.pplan_helper.choose_tasks_for_custom_grouping(stream, tup)
+    else:
+      custom_target_task_ids = []
 
-    data_tuple = tuple_pb2.HeronDataTuple()
-    data_tuple.key = 0
+    context = self.pplan_helper.context
+    if context.hook_exists:
+      context.invoke_hook_emit(tup, stream, None)
 
+    dest_task_ids = None
     if direct_task is not None:
       if not isinstance(direct_task, int):
         raise TypeError("direct_task argument needs to be an integer, given: %s"
                         % str(type(direct_task)))
       # performing emit-direct
-      data_tuple.dest_task_ids.append(direct_task)
-    elif custom_target_task_ids is not None:
-      for task_id in custom_target_task_ids:
-        # for custom grouping
-        data_tuple.dest_task_ids.append(task_id)
+      dest_task_ids = [direct_task]
+    elif custom_target_task_ids:
+      # for custom grouping
+      dest_task_ids = custom_target_task_ids
 
     # Set the anchors for a tuple
+    roots = None
     if anchors is not None:
-      merged_roots = set()
-      for tup in [t for t in anchors if isinstance(t, HeronTuple) and t.roots is not None]:
-        merged_roots.update(tup.roots)
-      for rt in merged_roots:
-        to_add = data_tuple.roots.add()
-        to_add.CopyFrom(rt)
-
-    tuple_size_in_bytes = 0
-    start_time = time.time()
+      roots = set()
+      for anchor in anchors:
+        if isinstance(anchor, HeronTuple) and anchor.roots is not None:
+          roots.update((rt.taskid, rt.key) for rt in anchor.roots)
 
     # Serialize
-    for obj in tup:
-      serialized = self.serializer.serialize(obj)
-      data_tuple.values.append(serialized)
-      tuple_size_in_bytes += len(serialized)
-    serialize_latency_ns = (time.time() - start_time) * constants.SEC_TO_NS
-    self.bolt_metrics.serialize_data_tuple(stream, serialize_latency_ns)
+    serialized_values = plan.serialize(tup)
+    tuple_size_in_bytes = sum(map(len, serialized_values))
 
-    super(BoltInstance, self).admit_data_tuple(stream_id=stream, data_tuple=data_tuple,
-                                               tuple_size_in_bytes=tuple_size_in_bytes)
+    # the tuple is built directly in the buffered tuple set
+    self.output_helper.add_new_data_tuple(stream, serialized_values, tuple_size_in_bytes,
+                                          roots=roots, dest_task_ids=dest_task_ids)
 
-    self.bolt_metrics.update_emit_count(stream)
+    plan.emit_counter.incr()
     if need_task_ids:
       sent_task_ids = custom_target_task_ids or []
       if direct_task is not None:
@@ -161,31 +223,28 @@ class BoltInstance(BaseInstance):
     else:
       # update outqueue full count
       self.bolt_metrics.update_out_queue_full_count()
+      self.batch_controller.record_out_queue_full()
 
   def _read_tuples_and_execute(self):
     start_cycle_time = time.time()
     total_data_emitted_bytes_before = self.get_total_data_emitted_in_bytes()
-    exec_batch_time = \
-      self.sys_config[constants.INSTANCE_EXECUTE_BATCH_TIME_MS] * constants.MS_TO_SEC
-    exec_batch_size = self.sys_config[constants.INSTANCE_EXECUTE_BATCH_SIZE_BYTES]
-    while not self.in_stream.is_empty():
+    exec_batch_time = self.batch_controller.execute_batch_time_sec
+    exec_batch_size = self.batch_controller.execute_batch_size_bytes
+    while not self.in_stream.is_empty() and not self.is_process_pool_full():
       try:
         tuples = self.in_stream.poll()
       except Queue.Empty:
         break
 
-      if isinstance(tuples, tuple_pb2.HeronTupleSet):
+      if isinstance(tuples, (tuple_pb2.HeronTupleSet, tuple_pb2.HeronTupleSet2)):
         if tuples.HasField("control"):
           raise RuntimeError("Bolt cannot get acks/fails from other components")
         elif tuples.HasField("data"):
-          stream = tuples.data.stream
-
-          for data_tuple in tuples.data.tuples:
-            self._handle_data_tuple(data_tuple, stream)
+          self._handle_data(tuples)
         else:
           Log.error("Received tuple neither data nor control")
       else:
-        Log.error("Received tuple not instance of HeronTupleSet")
+        Log.error("Received tuple not instance of HeronTupleSet or HeronTupleSet2")
 
       if (time.time() - start_cycle_time - exec_batch_time > 0) or \
           (self.get_total_data_emitted_in_bytes() - total_data_emitted_bytes_before
@@ -193,26 +252,181 @@ class BoltInstance(BaseInstance):
         # batch reached
         break
 
+    self.batch_controller.record_batch(time.time() - start_cycle_time)
+
+  def _handle_data(self, tuples):
+    """Executes the data tuples of a HeronTupleSet or HeronTupleSet2"""
+    stream = tuples.data.stream
+
+    if isinstance(tuples, tuple_pb2.HeronTupleSet2):
+      data_tuples = _parse_data_tuples(tuples.data.tuples)
+    else:
+      data_tuples = tuples.data.tuples
+
+    if self.batch_execute:
+      self._handle_data_tuple_set(data_tuples, stream)
+    else:
+      for data_tuple in data_tuples:
+        self._handle_data_tuple(data_tuple, stream)
+
   def _handle_data_tuple(self, data_tuple, stream):
-    start_time = time.time()
+    # latencies are measured only for sampled tuples
+    sample_weight = self.execute_sampler.sample()
+    start_time = time.time() if sample_weight else None
 
-    values = []
-    for value in data_tuple.values:
-      values.append(self.serializer.deserialize(value))
+    values = self._get_values_deserializer(stream)(data_tuple.values)
 
     # create HeronTuple
-    tup = TupleHelper.make_tuple(stream, data_tuple.key, values, roots=data_tuple.roots)
+    tup = TupleHelper.make_tuple(stream, data_tuple.key, values, roots=data_tuple.roots,
+                                 creation_time=start_time, timed=sample_weight > 0)
+
+    if not sample_weight:
+      if self.process_pool is not None:
+        self.process_pool.submit(tup)
+      else:
+        self.bolt_impl.process(tup)
+        self.bolt_metrics.execute_tuple(stream.id, stream.component_name, None)
+      return
 
     deserialized_time = time.time()
+    deserialize_latency_ns = (deserialized_time - start_time) * constants.SEC_TO_NS
+    self.bolt_metrics.deserialize_data_tuple(stream.id, stream.component_name,
+                                             deserialize_latency_ns, sample_weight)
+    if self.process_pool is not None:
+      # executed by a worker; execute latency is updated when the result comes back
+      self.process_pool.submit(tup)
+      return
+
     self.bolt_impl.process(tup)
     execute_latency_ns = (time.time() - deserialized_time) * constants.SEC_TO_NS
-    deserialize_latency_ns = (deserialized_time - start_time) * constants.SEC_TO_NS
 
     self.pplan_helper.context.invoke_hook_bolt_execute(tup, execute_latency_ns)
+    self.bolt_metrics.execute_tuple(stream.id, stream.component_name, execute_latency_ns,
+                                    sample_weight)
+
+  def _handle_data_tuple_set(self, data_tuples, stream):
+    """Deserializes a whole set of data tuples and hands them to ``process_batch()`` at once
+
+    Only the execute latency of the whole set is measured. Task hooks are called once per tuple
+    with the average latency of the set, and the execute latency histogram is not updated.
+    """
+    start_time = time.time()
+
+    deserialize_values = self._get_values_deserializer(stream)
+    tups = [TupleHelper.make_tuple(stream, data_tuple.key,
+                                   deserialize_values(data_tuple.values),
+                                   roots=data_tuple.roots, creation_time=start_time)
+            for data_tuple in data_tuples]
+    if len(tups) == 0:
+      return
+
+    deserialized_time = time.time()
+    self.bolt_impl.process_batch(tups)
+    execute_latency_ns = (time.time() - deserialized_time) * constants.SEC_TO_NS
+    deserialize_latency_ns = (deserialized_time - start_time) * constants.SEC_TO_NS
+
+    self.pplan_helper.context.invoke_hook_bolt_execute_batch(tups, execute_latency_ns)
 
     self.bolt_metrics.deserialize_data_tuple(stream.id, stream.component_name,
                                              deserialize_latency_ns)
-    self.bolt_metrics.execute_tuple(stream.id, stream.component_name, execute_latency_ns)
+    self.bolt_metrics.execute_tuple_batch(stream.id, stream.component_name, len(tups),
+                                          execute_latency_ns)
+
+  def is_process_pool_full(self):
+    """Returns whether no more tuples can be dispatched to the process pool, if enabled"""
+    return self.process_pool is not None and self.process_pool.is_full()
+
+  def _handle_process_pool_results(self):
+    """Wakeup task replaying what the bolt did in the worker processes
+
+    Emits, acks and fails are applied with the original tuples, so that the anchors and roots of
+    the tuples are preserved.
+    """
+    pool = self.process_pool
+    results = pool.poll_results()
+    if len(results) == 0:
+      return
+
+    context = self.pplan_helper.context
+    for seq, tup, actions, execute_latency_ns in results:
+      for action in actions:
+        self._replay_process_pool_action(action)
+
+      if tup is None:
+        self.bolt_metrics.execute_tuple(TupleHelper.TICK_TUPLE_ID,
+                                        TupleHelper.TICK_SOURCE_COMPONENT, execute_latency_ns)
+      else:
+        context.invoke_hook_bolt_execute(tup, execute_latency_ns)
+        self.bolt_metrics.execute_tuple(tup.stream, tup.component, execute_latency_ns)
+      if seq is not None:
+        pool.release(seq)
+
+    self.output_helper.send_out_tuples()
+    # tuples may have been left in the in stream while the pool was full
+    if not self.in_stream.is_empty() and self.pplan_helper.is_topology_running():
+      self.process_incoming_tuples()
+
+  def _replay_process_pool_action(self, action):
+    """Applies an emit, ack, fail or log done by the bolt in a worker process"""
+    pool = self.process_pool
+    kind = action[0]
+    if kind == EMIT:
+      _, values, stream, anchor_seqs, direct_task = action
+      anchors = None
+      if anchor_seqs is not None:
+        anchors = [pool.get_tuple(anchor_seq) for anchor_seq in anchor_seqs]
+      self.emit(values, stream=stream, anchors=anchors, direct_task=direct_task)
+    elif kind == ACK or kind == FAIL:
+      acked_tup = pool.pop_tuple(action[1])
+      if acked_tup is not None:
+        if kind == ACK:
+          self.ack(acked_tup)
+        else:
+          self.fail(acked_tup)
+    elif kind == LOG:
+      self.log(action[1], action[2])
+
+  def _get_values_deserializer(self, stream):
+    """Returns a function that deserializes the values of a data tuple from an incoming stream"""
+    key = (stream.component_name, stream.id)
+    deserializer = self.values_deserializers.get(key, None)
+    if deserializer is None:
+      deserializer = self._make_values_deserializer(stream.component_name, stream.id)
+      self.values_deserializers[key] = deserializer
+    return deserializer
+
+  def _make_values_deserializer(self, component_name, stream_id):
+    serializer = self.stream_serializers.get(component_name, {}).get(stream_id, self.serializer)
+    out_fields = self.pplan_helper.context[TopologyContext.COMPONENT_TO_OUT_FIELDS]
+    fields = out_fields.get(component_name, {}).get(stream_id, None)
+    # values of a stream with an unknown schema are decoded one by one, as a whole tuple cannot
+    # be told apart from a single serialized field
+    if not self.whole_tuple_serialization or fields is None or len(fields) == 1:
+      return serializer.deserialize_values
+
+    deserialize_tuple = serializer.deserialize_tuple
+    deserialize_values = serializer.deserialize_values
+    def deserialize(values):
+      # a single value for a tuple with more than one field is a serialized whole tuple
+      if len(values) == 1:
+        return deserialize_tuple(values[0])
+      return deserialize_values(values)
+    return deserialize
+
+  def _prepare_process_pool_timer(self):
+    """Periodically checks the worker processes, failing this instance if one has exited, and
+    drops the tuples that were neither acked nor failed until the message timeout
+    """
+    def check_process_pool():
+      if self.process_pool.workers:
+        self.process_pool.check_workers()
+        expired = self.process_pool.expire_tuples()
+        if expired > 0:
+          Log.debug("Dropped %d tuples neither acked nor failed by the bolt" % expired)
+        self._prepare_process_pool_timer()
+
+    self.looper.register_timer_task_in_sec(check_process_pool,
+                                           BoltProcessPool.CHECK_INTERVAL_SEC)
 
   def _prepare_tick_tup_timer(self):
     cluster_config = self.pplan_helper.context.get_cluster_config()
@@ -222,6 +436,10 @@ class BoltInstance(BaseInstance):
 
       def send_tick():
         tick = TupleHelper.make_tick_tuple()
+        if self.process_pool is not None:
+          self.process_pool.broadcast_tick(tick)
+          self._prepare_tick_tup_timer()
+          return
         start_time = time.time()
         self.bolt_impl.process_tick(tick)
         tick_execute_latency_ns = (time.time() - start_time) * constants.SEC_TO_NS
@@ -242,18 +460,13 @@ class BoltInstance(BaseInstance):
       return
 
     if self.acking_enabled:
-      ack_tuple = tuple_pb2.AckTuple()
-      ack_tuple.ackedtuple = int(tup.id)
-
-      tuple_size_in_bytes = 0
-      for rt in tup.roots:
-        to_add = ack_tuple.roots.add()
-        to_add.CopyFrom(rt)
-        tuple_size_in_bytes += rt.ByteSize()
-      super(BoltInstance, self).admit_control_tuple(ack_tuple, tuple_size_in_bytes, True)
-
-    process_latency_ns = (time.time() - tup.creation_time) * constants.SEC_TO_NS
-    self.pplan_helper.context.invoke_hook_bolt_ack(tup, process_latency_ns)
+      self.output_helper.add_ack_tuple(int(tup.id), tup.roots)
+
+    # creation time is None if the latencies of the tuple are not sampled
+    process_latency_ns = None
+    if tup.creation_time is not None:
+      process_latency_ns = (time.time() - tup.creation_time) * constants.SEC_TO_NS
+      self.pplan_helper.context.invoke_hook_bolt_ack(tup, process_latency_ns)
     self.bolt_metrics.acked_tuple(tup.stream, tup.component, process_latency_ns)
 
   def fail(self, tup):
@@ -266,18 +479,12 @@ class BoltInstance(BaseInstance):
       return
 
     if self.acking_enabled:
-      fail_tuple = tuple_pb2.AckTuple()
-      fail_tuple.ackedtuple = int(tup.id)
-
-      tuple_size_in_bytes = 0
-      for rt in tup.roots:
-        to_add = fail_tuple.roots.add()
-        to_add.CopyFrom(rt)
-        tuple_size_in_bytes += rt.ByteSize()
-      super(BoltInstance, self).admit_control_tuple(fail_tuple, tuple_size_in_bytes, False)
-
-    fail_latency_ns = (time.time() - tup.creation_time) * constants.SEC_TO_NS
-    self.pplan_helper.context.invoke_hook_bolt_fail(tup, fail_latency_ns)
+      self.output_helper.add_fail_tuple(int(tup.id), tup.roots)
+
+    fail_latency_ns = None
+    if tup.creation_time is not None:
+      fail_latency_ns = (time.time() - tup.creation_time) * constants.SEC_TO_NS
+      self.pplan_helper.context.invoke_hook_bolt_fail(tup, fail_latency_ns)
     self.bolt_metrics.failed_tuple(tup.stream, tup.component, fail_latency_ns)
 
   def cleanup(self):
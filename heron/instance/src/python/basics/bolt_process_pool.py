@@ -0,0 +1,391 @@
+# Copyright 2016 Twitter. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+'''bolt_process_pool.py: pool of worker processes running the process logic of a bolt'''
+import collections
+import logging
+import multiprocessing
+import os
+import Queue
+import stat
+import threading
+import time
+import traceback
+
+from heron.common.src.python.utils.log import Log
+from heron.common.src.python.utils.misc import HeronCommunicator
+from heron.common.src.python.utils.tuple import HeronTuple
+from heron.pyheron.src.python import Stream
+
+import heron.common.src.python.constants as constants
+
+# actions recorded by a worker while processing a tuple, and replayed by the bolt instance
+EMIT = 0
+ACK = 1
+FAIL = 2
+LOG = 3
+
+class BoltProcessPool(object):
+  """Pool of worker processes, each of which runs its own instance of the user's bolt
+
+  Deserialized tuples are dispatched to the least loaded worker. A worker calls ``process()`` of
+  its bolt, and sends back what the bolt did (emits, acks, fails and logs) as a list of actions.
+  Actions refer to tuples by the sequence number given to them by ``submit()``, and the
+  original tuples are kept in the pool until they are acked/failed (or, if acking is disabled,
+  until their results are returned), so that the bolt instance can replay the actions with the
+  anchors and roots of the original tuples. Tuples that the bolt neither acks nor fails are
+  dropped by ``expire_tuples()`` once they are older than ``tuple_timeout_sec``.
+
+  Results are returned in the order the tuples were submitted if ``ordered`` is set, or as soon
+  as they come back otherwise. Tick tuples are sent to every worker, and their results are
+  returned as soon as they come back.
+
+  Note that each worker has its own state, ``emit()`` in a worker always returns ``None`` even if
+  ``need_task_ids`` is set, and metrics registered by a bolt in a worker are not reported.
+
+  A worker that exits (e.g. killed by the OS) never returns the tuples it holds, so
+  ``check_workers()`` needs to be called periodically to fail the instance in that case, along
+  with ``expire_tuples()``.
+
+  Workers are forked by ``start()`` once the instance is connected. They close the sockets they
+  inherit, so that the Stream Manager and the Metrics Manager see the instance disconnect when it
+  dies, and exit when they are orphaned. As only the forking thread exists in a worker, locks
+  held by other threads at that time (e.g. the ones of logging) are never released there, so the
+  pool should not be used with the multi-thread instance, in which the gateway thread is running.
+
+  :ivar num_workers: number of worker processes
+  :ivar ordered: whether results are returned in the order the tuples were submitted
+  """
+  CHECK_INTERVAL_SEC = 1.0
+
+  def __init__(self, bolt_class, num_workers, ordered=True, max_pending_per_worker=100,
+               keep_until_acked=True, tuple_timeout_sec=None):
+    """Initializes BoltProcessPool
+
+    :param bolt_class: class of the user's bolt
+    :param num_workers: number of worker processes
+    :param ordered: whether results are returned in the order the tuples were submitted
+    :param max_pending_per_worker: number of tuples a worker can hold before ``is_full()``
+    :param keep_until_acked: whether tuples are kept until acked/failed, rather than until
+                             their results are returned
+    :param tuple_timeout_sec: time after which a tuple kept until acked is dropped, which is
+                              usually the message timeout, or ``None`` to keep it forever
+    """
+    self.bolt_class = bolt_class
+    self.num_workers = int(num_workers)
+    self.max_pending = int(max_pending_per_worker) * self.num_workers
+
+    # list of _Worker
+    self.workers = []
+    self._results = _ResultReader()
+    self._tuples = _KeptTuples(keep_until_acked, tuple_timeout_sec)
+    # results waiting for earlier ones, only in the ordered mode
+    self._reorder = _ReorderBuffer() if ordered else None
+
+  @property
+  def ordered(self):
+    return self._reorder is not None
+
+  def start(self, config, context, wake_up):
+    """Starts the worker processes, each of which initializes its bolt with config and context
+
+    :param wake_up: function called from another thread when results come back
+    """
+    if threading.active_count() > 1:
+      Log.warning("Forking bolt worker processes while other threads are running, whose locks "
+                  "may be held forever in the workers")
+    result_queue = multiprocessing.Queue()
+    for index in range(self.num_workers):
+      task_queue = multiprocessing.Queue()
+      process = multiprocessing.Process(
+          target=_worker_main, name="heron-bolt-worker-%d" % index,
+          args=(index, self.bolt_class, config, context, task_queue, result_queue))
+      process.daemon = True
+      process.start()
+      self.workers.append(_Worker(process, task_queue))
+    Log.info("Started %d bolt worker processes (ordered: %s)", self.num_workers, self.ordered)
+    self._results.start(result_queue, wake_up)
+
+  def stop(self):
+    """Stops the worker processes"""
+    for worker in self.workers:
+      worker.task_queue.put(None)
+    for worker in self.workers:
+      worker.process.join(timeout=1.0)
+      if worker.process.is_alive():
+        worker.process.terminate()
+    self._results.stop()
+    self.workers = []
+
+  def is_full(self):
+    """Returns whether every worker holds the maximum number of tuples"""
+    return sum(worker.load for worker in self.workers) >= self.max_pending
+
+  def submit(self, tup):
+    """Dispatches a data tuple to the least loaded worker
+
+    :type tup: HeronTuple
+    :returns: sequence number of the tuple
+    """
+    seq = self._tuples.add(tup)
+    worker = min(self.workers, key=lambda w: w.load)
+    worker.load += 1
+    worker.task_queue.put((seq, _to_fields(tup, seq)))
+    return seq
+
+  def broadcast_tick(self, tick):
+    """Sends a tick tuple to every worker"""
+    fields = _to_fields(tick, tick.id)
+    for worker in self.workers:
+      worker.load += 1
+      worker.task_queue.put((None, fields))
+
+  def check_workers(self):
+    """Checks that every worker process is alive
+
+    :raises RuntimeError: if a worker process has exited
+    """
+    for index, worker in enumerate(self.workers):
+      if not worker.process.is_alive():
+        raise RuntimeError("Bolt worker %d exited with code %s"
+                           % (index, str(worker.process.exitcode)))
+
+  def expire_tuples(self):
+    """Drops the kept tuples submitted more than ``tuple_timeout_sec`` ago
+
+    The spout has already timed them out, so acking or failing them is meaningless.
+
+    :returns: number of dropped tuples
+    """
+    return self._tuples.expire(time.time())
+
+  def get_tuple(self, seq):
+    """Returns the original tuple of a sequence number, or ``None`` if it is not kept"""
+    return self._tuples.get(seq)
+
+  def pop_tuple(self, seq):
+    """Removes and returns the original tuple of a sequence number, or ``None``"""
+    return self._tuples.pop(seq)
+
+  def poll_results(self):
+    """Returns the results that came back and are ready to be delivered
+
+    :returns: list of (seq, tup, actions, execute_latency_ns), where tup is the original tuple;
+              seq and tup are ``None`` for tick tuples
+    :raises RuntimeError: if the bolt raised an error in a worker
+    """
+    ret = []
+    for index, seq, actions, latency_ns, error in self._results.drain():
+      if error is not None:
+        raise RuntimeError("Bolt worker %d failed:\n%s" % (index, error))
+      self.workers[index].load -= 1
+      if seq is None:
+        ret.append((None, None, actions, latency_ns))
+      elif self._reorder is None:
+        ret.append((seq, self._tuples.get(seq), actions, latency_ns))
+      else:
+        for next_seq, next_actions, next_latency_ns in self._reorder.add(seq, actions, latency_ns):
+          ret.append((next_seq, self._tuples.get(next_seq), next_actions, next_latency_ns))
+    return ret
+
+  def release(self, seq):
+    """Called after the result of a tuple is delivered"""
+    self._tuples.release(seq)
+
+class _Worker(object):
+  """A worker process, its task queue and the number of tuples it holds"""
+  __slots__ = ('process', 'task_queue', 'load')
+
+  def __init__(self, process, task_queue):
+    self.process = process
+    self.task_queue = task_queue
+    # number of tuples dispatched to this worker and not yet returned
+    self.load = 0
+
+class _ResultReader(object):
+  """Moves results from the result queue of the workers to a communicator, on its own thread
+
+  This lets the looper wait only on its own wake up pipe.
+  """
+  def __init__(self):
+    self._queue = None
+    self._results = None
+
+  def start(self, result_queue, wake_up):
+    self._queue = result_queue
+    self._results = HeronCommunicator(consumer_cb=wake_up)
+    reader = threading.Thread(target=self._read_results, name="heron-bolt-pool-reader")
+    reader.daemon = True
+    reader.start()
+
+  def stop(self):
+    if self._queue is not None:
+      self._queue.put(None)
+
+  def drain(self):
+    return self._results.drain()
+
+  def _read_results(self):
+    while True:
+      result = self._queue.get()
+      if result is None:
+        return
+      self._results.offer(result)
+
+class _KeptTuples(object):
+  """Original tuples submitted to the pool, by the sequence numbers given to them"""
+  def __init__(self, keep_until_acked, timeout_sec):
+    self.keep_until_acked = keep_until_acked
+    self.timeout_sec = timeout_sec if keep_until_acked else None
+    self._next_seq = 0
+    # map <seq -> original HeronTuple>
+    self._tuples = {}
+    # (submitted time, seq) in the submitted order, only if tuples expire
+    self._submitted = collections.deque()
+
+  def add(self, tup):
+    seq = self._next_seq
+    self._next_seq += 1
+    self._tuples[seq] = tup
+    if self.timeout_sec is not None:
+      self._submitted.append((time.time(), seq))
+    return seq
+
+  def expire(self, now):
+    if self.timeout_sec is None:
+      return 0
+    submitted = self._submitted
+    deadline = now - self.timeout_sec
+    count = 0
+    while submitted and submitted[0][0] < deadline:
+      _, seq = submitted.popleft()
+      if self._tuples.pop(seq, None) is not None:
+        count += 1
+    return count
+
+  def get(self, seq):
+    return self._tuples.get(seq, None)
+
+  def pop(self, seq):
+    return self._tuples.pop(seq, None)
+
+  def release(self, seq):
+    if not self.keep_until_acked:
+      self._tuples.pop(seq, None)
+
+class _ReorderBuffer(object):
+  """Holds results that came back before earlier ones, to return them in the submitted order"""
+  def __init__(self):
+    # map <seq -> (actions, latency_ns)>
+    self._out_of_order = {}
+    self._next_seq = 0
+
+  def add(self, seq, actions, latency_ns):
+    """Adds a result, and returns the list of (seq, actions, latency_ns) that are ready"""
+    self._out_of_order[seq] = (actions, latency_ns)
+    ret = []
+    while self._next_seq in self._out_of_order:
+      next_actions, next_latency_ns = self._out_of_order.pop(self._next_seq)
+      ret.append((self._next_seq, next_actions, next_latency_ns))
+      self._next_seq += 1
+    return ret
+
+def _to_fields(tup, tuple_id):
+  """HeronTuple cannot be pickled, and roots are not needed by workers"""
+  return (tuple_id, tup.component, tup.stream, tup.task, tup.values, tup.creation_time)
+
+class _WorkerDelegate(object):
+  """Delegate of a bolt in a worker process, recording what the bolt does"""
+  def __init__(self):
+    self.logger = logging.getLogger()
+    self.actions = []
+
+  # pylint: disable=unused-argument
+  def emit(self, tup, stream=Stream.DEFAULT_STREAM_ID,
+           anchors=None, direct_task=None, need_task_ids=False):
+    anchor_seqs = None
+    if anchors is not None:
+      anchor_seqs = [anchor.id for anchor in anchors if isinstance(anchor, HeronTuple)]
+    self.actions.append((EMIT, tuple(tup), stream, anchor_seqs, direct_task))
+
+  def ack(self, tup):
+    if isinstance(tup, HeronTuple):
+      self.actions.append((ACK, tup.id))
+
+  def fail(self, tup):
+    if isinstance(tup, HeronTuple):
+      self.actions.append((FAIL, tup.id))
+
+  def log(self, message, level=None):
+    self.actions.append((LOG, message, level))
+
+  def take_actions(self):
+    actions = self.actions
+    self.actions = []
+    return actions
+
+# pylint: disable=too-many-arguments
+def _close_inherited_sockets():
+  """Closes the sockets a worker process inherits from the bolt instance
+
+  The queues to the bolt instance are pipes, so they are kept.
+  """
+  try:
+    fds = [int(fd) for fd in os.listdir("/proc/self/fd")]
+  except OSError:
+    fds = range(3, min(os.sysconf("SC_OPEN_MAX"), 65536))
+  for fd in fds:
+    try:
+      if fd > 2 and stat.S_ISSOCK(os.fstat(fd).st_mode):
+        os.close(fd)
+    except OSError:
+      pass
+
+def _worker_main(index, bolt_class, config, context, task_queue, result_queue):
+  """Main function of a worker process"""
+  parent_pid = os.getppid()
+  _close_inherited_sockets()
+  delegate = _WorkerDelegate()
+  try:
+    bolt = bolt_class(delegate=delegate)
+    bolt.initialize(config=config, context=context)
+  except Exception:
+    result_queue.put((index, None, [], 0, traceback.format_exc()))
+    return
+
+  while True:
+    try:
+      task = task_queue.get(timeout=BoltProcessPool.CHECK_INTERVAL_SEC)
+    except Queue.Empty:
+      # the bolt instance died without stopping the pool
+      if os.getppid() != parent_pid:
+        return
+      continue
+    if task is None:
+      return
+    seq, fields = task
+    tup = HeronTuple(*(fields + (None,)))
+    start_time = time.time()
+    error = None
+    try:
+      if seq is None:
+        bolt.process_tick(tup)
+      else:
+        bolt.process(tup)
+    # pylint: disable=broad-except
+    except Exception:
+      error = traceback.format_exc()
+    latency_ns = (time.time() - start_time) * constants.SEC_TO_NS
+    result_queue.put((index, seq, delegate.take_actions(), latency_ns, error))
+    if error is not None:
+      return
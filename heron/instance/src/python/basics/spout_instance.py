@@ -20,13 +20,13 @@ import collections
 from heron.common.src.python.utils.log import Log
 from heron.common.src.python.utils.tuple import TupleHelper
 from heron.common.src.python.utils.metrics import global_metrics, SpoutMetrics
-from heron.common.src.python.utils.misc import SerializerHelper
+from heron.common.src.python.utils.misc import SerializerHelper, PendingTupleTable
 from heron.proto import topology_pb2, tuple_pb2
 from heron.pyheron.src.python import Stream
 
 import heron.common.src.python.constants as constants
 
-from .base_instance import BaseInstance
+from .base_instance import BaseInstance, LatencySampler
 
 # pylint: disable=too-many-instance-attributes
 class SpoutInstance(BaseInstance):
@@ -42,23 +42,41 @@ class SpoutInstance(BaseInstance):
     context = self.pplan_helper.context
     self.spout_metrics = SpoutMetrics(self.pplan_helper)
     self.serializer = SerializerHelper.get_serializer(context)
+    # map <component name -> <stream id -> serializer>>, overriding self.serializer
+    self.stream_serializers = SerializerHelper.get_stream_serializers(context)
+    self.out_stream_serializers = \
+      self.stream_serializers.get(self.pplan_helper.my_component_name, {})
+    self.whole_tuple_serialization = \
+      context.get_cluster_config().get(constants.TOPOLOGY_WHOLE_TUPLE_SERIALIZATION, False)
 
     # acking related
     self.acking_enabled = context.get_cluster_config().get(constants.TOPOLOGY_ENABLE_ACKING, False)
     self.enable_message_timeouts = \
       context.get_cluster_config().get(constants.TOPOLOGY_ENABLE_MESSAGE_TIMEOUTS)
     Log.info("Enable ACK: %s" % str(self.acking_enabled))
+    Log.info("Whole tuple serialization: %s" % str(self.whole_tuple_serialization))
     Log.info("Enable Message Timeouts: %s" % str(self.enable_message_timeouts))
 
-    # map <tuple_info.key -> tuple_info>, ordered by insertion time
-    self.in_flight_tuples = collections.OrderedDict()
+    # table of pending tuples, with a timing wheel if message timeouts are enabled
+    n_buckets = self.sys_config.get(constants.INSTANCE_ACKNOWLEDGEMENT_NBUCKETS) \
+      if self.enable_message_timeouts else None
+    self.in_flight_tuples = PendingTupleTable(n_buckets=n_buckets)
     self.immediate_acks = collections.deque()
     self.total_tuples_emitted = 0
+    # measures every call until replaced in start(), when the task hooks are known
+    self.next_tuple_sampler = LatencySampler(1)
 
     # load user's spout class
     spout_impl_class = super(SpoutInstance, self).load_py_instance(is_spout=True)
     self.spout_impl = spout_impl_class(delegate=self)
 
+    # whether user's spout takes all acks/fails of a tuple set at once,
+    # i.e. implements ack_batch() or fail_batch()
+    self.ack_batch_enabled = callable(getattr(self.spout_impl, "ack_batch", None))
+    self.fail_batch_enabled = callable(getattr(self.spout_impl, "fail_batch", None))
+    Log.info("Batch ack: %s, batch fail: %s"
+             % (str(self.ack_batch_enabled), str(self.fail_batch_enabled)))
+
   def start(self):
     context = self.pplan_helper.context
     self.spout_metrics.register_metrics(context)
@@ -73,6 +91,11 @@ class SpoutInstance(BaseInstance):
     # prepare for custom grouping
     self.pplan_helper.prepare_custom_grouping(context)
 
+    # precompute what emit() does for each output stream
+    self.prepare_emit_plans(self.spout_metrics)
+    self.next_tuple_sampler = self.make_latency_sampler()
+    self.start_batch_control()
+
     self._add_spout_task()
     self.topology_state = topology_pb2.TopologyState.Value("RUNNING")
 
@@ -112,56 +135,50 @@ class SpoutInstance(BaseInstance):
     :type need_task_ids: bool
     :param need_task_ids: indicate whether or not you would like the task IDs the Tuple was emitted.
     """
+    plan = self.emit_plans.get(stream, None) or self.get_emit_plan(stream, self.spout_metrics)
+
     # first check whether this tuple is sane
-    self.pplan_helper.check_output_schema(stream, tup)
+    if len(tup) != plan.schema_size:
+      self.pplan_helper.check_output_schema(stream, tup)
 
     # get custom grouping target task ids; get empty list if not custom grouping
-    custom_target_task_ids = self.pplan_helper.choose_tasks_for_custom_grouping(stream, tup)
-
-    self.pplan_helper.context.invoke_hook_emit(tup, stream, None)
+    if plan.has_custom_grouping:
+      custom_target_task_ids = self.pplan_helper.choose_tasks_for_custom_grouping(stream, tup)
+    else:
+      custom_target_task_ids = []
 
-    data_tuple = tuple_pb2.HeronDataTuple()
-    data_tuple.key = 0
+    context = self.pplan_helper.context
+    if context.hook_exists:
+      context.invoke_hook_emit(tup, stream, None)
 
+    dest_task_ids = None
     if direct_task is not None:
       if not isinstance(direct_task, int):
         raise TypeError("direct_task argument needs to be an integer, given: %s"
                         % str(type(direct_task)))
       # performing emit-direct
-      data_tuple.dest_task_ids.append(direct_task)
-    elif custom_target_task_ids is not None:
+      dest_task_ids = [direct_task]
+    elif custom_target_task_ids:
       # for custom grouping
-      for task_id in custom_target_task_ids:
-        data_tuple.dest_task_ids.append(task_id)
+      dest_task_ids = custom_target_task_ids
 
+    roots = None
     if tup_id is not None:
-      tuple_info = TupleHelper.make_root_tuple_info(stream, tup_id)
       if self.acking_enabled:
         # this message is rooted
-        root = data_tuple.roots.add()
-        root.taskid = self.pplan_helper.my_task_id
-        root.key = tuple_info.key
-        self.in_flight_tuples[tuple_info.key] = tuple_info
+        roots = [(self.pplan_helper.my_task_id, self.in_flight_tuples.add(stream, tup_id))]
       else:
-        self.immediate_acks.append(tuple_info)
-
-    tuple_size_in_bytes = 0
-
-    start_time = time.time()
+        self.immediate_acks.append(TupleHelper.make_root_tuple_info(stream, tup_id))
 
     # Serialize
-    for obj in tup:
-      serialized = self.serializer.serialize(obj)
-      data_tuple.values.append(serialized)
-      tuple_size_in_bytes += len(serialized)
-
-    serialize_latency_ns = (time.time() - start_time) * constants.SEC_TO_NS
-    self.spout_metrics.serialize_data_tuple(stream, serialize_latency_ns)
+    serialized_values = plan.serialize(tup)
+    tuple_size_in_bytes = sum(map(len, serialized_values))
 
-    super(SpoutInstance, self).admit_data_tuple(stream_id=stream, data_tuple=data_tuple,
-                                                tuple_size_in_bytes=tuple_size_in_bytes)
+    # the tuple is built directly in the buffered tuple set
+    self.output_helper.add_new_data_tuple(stream, serialized_values, tuple_size_in_bytes,
+                                          roots=roots, dest_task_ids=dest_task_ids)
     self.total_tuples_emitted += 1
-    self.spout_metrics.update_emit_count(stream)
+    plan.emit_counter.incr()
     if need_task_ids:
       sent_task_ids = custom_target_task_ids or []
       if direct_task is not None:
@@ -181,18 +198,16 @@ class SpoutInstance(BaseInstance):
       except Queue.Empty:
         break
 
-      if isinstance(tuples, tuple_pb2.HeronTupleSet):
+      if isinstance(tuples, (tuple_pb2.HeronTupleSet, tuple_pb2.HeronTupleSet2)):
         if tuples.HasField("data"):
           raise RuntimeError("Spout cannot get incoming data tuples from other components")
         elif tuples.HasField("control"):
-          for ack_tuple in tuples.control.acks:
-            self._handle_ack_tuple(ack_tuple, True)
-          for fail_tuple in tuples.control.fails:
-            self._handle_ack_tuple(fail_tuple, False)
+          self._handle_ack_tuples(tuples.control.acks, True)
+          self._handle_ack_tuples(tuples.control.fails, False)
         else:
           Log.error("Received tuple neither data nor control")
       else:
-        Log.error("Received tuple not instance of HeronTupleSet")
+        Log.error("Received tuple not instance of HeronTupleSet or HeronTupleSet2")
 
       # avoid spending too much time here
       if time.time() - start_cycle_time - ack_batch_time > 0:
@@ -205,20 +220,25 @@ class SpoutInstance(BaseInstance):
 
     total_tuples_emitted_before = self.total_tuples_emitted
     total_data_emitted_bytes_before = self.get_total_data_emitted_in_bytes()
-    emit_batch_time = \
-      float(self.sys_config[constants.INSTANCE_EMIT_BATCH_TIME_MS]) * constants.MS_TO_SEC
-    emit_batch_size = int(self.sys_config[constants.INSTANCE_EMIT_BATCH_SIZE_BYTES])
+    emit_batch_time = self.batch_controller.emit_batch_time_sec
+    emit_batch_size = self.batch_controller.emit_batch_size_bytes
     start_cycle_time = time.time()
 
     while (self.acking_enabled and max_spout_pending > len(self.in_flight_tuples)) or \
         not self.acking_enabled:
-      start_time = time.time()
-      self.spout_impl.next_tuple()
-      next_tuple_latency_ns = (time.time() - start_time) * constants.SEC_TO_NS
-      self.spout_metrics.next_tuple(next_tuple_latency_ns)
+      # next_tuple() is timed only if sampled
+      if self.next_tuple_sampler.sample():
+        start_time = time.time()
+        self.spout_impl.next_tuple()
+        now = time.time()
+        self.spout_metrics.next_tuple((now - start_time) * constants.SEC_TO_NS)
+      else:
+        self.spout_impl.next_tuple()
+        now = time.time()
+        self.spout_metrics.next_tuple(None)
 
       if (self.total_tuples_emitted == total_tuples_emitted_before) or \
-        (time.time() - start_cycle_time - emit_batch_time > 0) or \
+        (now - start_cycle_time - emit_batch_time > 0) or \
         (self.get_total_data_emitted_in_bytes() - total_data_emitted_bytes_before >
          emit_batch_size):
         # no tuples to emit or batch reached
@@ -226,9 +246,12 @@ class SpoutInstance(BaseInstance):
 
       total_tuples_emitted_before = self.total_tuples_emitted
 
+    self.batch_controller.record_batch(time.time() - start_cycle_time)
+
   def _add_spout_task(self):
     Log.info("Adding spout task...")
     def spout_task():
+      """Produces tuples, and processes the acks and fails of the emitted ones"""
       # don't do anything when topology is paused
       if not self._is_topology_running():
         return
@@ -239,10 +262,13 @@ class SpoutInstance(BaseInstance):
         self.looper.wake_up() # so emitted tuples would be added to buffer now
       else:
         self.spout_metrics.update_out_queue_full_count()
+        self.batch_controller.record_out_queue_full()
 
       if self.acking_enabled:
         self._read_tuples_and_execute()
         self.spout_metrics.update_pending_tuples_count(len(self.in_flight_tuples))
+        self.spout_metrics.update_pending_table(self.in_flight_tuples.capacity,
+                                                self.in_flight_tuples.get_occupancy())
       else:
         self._do_immediate_acks()
 
@@ -292,47 +318,82 @@ class SpoutInstance(BaseInstance):
     spout_config = self.pplan_helper.context.get_cluster_config()
     timeout_sec = spout_config.get(constants.TOPOLOGY_MESSAGE_TIMEOUT_SECS)
     n_bucket = self.sys_config.get(constants.INSTANCE_ACKNOWLEDGEMENT_NBUCKETS)
-    now = time.time()
 
-    timeout_lst = []
-    for key, tuple_info in self.in_flight_tuples.iteritems():
-      if tuple_info.is_expired(now, timeout_sec):
-        timeout_lst.append(tuple_info)
-        self.in_flight_tuples.pop(key)
-      else:
-        # in_flight_tuples are ordered by insertion time
-        break
+    # expires the oldest bucket of the timing wheel
+    timeout_ns = timeout_sec * constants.SEC_TO_NS
+    expired = []
+    for stream_id, tuple_id, _ in self.in_flight_tuples.expire_bucket():
+      self.spout_metrics.timeout_tuple(stream_id)
+      expired.append((tuple_id, stream_id, timeout_ns))
 
-    for tuple_info in timeout_lst:
-      self.spout_metrics.timeout_tuple(tuple_info.stream_id)
-      self._invoke_fail(tuple_info.tuple_id, tuple_info.stream_id,
-                        timeout_sec * constants.SEC_TO_NS)
+    if self.fail_batch_enabled:
+      self._invoke_fail_batch(expired)
+    else:
+      for tuple_id, stream_id, latency_ns in expired:
+        self._invoke_fail(tuple_id, stream_id, latency_ns)
 
     # register this method to timer again
     self.looper.register_timer_task_in_sec(self._look_for_timeouts, float(timeout_sec) / n_bucket)
 
   # ACK/FAIL related
+  def _handle_ack_tuples(self, tups, is_success):
+    """Handles all acks (or fails) decoded from one control tuple set"""
+    if not tups:
+      return
+
+    if (is_success and not self.ack_batch_enabled) or \
+        (not is_success and not self.fail_batch_enabled):
+      for tup in tups:
+        self._handle_ack_tuple(tup, is_success)
+      return
+
+    completed = []
+    for tup in tups:
+      self._pop_completed_tuples(tup, completed)
+    if is_success:
+      self._invoke_ack_batch(completed)
+    else:
+      self._invoke_fail_batch(completed)
+
   def _handle_ack_tuple(self, tup, is_success):
+    completed = []
+    self._pop_completed_tuples(tup, completed)
+    for tuple_id, stream_id, latency_ns in completed:
+      if is_success:
+        self._invoke_ack(tuple_id, stream_id, latency_ns)
+      else:
+        self._invoke_fail(tuple_id, stream_id, latency_ns)
+
+  def _pop_completed_tuples(self, tup, completed):
+    """Removes the pending tuples to which an ack (or fail) tuple is anchored
+
+    ``(tuple_id, stream_id, latency_ns)`` of each removed tuple with a tuple id is appended to
+    ``completed``.
+    """
+    now = time.time()
     for rt in tup.roots:
       if rt.taskid != self.pplan_helper.my_task_id:
         raise RuntimeError("Receiving tuple for task: %s in task: %s"
                            % (str(rt.taskid), str(self.pplan_helper.my_task_id)))
-      try:
-        tuple_info = self.in_flight_tuples.pop(rt.key)
-      except KeyError:
+      pending = self.in_flight_tuples.pop(rt.key)
+      if pending is None:
         # rt.key is not in in_flight_tuples -> already removed due to time-out
         return
 
-      # pylint: disable=no-member
-      if tuple_info.tuple_id is not None:
-        latency_ns = (time.time() - tuple_info.insertion_time) * constants.SEC_TO_NS
-        if is_success:
-          self._invoke_ack(tuple_info.tuple_id, tuple_info.stream_id, latency_ns)
-        else:
-          self._invoke_fail(tuple_info.tuple_id, tuple_info.stream_id, latency_ns)
+      stream_id, tuple_id, insertion_time = pending
+      if tuple_id is not None:
+        completed.append((tuple_id, stream_id, (now - insertion_time) * constants.SEC_TO_NS))
 
   def _do_immediate_acks(self):
     size = len(self.immediate_acks)
+    if self.ack_batch_enabled:
+      completed = []
+      for _ in range(size):
+        tuple_info = self.immediate_acks.pop()
+        completed.append((tuple_info.tuple_id, tuple_info.stream_id, 0))
+      self._invoke_ack_batch(completed)
+      return
+
     for _ in range(size):
       tuple_info = self.immediate_acks.pop()
       self._invoke_ack(tuple_info.tuple_id, tuple_info.stream_id, 0)
@@ -348,3 +409,47 @@ class SpoutInstance(BaseInstance):
     self.spout_impl.fail(tuple_id)
     self.pplan_helper.context.invoke_hook_spout_fail(tuple_id, fail_latency_ns)
     self.spout_metrics.failed_tuple(stream_id, fail_latency_ns)
+
+  def _invoke_ack_batch(self, completed):
+    """Hands a batch of acked tuples to ``ack_batch()`` at once
+
+    :param completed: list of ``(tuple_id, stream_id, complete_latency_ns)``
+    """
+    if not completed:
+      return
+    tuple_ids, stream_ids, latencies_ns = zip(*completed)
+    Log.debug("In invoke_ack_batch(): Acking %d tuples" % len(tuple_ids))
+    self.spout_impl.ack_batch(list(tuple_ids))
+    context = self.pplan_helper.context
+    if context.hook_exists:
+      for tuple_id, latency_ns in zip(tuple_ids, latencies_ns):
+        context.invoke_hook_spout_ack(tuple_id, latency_ns)
+    for stream_id, stream_latencies_ns in _group_by_stream(stream_ids, latencies_ns).items():
+      self.spout_metrics.acked_tuple_batch(stream_id, stream_latencies_ns)
+
+  def _invoke_fail_batch(self, completed):
+    """Hands a batch of failed tuples to ``fail_batch()`` at once
+
+    :param completed: list of ``(tuple_id, stream_id, fail_latency_ns)``
+    """
+    if not completed:
+      return
+    tuple_ids, stream_ids, latencies_ns = zip(*completed)
+    Log.debug("In invoke_fail_batch(): Failing %d tuples" % len(tuple_ids))
+    self.spout_impl.fail_batch(list(tuple_ids))
+    context = self.pplan_helper.context
+    if context.hook_exists:
+      for tuple_id, latency_ns in zip(tuple_ids, latencies_ns):
+        context.invoke_hook_spout_fail(tuple_id, latency_ns)
+    for stream_id, stream_latencies_ns in _group_by_stream(stream_ids, latencies_ns).items():
+      self.spout_metrics.failed_tuple_batch(stream_id, stream_latencies_ns)
+
+def _group_by_stream(stream_ids, latencies_ns):
+  """Returns a dict of ``stream_id -> list of latencies in ns``"""
+  ret = {}
+  for stream_id, latency_ns in zip(stream_ids, latencies_ns):
+    if stream_id in ret:
+      ret[stream_id].append(latency_ns)
+    else:
+      ret[stream_id] = [latency_ns]
+  return ret
@@ -1,4 +1,5 @@
-'''single thread heron instance module'''
-__all__ = ['st_heron_instance.py', 'st_stmgr_client.py']
+'''heron instance module'''
+__all__ = ['st_heron_instance.py', 'mt_heron_instance.py', 'st_stmgr_client.py']
 
 from .st_heron_instance import SingleThreadHeronInstance
+from .mt_heron_instance import MultiThreadHeronInstance
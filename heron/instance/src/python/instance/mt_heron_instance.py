@@ -0,0 +1,89 @@
+# Copyright 2016 Twitter. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+'''module for two-thread (gateway and executor) Heron Instance in python'''
+import threading
+
+from heron.common.src.python.basics import GatewayLooper
+from heron.common.src.python.utils.log import Log
+from heron.common.src.python.utils.misc import create_communicator
+
+from .st_heron_instance import SingleThreadHeronInstance
+
+class MultiThreadHeronInstance(SingleThreadHeronInstance):
+  """Heron Instance running the gateway and the spout/bolt on separate threads
+
+  This mirrors the Gateway/Slave split of the Java instance. The gateway thread runs the looper
+  of ``SingleThreadHeronInstance``, which owns the Stream Manager and Metrics Manager clients
+  and encodes/decodes protobuf messages of the sockets. The executor thread runs the spout or
+  bolt on its own looper. They hand off tuples and metrics through thread-safe communicators,
+  each of which wakes up the consumer's looper when an item is offered, and the producer's
+  looper when items are polled (e.g. when a full out stream is drained).
+
+  Messages from the Stream Manager that change the spout/bolt (new assignment and state change)
+  are also passed to the executor thread, so the spout/bolt is only touched by that thread.
+  User code that releases the GIL can then overlap with network I/O.
+  """
+  def __init__(self, *args, **kwargs):
+    super(MultiThreadHeronInstance, self).__init__(*args, **kwargs)
+    # functions called on the executor thread
+    self._executor_tasks = create_communicator(consumer_cb=self.executor_looper.wake_up)
+    self.executor_looper.add_wakeup_task(self._run_executor_tasks)
+    self._executor_thread = threading.Thread(target=self.executor_looper.loop,
+                                             name="heron-executor")
+    self._executor_thread.daemon = True
+
+    # exiting either of the loopers makes the other exit, which is safe even if the other has
+    # already exited, as waking up an exited looper is a no-op
+    self.looper.add_exit_task(self.executor_looper.exit_loop)
+    self.executor_looper.add_exit_task(self.looper.exit_loop)
+
+  def _create_executor_looper(self):
+    """Returns a looper without sockets, which waits only for wake ups and timers"""
+    return GatewayLooper(dict())
+
+  @staticmethod
+  def _create_stream(producer, consumer):
+    return create_communicator(producer_cb=producer.wake_up, consumer_cb=consumer.wake_up)
+
+  def start(self):
+    Log.info("Starting executor thread")
+    self._executor_thread.start()
+    super(MultiThreadHeronInstance, self).start()
+
+  def handle_new_tuple_set(self, tuple_msg_set):
+    """Called on the gateway thread when new TupleMessage arrives
+
+    The tuple set is processed on the executor thread, which is woken up by the in stream.
+    """
+    self.in_stream.offer(tuple_msg_set)
+
+  def handle_new_tuple_set_2(self, hts2):
+    """Called on the gateway thread when new HeronTupleSet2 arrives"""
+    self.in_stream.offer(hts2)
+
+  def handle_state_change_msg(self, new_helper):
+    """Called on the gateway thread; the state change is handled on the executor thread"""
+    parent = super(MultiThreadHeronInstance, self)
+    self._executor_tasks.offer(lambda: parent.handle_state_change_msg(new_helper))
+
+  def handle_assignment_msg(self, pplan_helper):
+    """Called on the gateway thread; the spout/bolt is created on the executor thread"""
+    parent = super(MultiThreadHeronInstance, self)
+    self._executor_tasks.offer(lambda: parent.handle_assignment_msg(pplan_helper))
+
+  def _run_executor_tasks(self):
+    """Wakeup task of the executor looper"""
+    for task in self._executor_tasks.drain():
+      task()
+    self._process_in_stream()
@@ -24,10 +24,10 @@ from heron.common.src.python.basics import GatewayLooper
 from heron.common.src.python.config import system_config
 from heron.common.src.python.utils import log
 from heron.common.src.python.utils.metrics import GatewayMetrics, PyMetrics, MetricsCollector
-from heron.common.src.python.utils.misc import HeronCommunicator
+from heron.common.src.python.utils.misc import create_communicator
 from heron.common.src.python.network import create_socket_options
 
-from heron.proto import physical_plan_pb2, tuple_pb2
+from heron.proto import physical_plan_pb2
 from heron.instance.src.python.network import MetricsManagerClient, SingleThreadStmgrClient
 from heron.instance.src.python.basics import SpoutInstance, BoltInstance
 
@@ -52,30 +52,38 @@ class SingleThreadHeronInstance(object):
     self.topo_pex_file_abs_path = os.path.abspath(topo_pex_file_path)
     self.sys_config = system_config.get_sys_config()
 
-    self.in_stream = HeronCommunicator(producer_cb=None, consumer_cb=None)
-    self.out_stream = HeronCommunicator(producer_cb=None, consumer_cb=None)
-
     self.socket_map = dict()
     self.looper = GatewayLooper(self.socket_map)
+    # looper on which the spout/bolt runs
+    self.executor_looper = self._create_executor_looper()
+
+    # in stream: gateway -> spout/bolt, out stream: spout/bolt -> gateway
+    self.in_stream = self._create_stream(producer=self.looper, consumer=self.executor_looper)
+    self.out_stream = self._create_stream(producer=self.executor_looper, consumer=self.looper)
 
     # Initialize metrics related
-    self.out_metrics = HeronCommunicator()
+    self.out_metrics = self._create_stream(producer=self.executor_looper, consumer=self.looper)
     self.out_metrics.\
       register_capacity(self.sys_config[constants.INSTANCE_INTERNAL_METRICS_WRITE_QUEUE_CAPACITY])
     self.metrics_collector = MetricsCollector(self.looper, self.out_metrics)
+    # metrics of the spout/bolt are collected on the looper on which it runs
+    if self.executor_looper is self.looper:
+      self.executor_metrics_collector = self.metrics_collector
+    else:
+      self.executor_metrics_collector = MetricsCollector(self.executor_looper, self.out_metrics)
     self.gateway_metrics = GatewayMetrics(self.metrics_collector)
     self.py_metrics = PyMetrics(self.metrics_collector)
 
     # Create socket options and socket clients
-    socket_options = create_socket_options()
+    self.socket_options = create_socket_options()
     self._stmgr_client = \
       SingleThreadStmgrClient(self.looper, self, self.STREAM_MGR_HOST, stream_port,
                               topology_name, topology_id, instance, self.socket_map,
-                              self.gateway_metrics, socket_options)
+                              self.gateway_metrics, self.socket_options)
     self._metrics_client = \
       MetricsManagerClient(self.looper, self.METRICS_MGR_HOST, metrics_port, instance,
-                           self.out_metrics, self.in_stream, self.out_stream,
-                           self.socket_map, socket_options, self.gateway_metrics, self.py_metrics)
+                           self.out_metrics, self.in_stream, self.out_stream, self.socket_map,
+                           self.socket_options, self.gateway_metrics, self.py_metrics)
     self.my_pplan_helper = None
 
     # my_instance is a AssignedInstance tuple
@@ -89,11 +97,27 @@ class SingleThreadHeronInstance(object):
       self.looper.register_timer_task_in_sec(self.looper.exit_loop, 0.0)
     signal.signal(signal.SIGUSR1, go_trace)
 
+  def _create_executor_looper(self):
+    """Returns the looper on which the spout/bolt runs, which is the gateway looper"""
+    return self.looper
+
+  # pylint: disable=unused-argument
+  @staticmethod
+  def _create_stream(producer, consumer):
+    """Returns a communicator from a looper to another
+
+    Both loopers are the same in single thread mode, so no callback is needed.
+    """
+    return create_communicator(producer_cb=None, consumer_cb=None)
+
   def start(self):
     self._stmgr_client.start_connect()
     self._metrics_client.start_connect()
     # call send_buffered_messages every time it is waken up
     self.looper.add_wakeup_task(self.send_buffered_messages)
+    if self.executor_looper is self.looper:
+      # the bolt runs on this looper, so it goes on with the tuples left in the in stream here
+      self.looper.add_wakeup_task(self._process_in_stream)
     self.looper.loop()
 
   def handle_new_tuple_set(self, tuple_msg_set):
@@ -111,34 +135,51 @@ class SingleThreadHeronInstance(object):
 
   def handle_new_tuple_set_2(self, hts2):
     """Called when new HeronTupleSet2 arrives
-       Convert(Assemble) HeronTupleSet2(raw byte array) to HeronTupleSet
-       See more at GitHub PR #1421
-    :param tuple_msg_set: HeronTupleSet2 type
+
+    HeronTupleSet2 is offered to the in_stream as is. Data tuples in it are kept as raw bytes,
+    and are deserialized only when they are read by the bolt. See more at GitHub PR #1421
+
+    :param hts2: HeronTupleSet2 type
     """
     if self.my_pplan_helper is None or self.my_instance is None:
       Log.error("Got tuple set when no instance assigned yet")
     else:
-      hts = tuple_pb2.HeronTupleSet()
-      if hts2.HasField('control'):
-        hts.control.CopyFrom(hts2.control)
-      else:
-        hdts = tuple_pb2.HeronDataTupleSet()
-        hdts.stream.CopyFrom(hts2.data.stream)
-        try:
-          for trunk in hts2.data.tuples:
-            added_tuple = hdts.tuples.add()
-            added_tuple.ParseFromString(trunk)
-        except Exception:
-          Log.exception('Fail to deserialize HeronDataTuple')
-        hts.data.CopyFrom(hdts)
-      self.in_stream.offer(hts)
+      self.in_stream.offer(hts2)
       if self.my_pplan_helper.is_topology_running():
         self.my_instance.py_class.process_incoming_tuples()
 
+  def is_in_stream_full(self):
+    """Returns whether the in stream is at its capacity while the spout/bolt is consuming it
+
+    The Stream Manager client stops reading while this is ``True``, so that the in stream is
+    bounded. Reading goes on while the topology is not running, as a state change message must
+    not be blocked behind tuples that are not consumed until the state changes.
+    """
+    return self.my_pplan_helper is not None and self.my_pplan_helper.is_topology_running() \
+      and self.in_stream.get_available_capacity() == 0
+
+  def _process_in_stream(self):
+    """Hands the tuples left in the in stream to the bolt, on the looper on which it runs
+
+    The bolt stops reading the in stream at the end of a batch, or while its out queue is full.
+    The tuples left are not processed by the arrival of new tuple sets, as the Stream Manager
+    client stops reading while the in stream is full, so they are processed here instead.
+    """
+    # spouts read the in stream in their own wakeup task
+    if self.my_instance is None or self.my_instance.is_spout or not self.is_instance_started:
+      return
+
+    if self.my_pplan_helper.is_topology_running() and not self.in_stream.is_empty():
+      bolt = self.my_instance.py_class
+      bolt.process_incoming_tuples()
+      if not self.in_stream.is_empty() and bolt.output_helper.is_out_queue_available() \
+          and not bolt.is_process_pool_full():
+        # batch reached, continue in the next loop
+        self.executor_looper.wake_up()
+
   def send_buffered_messages(self):
     """Send messages in out_stream to the Stream Manager"""
-    while not self.out_stream.is_empty():
-      tuple_set = self.out_stream.poll()
+    for tuple_set in self.out_stream.drain():
       self.gateway_metrics.update_sent_packet(tuple_set.ByteSize())
       self._stmgr_client.send_message(tuple_set)
 
@@ -172,7 +213,7 @@ class SingleThreadHeronInstance(object):
     """
 
     self.my_pplan_helper = pplan_helper
-    self.my_pplan_helper.set_topology_context(self.metrics_collector)
+    self.my_pplan_helper.set_topology_context(self.executor_metrics_collector)
 
     if pplan_helper.is_spout:
       # Starting a spout
@@ -186,7 +227,7 @@ class SingleThreadHeronInstance(object):
         register_capacity(self.sys_config[constants.INSTANCE_INTERNAL_SPOUT_WRITE_QUEUE_CAPACITY])
 
       py_spout_instance = SpoutInstance(self.my_pplan_helper, self.in_stream, self.out_stream,
-                                        self.looper)
+                                        self.executor_looper)
       self.my_instance = AssignedInstance(is_spout=True,
                                           protobuf=my_spout,
                                           py_class=py_spout_instance)
@@ -202,11 +243,14 @@ class SingleThreadHeronInstance(object):
         register_capacity(self.sys_config[constants.INSTANCE_INTERNAL_BOLT_WRITE_QUEUE_CAPACITY])
 
       py_bolt_instance = BoltInstance(self.my_pplan_helper, self.in_stream, self.out_stream,
-                                      self.looper)
+                                      self.executor_looper)
       self.my_instance = AssignedInstance(is_spout=False,
                                           protobuf=my_bolt,
                                           py_class=py_bolt_instance)
 
+    # network batch limits to/from the stream manager follow the batch limits of the instance
+    self.my_instance.py_class.batch_controller.add_listener(self._apply_network_batch_limits)
+
     if pplan_helper.is_topology_running():
       try:
         self.start_instance()
@@ -216,6 +260,9 @@ class SingleThreadHeronInstance(object):
     else:
       Log.info("The instance is deployed in deactivated state")
 
+  def _apply_network_batch_limits(self, batch_controller):
+    self._stmgr_client.socket_options = batch_controller.scale_socket_options(self.socket_options)
+
   def start_instance(self):
     try:
       Log.info("Starting bolt/spout instance now...")
@@ -291,8 +338,16 @@ def main():
            "\n **Topology Pex file located at: " + topology_pex_file_path)
   Log.debug("System config: " + str(sys_config))
 
-  heron_instance = SingleThreadHeronInstance(topology_name, topology_id, instance, stmgr_port,
-                                             metrics_port, topology_pex_file_path)
+  if sys_config.get(constants.INSTANCE_PYTHON_EXECUTOR_THREAD, False):
+    # pylint: disable=cyclic-import
+    from heron.instance.src.python.instance.mt_heron_instance import MultiThreadHeronInstance
+    instance_cls = MultiThreadHeronInstance
+  else:
+    instance_cls = SingleThreadHeronInstance
+  Log.info("Running as %s" % instance_cls.__name__)
+
+  heron_instance = instance_cls(topology_name, topology_id, instance, stmgr_port,
+                                metrics_port, topology_pex_file_path)
   heron_instance.start()
 
 if __name__ == '__main__':
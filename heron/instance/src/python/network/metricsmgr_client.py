@@ -58,8 +58,7 @@ class MetricsManagerClient(HeronClient):
 
   def _send_metrics_messages(self):
     if self.connected:
-      while not self.out_queue.is_empty():
-        message = self.out_queue.poll()
+      for message in self.out_queue.drain():
         assert isinstance(message, metrics_pb2.MetricPublisherPublishMessage)
         Log.debug("Sending metric message: %s" % str(message))
         self.send_message(message)
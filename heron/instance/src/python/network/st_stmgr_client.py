@@ -43,6 +43,14 @@ class SingleThreadStmgrClient(HeronClient):
     self._pplan_helper = None
     self.sys_config = system_config.get_sys_config()
 
+  def readable(self):
+    """Stops reading from the Stream Manager while the in stream of the instance is full
+
+    The instance keeps handing the tuples left in the in stream to the bolt every time the looper
+    wakes up, so reading resumes once the bolt catches up.
+    """
+    return not self.heron_instance_cls.is_in_stream_full()
+
   # send register request
   def on_connect(self, status):
     Log.debug("In on_connect of STStmgrClient")
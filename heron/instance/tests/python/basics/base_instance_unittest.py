@@ -0,0 +1,32 @@
+# Copyright 2016 Twitter. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# pylint: disable=missing-docstring
+import unittest
+
+from heron.instance.src.python.basics.base_instance import LatencySampler
+
+class LatencySamplerTest(unittest.TestCase):
+  def test_every_tuple(self):
+    sampler = LatencySampler(1)
+    self.assertEqual([sampler.sample() for _ in range(10)], [1] * 10)
+
+  def test_sampling(self):
+    sampler = LatencySampler(10)
+    weights = [sampler.sample() for _ in range(100000)]
+    self.assertEqual(set(weights), set([0, 10]))
+    # the first tuple is always measured
+    self.assertEqual(weights[0], 10)
+    # the total weight estimates the number of tuples
+    self.assertAlmostEqual(sum(weights) / 100000.0, 1.0, delta=0.05)
@@ -16,6 +16,33 @@
 # pylint: disable=protected-access
 import unittest
 
+from mock import Mock
+
+from heron.common.src.python.utils.misc import PythonSerializer
+from heron.common.src.python.utils.topology import TopologyContext
+from heron.instance.src.python.basics.bolt_instance import BoltInstance
+
 class BoltInstanceTest(unittest.TestCase):
   def setUp(self):
-    pass
+    self.bolt = Mock()
+    self.bolt.serializer = PythonSerializer()
+    self.bolt.stream_serializers = {}
+    self.bolt.whole_tuple_serialization = True
+    self.bolt.pplan_helper.context = {
+        TopologyContext.COMPONENT_TO_OUT_FIELDS: {"spout": {"one": ("word",),
+                                                            "two": ("word", "count")}}}
+
+  def make_values_deserializer(self, stream_id):
+    return BoltInstance._make_values_deserializer.__func__(self.bolt, "spout", stream_id)
+
+  def test_whole_tuple_deserializer(self):
+    serializer = self.bolt.serializer
+    deserialize = self.make_values_deserializer("two")
+    self.assertEqual(deserialize([serializer.serialize_tuple(["a", 1])]), ["a", 1])
+    self.assertEqual(deserialize(serializer.serialize_values(["a", 1])), ["a", 1])
+
+  def test_one_field_deserializer(self):
+    serializer = self.bolt.serializer
+    for stream_id in ("one", "unknown"):
+      deserialize = self.make_values_deserializer(stream_id)
+      self.assertEqual(deserialize(serializer.serialize_values([("a", 1)])), [("a", 1)])
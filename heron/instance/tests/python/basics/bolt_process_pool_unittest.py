@@ -0,0 +1,161 @@
+# Copyright 2016 Twitter. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# pylint: disable=missing-docstring
+# pylint: disable=protected-access
+import os
+import socket
+import threading
+import time
+import unittest
+
+from heron.common.src.python.utils.tuple import HeronTuple, TupleHelper
+from heron.instance.src.python.basics.bolt_process_pool import (BoltProcessPool,
+                                                                EMIT, ACK, FAIL, LOG)
+
+# pylint: disable=unused-argument
+class SleepingBolt(object):
+  """Emits the value of a tuple after sleeping for that many ms, anchored and acked"""
+  def __init__(self, delegate):
+    self.delegate = delegate
+    self.prefix = None
+
+  def initialize(self, config, context):
+    self.prefix = config["prefix"]
+
+  def process(self, tup):
+    value = tup.values[0]
+    if value < 0:
+      raise ValueError("negative value")
+    time.sleep(value / 1000.0)
+    self.delegate.emit([self.prefix + str(value)], anchors=[tup])
+    if value % 2 == 0:
+      self.delegate.ack(tup)
+    else:
+      self.delegate.fail(tup)
+
+  def process_tick(self, tup):
+    self.delegate.log("tick", "info")
+
+def make_tuple(value):
+  return HeronTuple(id=value, component="spout", stream="default", task=1, values=[value],
+                    creation_time=time.time(), roots=["root-%d" % value])
+
+class BoltProcessPoolTest(unittest.TestCase):
+  def setUp(self):
+    self.woken_up = threading.Event()
+    self.pool = None
+
+  def tearDown(self):
+    if self.pool is not None:
+      self.pool.stop()
+
+  def start_pool(self, **kwargs):
+    self.pool = BoltProcessPool(SleepingBolt, 2, **kwargs)
+    self.pool.start({"prefix": "v"}, None, self.woken_up.set)
+
+  def poll_results(self, expected):
+    results = []
+    deadline = time.time() + 10
+    while len(results) < expected and time.time() < deadline:
+      self.woken_up.wait(0.1)
+      self.woken_up.clear()
+      results.extend(self.pool.poll_results())
+    return results
+
+  def test_ordered_results(self):
+    self.start_pool(ordered=True)
+    tuples = [make_tuple(value) for value in [200, 0, 2, 100]]
+    seqs = [self.pool.submit(tup) for tup in tuples]
+    self.assertEqual(seqs, [0, 1, 2, 3])
+
+    results = self.poll_results(4)
+    self.assertEqual([seq for seq, _, _, _ in results], seqs)
+    for (seq, tup, actions, _), expected in zip(results, tuples):
+      self.assertIs(tup, expected)
+      value = expected.values[0]
+      self.assertEqual(actions, [(EMIT, ("v%d" % value,), "default", [seq], None),
+                                 (ACK, seq) if value % 2 == 0 else (FAIL, seq)])
+      # the original tuple is kept until acked
+      self.assertIs(self.pool.pop_tuple(seq), expected)
+    self.assertFalse(self.pool.is_full())
+
+  def test_unordered_results(self):
+    self.start_pool(ordered=False)
+    self.pool.submit(make_tuple(300))
+    self.pool.submit(make_tuple(0))
+    results = self.poll_results(2)
+    self.assertEqual([seq for seq, _, _, _ in results], [1, 0])
+
+  def test_release(self):
+    self.start_pool(keep_until_acked=False, max_pending_per_worker=1)
+    seq = self.pool.submit(make_tuple(0))
+    self.pool.submit(make_tuple(0))
+    self.assertTrue(self.pool.is_full())
+    self.poll_results(2)
+    self.assertFalse(self.pool.is_full())
+    self.pool.release(seq)
+    self.assertIsNone(self.pool.get_tuple(seq))
+
+  def test_expire_tuples(self):
+    self.start_pool(keep_until_acked=True, tuple_timeout_sec=0.5)
+    acked_seq = self.pool.submit(make_tuple(0))
+    dropped_seq = self.pool.submit(make_tuple(1))
+    self.poll_results(2)
+    self.pool.pop_tuple(acked_seq)
+    self.assertEqual(self.pool.expire_tuples(), 0)
+    self.assertIsNotNone(self.pool.get_tuple(dropped_seq))
+
+    time.sleep(0.6)
+    self.assertEqual(self.pool.expire_tuples(), 1)
+    self.assertIsNone(self.pool.get_tuple(dropped_seq))
+
+  def test_tick(self):
+    self.start_pool()
+    self.pool.broadcast_tick(TupleHelper.make_tick_tuple())
+    results = self.poll_results(2)
+    self.assertEqual(results, [(None, None, [(LOG, "tick", "info")], results[0][3]),
+                               (None, None, [(LOG, "tick", "info")], results[1][3])])
+
+  def test_error(self):
+    self.start_pool()
+    self.pool.submit(make_tuple(-1))
+    self.woken_up.wait(10)
+    with self.assertRaises(RuntimeError):
+      self.pool.poll_results()
+
+  def test_dead_worker(self):
+    self.start_pool()
+    self.pool.check_workers()
+    self.pool.workers[1].process.terminate()
+    self.pool.workers[1].process.join(5)
+    with self.assertRaises(RuntimeError):
+      self.pool.check_workers()
+
+  @unittest.skipUnless(os.path.isdir("/proc/self/fd"), "needs /proc")
+  def test_workers_close_inherited_sockets(self):
+    local, remote = socket.socketpair()
+    self.addCleanup(local.close)
+    self.addCleanup(remote.close)
+    self.start_pool()
+    # workers close the sockets before processing any tuple
+    for value in range(4):
+      self.pool.submit(make_tuple(value))
+    self.assertEqual(len(self.poll_results(4)), 4)
+
+    inherited = set("socket:[%d]" % os.fstat(sock.fileno()).st_ino for sock in (local, remote))
+    for worker in self.pool.workers:
+      fd_dir = "/proc/%d/fd" % worker.process.pid
+      links = set(os.readlink(os.path.join(fd_dir, fd)) for fd in os.listdir(fd_dir))
+      self.assertFalse(links & inherited)
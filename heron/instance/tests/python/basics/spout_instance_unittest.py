@@ -0,0 +1,116 @@
+# Copyright 2016 Twitter. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# pylint: disable=missing-docstring
+# pylint: disable=protected-access
+import time
+import unittest
+
+from mock import Mock
+
+from heron.common.src.python.utils.metrics import SpoutMetrics
+from heron.common.src.python.utils.misc import PendingTupleTable
+from heron.instance.src.python.basics.spout_instance import SpoutInstance
+from heron.proto import tuple_pb2
+
+TASK_ID = 1
+
+class SpoutInstanceAckTest(unittest.TestCase):
+  def setUp(self):
+    spout = SpoutInstance.__new__(SpoutInstance)
+    spout.pplan_helper = Mock(my_task_id=TASK_ID)
+    spout.pplan_helper.get_my_spout.return_value.outputs = []
+    spout.spout_metrics = SpoutMetrics(spout.pplan_helper)
+    spout.in_flight_tuples = PendingTupleTable()
+    spout.spout_impl = Mock()
+    spout.ack_batch_enabled = True
+    spout.fail_batch_enabled = True
+    self.spout = spout
+    self.get_metric_values()
+
+  def get_metric_values(self, *names):
+    """Returns the values of given metrics, resetting all of them"""
+    metrics = self.spout.spout_metrics.metrics
+    values = dict((name, metric.get_value_and_reset()) for name, metric in metrics.items())
+    return [values[name] for name in names]
+
+  def make_ack_tuples(self, latencies_sec, stream_id="stream"):
+    """Adds pending tuples emitted ``latencies_sec`` ago, and returns acks for them"""
+    now = time.time()
+    tups = []
+    for i, latency_sec in enumerate(latencies_sec):
+      key = self.spout.in_flight_tuples.add(stream_id, "%s%d" % (stream_id, i),
+                                            insertion_time=now - latency_sec)
+      tup = tuple_pb2.AckTuple()
+      tup.ackedtuple = key
+      root = tup.roots.add()
+      root.taskid = TASK_ID
+      root.key = key
+      tups.append(tup)
+    return tups
+
+  def test_ack_batch(self):
+    self.spout._handle_ack_tuples(self.make_ack_tuples([1]), True)
+    self.spout._handle_ack_tuples(self.make_ack_tuples([2, 2, 6]) +
+                                  self.make_ack_tuples([5], stream_id="other"), True)
+
+    spout_impl = self.spout.spout_impl
+    self.assertEqual(spout_impl.ack_batch.call_count, 2)
+    self.assertEqual(sorted(spout_impl.ack_batch.call_args[0][0]),
+                     ["other0", "stream0", "stream1", "stream2"])
+    self.assertFalse(spout_impl.ack.called)
+    self.assertEqual(len(self.spout.in_flight_tuples), 0)
+    # task hooks still see every tuple
+    self.assertEqual(self.spout.pplan_helper.context.invoke_hook_spout_ack.call_count, 5)
+
+    ack_count, complete_latency, histogram = self.get_metric_values(
+        SpoutMetrics.ACK_COUNT, SpoutMetrics.COMPLETE_LATENCY,
+        SpoutMetrics.COMPLETE_LATENCY_HISTOGRAM)
+    self.assertEqual(ack_count["stream"], 4)
+    self.assertEqual(ack_count["other"], 1)
+    # each tuple weighs the same in the mean, regardless of the size of its batch
+    self.assertAlmostEqual(complete_latency["stream"], 2.75e9, delta=0.1e9)
+    self.assertAlmostEqual(complete_latency["other"], 5e9, delta=0.1e9)
+    # and the latency of each tuple is recorded in the histogram
+    self.assertAlmostEqual(histogram["stream"]["max"], 6e9, delta=0.1e9)
+    self.assertAlmostEqual(histogram["stream"]["p50"], 2e9, delta=0.1e9)
+
+  def test_fail_batch(self):
+    self.spout._handle_ack_tuples(self.make_ack_tuples([1]), False)
+    self.spout._handle_ack_tuples(self.make_ack_tuples([2, 2, 6]), False)
+
+    spout_impl = self.spout.spout_impl
+    self.assertEqual(spout_impl.fail_batch.call_count, 2)
+    self.assertEqual(sorted(spout_impl.fail_batch.call_args[0][0]),
+                     ["stream0", "stream1", "stream2"])
+    self.assertFalse(spout_impl.fail.called)
+    self.assertEqual(self.spout.pplan_helper.context.invoke_hook_spout_fail.call_count, 4)
+
+    fail_count, fail_latency = self.get_metric_values(SpoutMetrics.FAIL_COUNT,
+                                                      SpoutMetrics.FAIL_LATENCY)
+    self.assertEqual(fail_count["stream"], 4)
+    self.assertAlmostEqual(fail_latency["stream"], 2.75e9, delta=0.1e9)
+
+  def test_ack_without_batch(self):
+    self.spout.ack_batch_enabled = False
+    self.spout._handle_ack_tuples(self.make_ack_tuples([1, 3]), True)
+
+    spout_impl = self.spout.spout_impl
+    self.assertFalse(spout_impl.ack_batch.called)
+    self.assertEqual([args[0][0] for args in spout_impl.ack.call_args_list],
+                     ["stream0", "stream1"])
+    ack_count, complete_latency = self.get_metric_values(SpoutMetrics.ACK_COUNT,
+                                                         SpoutMetrics.COMPLETE_LATENCY)
+    self.assertEqual(ack_count["stream"], 2)
+    self.assertAlmostEqual(complete_latency["stream"], 2e9, delta=0.1e9)
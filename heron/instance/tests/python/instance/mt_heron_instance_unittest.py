@@ -0,0 +1,110 @@
+# Copyright 2016 Twitter. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# pylint: disable=missing-docstring
+# pylint: disable=protected-access
+import select
+import threading
+import unittest
+from mock import Mock, patch
+
+from heron.common.src.python.utils.misc import HeronCommunicator
+from heron.instance.src.python.instance import MultiThreadHeronInstance
+from heron.proto import physical_plan_pb2
+
+import heron.common.src.python.constants as constants
+
+class MultiThreadHeronInstanceTest(unittest.TestCase):
+  sys_config = {constants.HERON_METRICS_EXPORT_INTERVAL_SEC: 60,
+                constants.INSTANCE_INTERNAL_METRICS_WRITE_QUEUE_CAPACITY: 10,
+                constants.INSTANCE_NETWORK_WRITE_BATCH_SIZE_BYTES: 1024,
+                constants.INSTANCE_NETWORK_WRITE_BATCH_TIME_MS: 16,
+                constants.INSTANCE_NETWORK_READ_BATCH_SIZE_BYTES: 1024,
+                constants.INSTANCE_NETWORK_READ_BATCH_TIME_MS: 16,
+                constants.INSTANCE_NETWORK_OPTIONS_SOCKET_RECEIVED_BUFFER_SIZE_BYTES: 1024,
+                constants.INSTANCE_NETWORK_OPTIONS_SOCKET_SEND_BUFFER_SIZE_BYTES: 1024,
+                constants.INSTANCE_RECONNECT_STREAMMGR_INTERVAL_SEC: 1,
+                constants.INSTANCE_RECONNECT_METRICSMGR_INTERVAL_SEC: 1,
+                constants.INSTANCE_METRICS_SYSTEM_SAMPLE_INTERVAL_SEC: 10}
+
+  def setUp(self):
+    with patch("heron.common.src.python.config.system_config.get_sys_config",
+               side_effect=lambda: self.sys_config):
+      self.heron_instance = MultiThreadHeronInstance("topology_name", "topology_id",
+                                                     physical_plan_pb2.Instance(),
+                                                     8080, 8081, "topology.pex")
+    self.heron_instance._executor_thread.start()
+
+  def tearDown(self):
+    if not self.heron_instance.executor_looper.should_exit:
+      self.heron_instance.executor_looper.exit_loop()
+    self.heron_instance._executor_thread.join(5)
+    self.assertFalse(self.heron_instance._executor_thread.is_alive())
+    # closes the wake up pipe of the gateway looper
+    self.heron_instance.looper.on_exit()
+    self.heron_instance = None
+
+  def test_streams(self):
+    heron_instance = self.heron_instance
+    self.assertIsNot(heron_instance.executor_looper, heron_instance.looper)
+    self.assertIsNot(heron_instance.executor_metrics_collector, heron_instance.metrics_collector)
+    for stream in (heron_instance.in_stream, heron_instance.out_stream,
+                   heron_instance.out_metrics):
+      self.assertIsInstance(stream, HeronCommunicator)
+
+  def test_executor_thread(self):
+    executed = threading.Event()
+    thread_names = []
+    def task():
+      thread_names.append(threading.current_thread().name)
+      executed.set()
+
+    self.heron_instance._executor_tasks.offer(task)
+    executed.wait(5)
+    self.assertEqual(thread_names, [self.heron_instance._executor_thread.name])
+
+    # exiting the executor makes the gateway exit
+    self.heron_instance.executor_looper.exit_loop()
+    self.heron_instance._executor_thread.join(5)
+    self.assertTrue(self.heron_instance.looper.should_exit)
+
+  def test_tuple_sets_are_handed_off(self):
+    # no spout/bolt is assigned yet, so tuple sets stay in the in stream
+    self.heron_instance.handle_new_tuple_set("tuple_set")
+    self.heron_instance.handle_new_tuple_set_2("tuple_set_2")
+    self.assertEqual(self.heron_instance.in_stream.drain(), ["tuple_set", "tuple_set_2"])
+
+  def test_in_stream_is_bounded(self):
+    heron_instance = self.heron_instance
+    looper = heron_instance.looper
+    stmgr_client = heron_instance._stmgr_client
+    heron_instance.in_stream.register_capacity(2)
+    heron_instance.my_pplan_helper = Mock()
+    heron_instance.my_pplan_helper.is_topology_running.return_value = True
+
+    heron_instance.handle_new_tuple_set("tuple_set")
+    self.assertTrue(stmgr_client.readable())
+    heron_instance.handle_new_tuple_set("tuple_set")
+    self.assertFalse(stmgr_client.readable())
+
+    # reading goes on while the topology is not running
+    heron_instance.my_pplan_helper.is_topology_running.return_value = False
+    self.assertTrue(stmgr_client.readable())
+    heron_instance.my_pplan_helper.is_topology_running.return_value = True
+
+    # draining the in stream wakes up the gateway, which then reads again
+    looper._drain_wakeup_pipe()
+    heron_instance.in_stream.drain()
+    self.assertEqual(select.select([looper.pipe_r], [], [], 0)[0], [looper.pipe_r])
+    self.assertTrue(stmgr_client.readable())
@@ -0,0 +1,93 @@
+# Copyright 2016 Twitter. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# pylint: disable=missing-docstring
+# pylint: disable=protected-access
+import unittest
+from mock import Mock, patch
+
+from heron.instance.src.python.instance import SingleThreadHeronInstance
+from heron.instance.src.python.instance.st_heron_instance import AssignedInstance
+from heron.proto import physical_plan_pb2
+
+import heron.common.src.python.constants as constants
+
+class SingleThreadHeronInstanceTest(unittest.TestCase):
+  sys_config = {constants.HERON_METRICS_EXPORT_INTERVAL_SEC: 60,
+                constants.INSTANCE_INTERNAL_METRICS_WRITE_QUEUE_CAPACITY: 10,
+                constants.INSTANCE_NETWORK_WRITE_BATCH_SIZE_BYTES: 1024,
+                constants.INSTANCE_NETWORK_WRITE_BATCH_TIME_MS: 16,
+                constants.INSTANCE_NETWORK_READ_BATCH_SIZE_BYTES: 1024,
+                constants.INSTANCE_NETWORK_READ_BATCH_TIME_MS: 16,
+                constants.INSTANCE_NETWORK_OPTIONS_SOCKET_RECEIVED_BUFFER_SIZE_BYTES: 1024,
+                constants.INSTANCE_NETWORK_OPTIONS_SOCKET_SEND_BUFFER_SIZE_BYTES: 1024,
+                constants.INSTANCE_RECONNECT_STREAMMGR_INTERVAL_SEC: 1,
+                constants.INSTANCE_RECONNECT_METRICSMGR_INTERVAL_SEC: 1,
+                constants.INSTANCE_METRICS_SYSTEM_SAMPLE_INTERVAL_SEC: 10}
+
+  def setUp(self):
+    with patch("heron.common.src.python.config.system_config.get_sys_config",
+               side_effect=lambda: self.sys_config):
+      self.heron_instance = SingleThreadHeronInstance("topology_name", "topology_id",
+                                                      physical_plan_pb2.Instance(),
+                                                      8080, 8081, "topology.pex")
+
+  def tearDown(self):
+    # closes the wake up pipe of the looper
+    self.heron_instance.looper.on_exit()
+    self.heron_instance = None
+
+  def make_bolt(self):
+    """Returns a bolt reading one tuple set per batch, while its out queue is available"""
+    bolt = Mock()
+    bolt.is_process_pool_full.return_value = False
+    bolt.output_helper.is_out_queue_available.return_value = False
+    def process_incoming_tuples():
+      if bolt.output_helper.is_out_queue_available():
+        self.heron_instance.in_stream.poll()
+    bolt.process_incoming_tuples.side_effect = process_incoming_tuples
+    return bolt
+
+  def test_in_stream_drains_after_back_pressure(self):
+    heron_instance = self.heron_instance
+    looper = heron_instance.looper
+    stmgr_client = heron_instance._stmgr_client
+    with patch.object(stmgr_client, "start_connect"), \
+         patch.object(heron_instance._metrics_client, "start_connect"), \
+         patch.object(looper, "loop"):
+      heron_instance.start()
+
+    heron_instance.in_stream.register_capacity(2)
+    heron_instance.my_pplan_helper = Mock()
+    heron_instance.my_pplan_helper.is_topology_running.return_value = True
+    bolt = self.make_bolt()
+    heron_instance.my_instance = AssignedInstance(is_spout=False, protobuf=None, py_class=bolt)
+    heron_instance.is_instance_started = True
+
+    # the out queue is full, so the in stream fills up and reading stops
+    heron_instance.handle_new_tuple_set("tuple_set")
+    heron_instance.handle_new_tuple_set("tuple_set")
+    self.assertEqual(heron_instance.in_stream.get_size(), 2)
+    self.assertFalse(stmgr_client.readable())
+
+    # once the out queue is available, the looper hands the tuples left to the bolt
+    bolt.output_helper.is_out_queue_available.return_value = True
+    looper.wake_up()
+    looper._run_once()
+    self.assertEqual(heron_instance.in_stream.get_size(), 1)
+    self.assertTrue(stmgr_client.readable())
+    # the bolt stopped at the end of a batch, so the looper is woken up to go on
+    looper._run_once()
+    self.assertTrue(heron_instance.in_stream.is_empty())
+    self.assertTrue(stmgr_client.readable())
@@ -20,6 +20,12 @@ class Bolt(BaseBolt):
 
   Topology writers need to inherit this ``Bolt`` class to define their own custom bolt, by
   implementing ``initialize()`` and ``process()`` methods.
+
+  Optionally, a bolt can implement ``process_batch(tuples)``, which takes a list of
+  ``HeronTuple``. If it is implemented, Heron Instance hands over every tuple set received from
+  the Stream Manager at once through this method, instead of calling ``process()`` per tuple.
+  The execute latency of the batch is then averaged over its tuples: task hooks are still called
+  once per tuple with that average latency, and the execute latency histogram is not updated.
   """
 
   @abstractmethod
@@ -21,6 +21,11 @@ class Spout(BaseSpout):
   Topology writers need to inherit this ``Spout`` class to define their own custom spout, by
   implementing ``initialize()``, ``next_tuple()``, ``ack()`` and ``fail()`` methods.
   In addition, ``close()``, ``activate()`` and ``deactivate()`` are available to be implemented.
+
+  Optionally, a spout can implement ``ack_batch(tup_ids)`` and/or ``fail_batch(tup_ids)``, which
+  take a list of tuple ids. If implemented, Heron Instance hands over all the acks (or fails)
+  received in one tuple set from the Stream Manager at once, instead of calling ``ack()`` (or
+  ``fail()``) per tuple. Ack and fail metrics are then updated once per batch and stream.
   """
 
   @abstractmethod
@@ -12,6 +12,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """ metricstimeline.py """
+import time
+from collections import OrderedDict
+
 import tornado.gen
 
 from heron.common.src.python.utils.log import Log
@@ -20,36 +23,19 @@ from heron.proto import tmaster_pb2
 
 # pylint: disable=too-many-locals, too-many-branches, unused-argument
 @tornado.gen.coroutine
-def getMetricsTimeline(tmaster,
-                       component_name,
-                       metric_names,
-                       instances,
-                       start_time,
-                       end_time,
-                       callback=None):
+def fetchMetricsFromTmaster(tmaster,
+                            component_name,
+                            metric_names,
+                            instances,
+                            start_time,
+                            end_time):
   """
-  Get the specified metrics for the given component name of this topology.
-  Returns the following dict on success:
-  {
-    "timeline": {
-      <metricname>: {
-        <instance>: {
-          <start_time> : <numeric value>,
-          <start_time> : <numeric value>,
-          ...
-        }
-        ...
-      }, ...
-    },
-    "starttime": <numeric value>,
-    "endtime": <numeric value>,
-    "component": "..."
-  }
-
-  Returns the following dict on failure:
-  {
-    "message": "..."
-  }
+  Fetches minutely metrics of the given component from the tmaster, for the
+  time buckets that overlap [start_time, end_time].
+  Returns (<ok>, <buckets>), where ok is False if tmaster did not answer with an
+  OK status, and buckets is a list of
+  (<metricname>, <instance>, <bucket start>, <bucket end>, <value>),
+  where value is None for an instance that reported no bucket of a metric.
   """
   # Tmaster is the proto object and must have host and port for stats.
   if not tmaster or not tmaster.host or not tmaster.stats_port:
@@ -108,35 +94,301 @@ def getMetricsTimeline(tmaster,
   metricResponse = tmaster_pb2.MetricResponse()
   metricResponse.ParseFromString(result.body)
 
-  if metricResponse.status.status == common_pb2.NOTOK:
+  isOk = metricResponse.status.status == common_pb2.OK
+  if not isOk:
     if metricResponse.status.HasField("message"):
       Log.warn("Received response from Tmaster: %s", metricResponse.status.message)
 
-  # Form the response.
-  ret = {}
-  ret["starttime"] = start_time
-  ret["endtime"] = end_time
-  ret["component"] = component_name
-  ret["timeline"] = {}
-
-  # Loop through all the metrics
   # One instance corresponds to one metric, which can have
   # multiple IndividualMetrics for each metricname requested.
+  ret = []
   for metric in metricResponse.metric:
     instance = metric.instance_id
 
     # Loop through all individual metrics.
     for im in metric.metric:
-      metricname = im.name
-      if metricname not in ret["timeline"]:
-        ret["timeline"][metricname] = {}
-      if instance not in ret["timeline"][metricname]:
-        ret["timeline"][metricname][instance] = {}
-
+      ret.append((im.name, instance, None, None, None))
       # We get minutely metrics.
       # Interval-values correspond to the minutely mark for which
       # this metric value corresponds to.
       for interval_value in im.interval_values:
-        ret["timeline"][metricname][instance][interval_value.interval.start] = interval_value.value
+        ret.append((im.name, instance, interval_value.interval.start,
+                    interval_value.interval.end, interval_value.value))
+
+  raise tornado.gen.Return((isOk, ret))
+
+
+class TimelineEntry(object):
+  """
+  Cached minutely buckets of one metric of a component, for one set of instances.
+  All the buckets that overlap [coveredStart, coveredEnd] are known and final.
+  Buckets out of that range (e.g. the current minute) may also be kept, but
+  they are fetched again when requested.
+  The generation is incremented every time the entry is cleared, so that a
+  response fetched before that is not added to the entry.
+  """
+  __slots__ = ('timeline', 'bucketEnds', 'coveredStart', 'coveredEnd', 'lastAccessTime',
+               'generation')
+
+  def __init__(self):
+    # map <instance -> map <bucket start -> value>>
+    self.timeline = {}
+    # map <bucket start -> bucket end>
+    self.bucketEnds = {}
+    self.coveredStart = None
+    self.coveredEnd = None
+    self.lastAccessTime = 0
+    self.generation = 0
+
+  def clear(self):
+    """ Drops all the buckets """
+    self.timeline = {}
+    self.bucketEnds = {}
+    self.coveredStart = None
+    self.coveredEnd = None
+    self.generation += 1
+
+  def getMissingRanges(self, start, end):
+    """
+    Returns the list of (start, end) ranges to fetch from tmaster, so that
+    all the buckets overlapping [start, end] are known.
+    """
+    if self.coveredStart is None or start > self.coveredEnd + 1 or end < self.coveredStart - 1:
+      # Only a single contiguous range is cached
+      self.clear()
+      return [(start, end)]
+    ranges = []
+    if start < self.coveredStart:
+      ranges.append((start, self.coveredStart - 1))
+    if end > self.coveredEnd:
+      ranges.append((self.coveredEnd + 1, end))
+    return ranges
+
+  def addBucket(self, instance, bucketStart, bucketEnd, value):
+    """ Adds a bucket from a tmaster response, or only an instance if bucketStart is None """
+    series = self.timeline.get(instance)
+    if series is None:
+      series = self.timeline[instance] = {}
+    if bucketStart is not None:
+      series[bucketStart] = value
+      self.bucketEnds[bucketStart] = bucketEnd
+
+  def addCoveredRange(self, start, end, finalUntil):
+    """
+    Marks the buckets overlapping a fetched range [start, end] as known,
+    up to finalUntil, after which buckets may still change. The range is
+    ignored unless it is contiguous with the covered range, as only a single
+    contiguous range is cached.
+    """
+    end = min(end, finalUntil)
+    if end < start:
+      return
+    if self.coveredStart is None:
+      self.coveredStart, self.coveredEnd = start, end
+    elif start <= self.coveredEnd + 1 and end >= self.coveredStart - 1:
+      self.coveredStart = min(self.coveredStart, start)
+      self.coveredEnd = max(self.coveredEnd, end)
 
+  def prune(self, oldest):
+    """ Drops the buckets that end before oldest """
+    expired = [bucketStart for bucketStart, bucketEnd in self.bucketEnds.iteritems()
+               if bucketEnd < oldest]
+    for bucketStart in expired:
+      del self.bucketEnds[bucketStart]
+      for series in self.timeline.itervalues():
+        series.pop(bucketStart, None)
+    if self.coveredStart is not None and self.coveredStart < oldest:
+      if self.coveredEnd < oldest:
+        self.coveredStart = self.coveredEnd = None
+      else:
+        self.coveredStart = oldest
+
+  def getTimeline(self, start, end):
+    """ Returns map <instance -> map <bucket start -> value>> of buckets overlapping the range """
+    bucketEnds = self.bucketEnds
+    ret = {}
+    for instance, series in self.timeline.iteritems():
+      ret[instance] = {bucketStart: value for bucketStart, value in series.iteritems()
+                       if bucketStart <= end and bucketEnds[bucketStart] >= start}
+    return ret
+
+
+class MetricsTimelineCache(object):
+  """
+  Cache of minutely metrics fetched from tmasters, with one TimelineEntry per
+  topology, component, metric and set of requested instances.
+
+  Buckets of tmaster that ended more than finalDelaySec ago never change, so they
+  are kept, and only the missing ranges are fetched when they are requested again.
+  Recent buckets are always fetched. Entries are evicted in LRU order when there are
+  more than maxEntries, or when they have not been used for maxAgeSec. Buckets older
+  than maxAgeSec are also dropped, as tmaster purges them.
+  """
+  # Must be longer than a minutely bucket, with some margin for clock skew
+  DEFAULT_FINAL_DELAY_SEC = 120
+  DEFAULT_MAX_ENTRIES = 10000
+  DEFAULT_MAX_AGE_SEC = 3 * 60 * 60
+
+  def __init__(self,
+               maxEntries=DEFAULT_MAX_ENTRIES,
+               maxAgeSec=DEFAULT_MAX_AGE_SEC,
+               finalDelaySec=DEFAULT_FINAL_DELAY_SEC):
+    self.maxEntries = maxEntries
+    self.maxAgeSec = maxAgeSec
+    self.finalDelaySec = finalDelaySec
+    # map <key -> TimelineEntry>, in LRU order
+    self.entries = OrderedDict()
+    # map <request key -> future of fetchMetricsFromTmaster> of requests in flight
+    self.inflightFetches = {}
+
+  @staticmethod
+  def getTopologyKey(tmaster):
+    """ A restarted topology gets a new topology id, and may get a new tmaster location """
+    return (getattr(tmaster, "topology_id", None), tmaster.host, tmaster.stats_port)
+
+  def getEntry(self, key, now):
+    """ Returns the entry of a key, creating it if not present, and marks it as recently used """
+    entry = self.entries.pop(key, None)
+    if entry is None:
+      entry = TimelineEntry()
+    entry.lastAccessTime = now
+    self.entries[key] = entry
+    return entry
+
+  def evict(self, now):
+    """ Evicts least recently used entries while too many, or not used for maxAgeSec """
+    while self.entries:
+      key, entry = next(self.entries.iteritems())
+      if len(self.entries) <= self.maxEntries and entry.lastAccessTime >= now - self.maxAgeSec:
+        break
+      del self.entries[key]
+
+  def fetchMetrics(self, tmaster, component_name, metric_names, instances, start_time, end_time):
+    """
+    Same as fetchMetricsFromTmaster(), except that identical requests made while one
+    is in flight share its response, so concurrent callers make a single round trip.
+    """
+    key = (self.getTopologyKey(tmaster), component_name, tuple(sorted(metric_names)),
+           tuple(sorted(instances)), start_time, end_time)
+    future = self.inflightFetches.get(key)
+    if future is None:
+      future = fetchMetricsFromTmaster(
+          tmaster, component_name, metric_names, instances, start_time, end_time)
+      self.inflightFetches[key] = future
+      future.add_done_callback(lambda _: self.inflightFetches.pop(key, None))
+    else:
+      Log.debug("Sharing in flight request of metrics from tmaster")
+    return future
+
+  @tornado.gen.coroutine
+  def getMetricsTimeline(self,
+                         tmaster,
+                         component_name,
+                         metric_names,
+                         instances,
+                         start_time,
+                         end_time):
+    """ Same as getMetricsTimeline(), answered from the cache where possible """
+    # Tmaster is the proto object and must have host and port for stats.
+    if not tmaster or not tmaster.host or not tmaster.stats_port:
+      raise Exception("No Tmaster found")
+
+    now = int(time.time())
+    topologyKey = self.getTopologyKey(tmaster)
+    instancesKey = tuple(sorted(instances))
+
+    # Group the metrics to fetch by their missing ranges, so that metrics missing
+    # the same range are fetched in one request.
+    entries = {}
+    generations = {}
+    rangeToMetricNames = OrderedDict()
+    for metricName in metric_names:
+      entry = self.getEntry((topologyKey, component_name, metricName, instancesKey), now)
+      entry.prune(now - self.maxAgeSec)
+      entries[metricName] = entry
+      for missingRange in entry.getMissingRanges(start_time, end_time):
+        rangeToMetricNames.setdefault(missingRange, []).append(metricName)
+      generations[metricName] = entry.generation
+    self.evict(now)
+
+    # The cached buckets are taken before fetching, as concurrent requests may
+    # clear the entries meanwhile.
+    timelines = {metricName: entry.getTimeline(start_time, end_time)
+                 for metricName, entry in entries.iteritems()}
+
+    if rangeToMetricNames:
+      Log.debug("Fetching %d ranges of metrics from tmaster", len(rangeToMetricNames))
+      responses = yield [self.fetchMetrics(tmaster, component_name, names, instances,
+                                           rangeStart, rangeEnd)
+                         for (rangeStart, rangeEnd), names in rangeToMetricNames.iteritems()]
+
+      finalUntil = now - self.finalDelaySec
+      for ((rangeStart, rangeEnd), names), (isOk, buckets) in zip(
+          rangeToMetricNames.iteritems(), responses):
+        # Failed responses are served, but not cached, so that they are fetched again.
+        for metricName, instance, bucketStart, bucketEnd, value in buckets:
+          if metricName not in entries:
+            continue
+          series = timelines[metricName].setdefault(instance, {})
+          if bucketStart is not None and bucketStart <= end_time and bucketEnd >= start_time:
+            series[bucketStart] = value
+          entry = entries[metricName]
+          if isOk and entry.generation == generations[metricName]:
+            entry.addBucket(instance, bucketStart, bucketEnd, value)
+        for metricName in names:
+          entry = entries[metricName]
+          if isOk and entry.generation == generations[metricName]:
+            entry.addCoveredRange(rangeStart, rangeEnd, finalUntil)
+
+    # Form the response.
+    ret = {}
+    ret["starttime"] = start_time
+    ret["endtime"] = end_time
+    ret["component"] = component_name
+    ret["timeline"] = {}
+    for metricName, timeline in timelines.iteritems():
+      if timeline:
+        ret["timeline"][metricName] = timeline
+
+    raise tornado.gen.Return(ret)
+
+metricsTimelineCache = MetricsTimelineCache()
+
+# pylint: disable=unused-argument
+@tornado.gen.coroutine
+def getMetricsTimeline(tmaster,
+                       component_name,
+                       metric_names,
+                       instances,
+                       start_time,
+                       end_time,
+                       callback=None):
+  """
+  Get the specified metrics for the given component name of this topology.
+  Metrics are answered from metricsTimelineCache, which fetches only the
+  missing time ranges from tmaster, and shares identical requests in flight.
+  Returns the following dict on success:
+  {
+    "timeline": {
+      <metricname>: {
+        <instance>: {
+          <start_time> : <numeric value>,
+          <start_time> : <numeric value>,
+          ...
+        }
+        ...
+      }, ...
+    },
+    "starttime": <numeric value>,
+    "endtime": <numeric value>,
+    "component": "..."
+  }
+
+  Returns the following dict on failure:
+  {
+    "message": "..."
+  }
+  """
+  ret = yield metricsTimelineCache.getMetricsTimeline(
+      tmaster, component_name, metric_names, instances, start_time, end_time)
   raise tornado.gen.Return(ret)
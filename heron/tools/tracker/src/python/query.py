@@ -12,6 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """ query.py """
+from collections import OrderedDict
+
 import tornado.httpclient
 import tornado.gen
 
@@ -53,9 +55,45 @@ class Query(object):
       raise Exception("No tmaster found")
     self.tmaster = tmaster
     root = self.parse_query_string(query_string)
+    yield self.prefetch_metrics(root, start, end)
     metrics = yield root.execute(self.tracker, self.tmaster, start, end)
     raise tornado.gen.Return(metrics)
 
+  def plan_fetches(self, root, start, end):
+    """Groups the TS operators of the parse tree by the request that can fetch their metrics.
+    Returns an ordered map <(component, instances, start, end) -> map <metricName ->
+    [(TS, start, end)]>>, where the key has the interval of the request to tmaster, and
+    each TS has the interval on which it is executed."""
+    fetches = OrderedDict()
+    nodes = [(root, start, end)]
+    while nodes:
+      node, nodeStart, nodeEnd = nodes.pop()
+      if isinstance(node, TS):
+        fetchStart, fetchEnd = node.getFetchInterval(nodeStart, nodeEnd)
+        key = (node.component, tuple(node.instances), fetchStart, fetchEnd)
+        fetches.setdefault(key, OrderedDict()).setdefault(node.metricName, []).append(
+            (node, nodeStart, nodeEnd))
+      elif isinstance(node, Operator):
+        nodes.extend(reversed(node.getChildren(nodeStart, nodeEnd)))
+    return fetches
+
+  @tornado.gen.coroutine
+  def prefetch_metrics(self, root, start, end):
+    """Fetches the metrics of all TS operators that share a component, instances and
+    interval in a single request to tmaster, instead of one request per operator.
+    A TS operator that cannot share a request fetches its own metric when executed."""
+    fetches = [(key, metricNames) for key, metricNames in self.plan_fetches(root, start, end)
+               .iteritems() if sum(len(nodes) for nodes in metricNames.itervalues()) > 1]
+    if not fetches:
+      return
+    responses = yield [getMetricsTimeline(self.tmaster, component, metricNames.keys(),
+                                          list(instances), fetchStart, fetchEnd)
+                       for (component, instances, fetchStart, fetchEnd), metricNames in fetches]
+    for (_, metricNames), response in zip(fetches, responses):
+      for nodes in metricNames.itervalues():
+        for node, nodeStart, nodeEnd in nodes:
+          node.setPrefetchedMetrics(nodeStart, nodeEnd, response)
+
   def find_closing_braces(self, query):
     """Find the index of the closing braces for the opening braces
     at the start of the query string. Note that first character
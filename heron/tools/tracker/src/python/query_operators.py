@@ -13,17 +13,70 @@
 # limitations under the License.
 ''' query_operators.py '''
 import math
+import numpy as np
 import tornado.httpclient
 import tornado.gen
 
 from heron.tools.tracker.src.python.metricstimeline import getMetricsTimeline
 
+#####################################################################
+# Helpers for timeseries aligned to minute marks
+#####################################################################
+def getMinuteRange(start, end):
+  """Returns (first, count), where first is the first minute mark at or
+  after start, and count is the number of minute marks in [start, end]."""
+  first = start / 60 * 60
+  if first < start:
+    first += 60
+  return first, max(0, (end / 60 * 60 - first) / 60 + 1)
+
+def timelineToArray(timeline, first, count):
+  """Returns an array of count values at the minute marks from first,
+  with NaN for the minute marks that are not in timeline."""
+  values = np.full(count, np.nan)
+  if timeline:
+    timestamps = np.fromiter(timeline.iterkeys(), dtype=np.int64, count=len(timeline))
+    data = np.fromiter(timeline.itervalues(), dtype=np.float64, count=len(timeline))
+    indexes = (timestamps - first) // 60
+    mask = (timestamps >= first) & (indexes < count) & (timestamps % 60 == 0)
+    values[indexes[mask]] = data[mask]
+  return values
+
+def arrayToTimeline(values, first):
+  """Inverse of timelineToArray"""
+  present = np.flatnonzero(~np.isnan(values))
+  return dict(zip((first + present * 60).tolist(), values[present].tolist()))
+
+def stackMetrics(allMetrics, start, end):
+  """Returns a matrix with one row of values for each of the Metrics,
+  aligned to the minute marks in [start, end]."""
+  _, count = getMinuteRange(start, end)
+  if not allMetrics:
+    return np.empty((0, count))
+  return np.vstack([metric.getValues(start, end) for metric in allMetrics])
+
+def divideValues(values1, values2):
+  """Division of arrays, with NaN for zero divisors"""
+  return np.where(values2 != 0, values1 / values2, np.nan)
+
+def combineMetrics(metrics1, metrics2, instance, start, end, operation):
+  """Returns Metrics of instance, with operation applied to the values of
+  metrics1 and metrics2 at the timestamps present in both. operation takes
+  arrays, and returns NaN for the timestamps to be skipped."""
+  ret = Metrics(None, None, instance, start, end, {})
+  with np.errstate(divide="ignore", invalid="ignore"):
+    values = operation(metrics1.getValues(start, end), metrics2.getValues(start, end))
+  ret.setValues(values, start)
+  return ret
+
 #####################################################################
 # Data Structure for fetched Metrics
 #####################################################################
 class Metrics(object):
   """Represents a univariate timeseries.
-  Multivariate timeseries is simply a list of this."""
+  Multivariate timeseries is simply a list of this.
+  Operators keep the values of the timeseries as an array aligned to minute
+  marks, with NaN holes, and the timeline dict is built when accessed."""
   def __init__(self, componentName, metricName, instance, start, end, timeline):
     """Takes (componentName, metricname, instance, timeline)"""
     self.componentName = componentName
@@ -31,7 +84,41 @@ class Metrics(object):
     self.instance = instance
     self.start = start
     self.end = end
-    self.timeline = self.floorTimestamps(start, end, timeline)
+    # (<first minute mark>, <array of values>), while the timeline is not built
+    self._values = None
+    self._timeline = self.floorTimestamps(start, end, timeline)
+
+  @property
+  def timeline(self):
+    """map <minute mark -> value>. Once accessed, the dict is the only copy
+    of the values, so that it can be modified."""
+    if self._timeline is None:
+      first, values = self._values
+      self._timeline = arrayToTimeline(values, first)
+      self._values = None
+    return self._timeline
+
+  @timeline.setter
+  def timeline(self, timeline):
+    self._timeline = timeline
+    self._values = None
+
+  def setValues(self, values, start):
+    """Sets the values from an array aligned to the minute marks from start"""
+    first, _ = getMinuteRange(start, start)
+    self._values = (first, values)
+    self._timeline = None
+
+  def getValues(self, start, end):
+    """Returns the values as an array aligned to the minute marks in [start, end],
+    with NaN holes. The array must not be modified."""
+    first, count = getMinuteRange(start, end)
+    if self._values is not None:
+      valuesFirst, values = self._values
+      if valuesFirst == first and len(values) == count:
+        return values
+      return timelineToArray(arrayToTimeline(values, valuesFirst), first, count)
+    return timelineToArray(self._timeline, first, count)
 
   # pylint: disable=no-self-use
   def floorTimestamps(self, start, end, timeline):
@@ -45,19 +132,14 @@ class Metrics(object):
 
   def setDefault(self, constant, start, end):
     """ set default time """
-    starttime = start / 60 * 60
-    if starttime < start:
-      starttime += 60
-    endtime = end / 60 * 60
-    while starttime <= endtime:
-      # STREAMCOMP-1559
-      # Second check is a work around, because the response from tmaster
-      # contains value 0, if it is queries for the current timestamp,
-      # since the bucket is created in the tmaster, but is not filled
-      # by the metrics.
-      if starttime not in self.timeline or self.timeline[starttime] == 0:
-        self.timeline[starttime] = constant
-      starttime += 60
+    values = self.getValues(start, end).copy()
+    # STREAMCOMP-1559
+    # Second check is a work around, because the response from tmaster
+    # contains value 0, if it is queries for the current timestamp,
+    # since the bucket is created in the tmaster, but is not filled
+    # by the metrics.
+    values[np.isnan(values) | (values == 0)] = constant
+    self.setValues(values, start)
 
 ################################################################
 # All the Operators supported by query system.
@@ -79,6 +161,11 @@ class Operator(object):
     """Returns True. This is just usefule for checking that an object is an operator or not."""
     return True
 
+  def getChildren(self, start, end):
+    """Returns the list of (operator, start, end) for each child operator,
+    with the interval on which this operator executes it."""
+    return []
+
 
 class TS(Operator):
   """Time Series Operator. This is the basic operator that is
@@ -105,15 +192,30 @@ class TS(Operator):
     self.metricName = children[2]
     if not isinstance(self.metricName, basestring):
       raise Exception("TS expects metric name as third argument")
+    # map <(start, end) -> response of getMetricsTimeline>, set by the query planner
+    # when this metric is fetched together with other metrics.
+    self.prefetchedMetrics = {}
+
+  @staticmethod
+  def getFetchInterval(start, end):
+    """Fetch metrics for start-60 to end+60 because the minute mark
+    may be a little skewed. By getting a couple more values,
+    we can then truncate based on the interval needed."""
+    return start - 60, end + 60
+
+  def setPrefetchedMetrics(self, start, end, metrics):
+    """Sets the response of getMetricsTimeline, containing this metric,
+    to be used when this operator is executed on start to end."""
+    self.prefetchedMetrics[(start, end)] = metrics
 
   @tornado.gen.coroutine
   def execute(self, tracker, tmaster, start, end):
-    # Fetch metrics for start-60 to end+60 because the minute mark
-    # may be a little skewed. By getting a couple more values,
-    # we can then truncate based on the interval needed.
-    metrics = yield getMetricsTimeline(
-        tmaster, self.component, [self.metricName], self.instances,
-        start - 60, end + 60)
+    metrics = self.prefetchedMetrics.get((start, end))
+    if metrics is None:
+      fetchStart, fetchEnd = self.getFetchInterval(start, end)
+      metrics = yield getMetricsTimeline(
+          tmaster, self.component, [self.metricName], self.instances,
+          fetchStart, fetchEnd)
     if not metrics:
       return
     if "message" in metrics:
@@ -124,9 +226,11 @@ class TS(Operator):
       metrics["timeline"] = {
           self.metricName: {}
       }
-    timelines = metrics["timeline"][self.metricName]
+    # The response may be shared with other TS operators, so it is not modified.
+    timelines = metrics["timeline"].get(self.metricName, {})
     allMetrics = []
     for instance, timeline in timelines.iteritems():
+      timeline = dict(timeline)
       toBeDeletedKeys = []
       for key, value in timeline.iteritems():
         floatValue = float(value)
@@ -165,6 +269,9 @@ class Default(Operator):
       raise Exception(
           "Second argument to DEFAULT must be an operator, but is " + str(type(self.timeseries)))
 
+  def getChildren(self, start, end):
+    return [(self.timeseries, start, end)]
+
   @tornado.gen.coroutine
   def execute(self, tracker, tmaster, start, end):
     allMetrics = yield self.timeseries.execute(tracker, tmaster, start, end)
@@ -186,6 +293,9 @@ class Sum(Operator):
   def __init__(self, children):
     self.timeSeriesList = children
 
+  def getChildren(self, start, end):
+    return [(ts, start, end) for ts in self.timeSeriesList if not isinstance(ts, float)]
+
   @tornado.gen.coroutine
   def execute(self, tracker, tmaster, start, end):
     # Initialize the metric to be returned with sum of all the constants.
@@ -207,10 +317,9 @@ class Sum(Operator):
       allMetrics.extend(met)
 
     # Aggregate all of the them
-    for metric in allMetrics:
-      for timestamp, value in metric.timeline.iteritems():
-        if timestamp in retMetrics.timeline:
-          retMetrics.timeline[timestamp] += value
+    values = retMetrics.getValues(start, end) + \
+      np.nansum(stackMetrics(allMetrics, start, end), axis=0)
+    retMetrics.setValues(values, start)
     raise tornado.gen.Return([retMetrics])
 
 class Max(Operator):
@@ -228,6 +337,9 @@ class Max(Operator):
       raise Exception("MAX expects at least one operand.")
     self.timeSeriesList = children
 
+  def getChildren(self, start, end):
+    return [(ts, start, end) for ts in self.timeSeriesList if not isinstance(ts, float)]
+
   @tornado.gen.coroutine
   def execute(self, tracker, tmaster, start, end):
     # Initialize the metric to be returned with max of all the constants.
@@ -251,12 +363,9 @@ class Max(Operator):
       allMetrics.extend(met)
 
     # Aggregate all of the them
-    for metric in allMetrics:
-      for timestamp, value in metric.timeline.iteritems():
-        if start <= timestamp <= end:
-          if timestamp not in retMetrics.timeline:
-            retMetrics.timeline[timestamp] = value
-          retMetrics.timeline[timestamp] = max(value, retMetrics.timeline[timestamp])
+    matrix = stackMetrics(allMetrics + [retMetrics], start, end)
+    # fmax ignores NaN unless all the values are NaN
+    retMetrics.setValues(np.fmax.reduce(matrix, axis=0), start)
     raise tornado.gen.Return([retMetrics])
 
 class Percentile(Operator):
@@ -283,6 +392,9 @@ class Percentile(Operator):
     self.quantile = children[0]
     self.timeSeriesList = children[1:]
 
+  def getChildren(self, start, end):
+    return [(ts, start, end) for ts in self.timeSeriesList if not isinstance(ts, float)]
+
   @tornado.gen.coroutine
   def execute(self, tracker, tmaster, start, end):
     leftOverTimeSeries = filter(lambda ts: not isinstance(ts, float), self.timeSeriesList)
@@ -300,25 +412,19 @@ class Percentile(Operator):
         raise Exception(met)
       allMetrics.extend(met)
 
-    # Keep all the values for a timestamp and we will later do
-    # a percentile on it
-    timeline = {}
-
-    # Aggregate all of the them
-    for metric in allMetrics:
-      for timestamp, value in metric.timeline.iteritems():
-        if start <= timestamp <= end:
-          if timestamp not in timeline:
-            timeline[timestamp] = []
-          timeline[timestamp].append(value)
-
-    retTimeline = {}
-    for timestamp, values in timeline.iteritems():
-      if not values:
-        continue
-      index = int(self.quantile * 1.0 * (len(values) - 1) / 100.0)
-      retTimeline[timestamp] = sorted(values)[index]
-    retMetrics = Metrics(None, None, None, start, end, retTimeline)
+    retMetrics = Metrics(None, None, None, start, end, {})
+    if allMetrics:
+      matrix = stackMetrics(allMetrics, start, end)
+      # NaN are sorted last, after the values of a timestamp
+      matrix.sort(axis=0)
+      counts = (~np.isnan(matrix)).sum(axis=0)
+      # Index of the quantile among the sorted values of a timestamp.
+      # np.percentile computes it in a different order, which may round
+      # to another value.
+      indexes = (self.quantile * 1.0 * (counts - 1) / 100.0).astype(int)
+      values = matrix[np.maximum(indexes, 0), np.arange(matrix.shape[1])]
+      values[counts == 0] = np.nan
+      retMetrics.setValues(values, start)
     raise tornado.gen.Return([retMetrics])
 
 
@@ -351,6 +457,10 @@ class Divide(Operator):
     self.timeSeries1 = children[0]
     self.timeSeries2 = children[1]
 
+  def getChildren(self, start, end):
+    return [(ts, start, end) for ts in [self.timeSeries1, self.timeSeries2]
+            if not isinstance(ts, float)]
+
   # pylint: disable=too-many-branches, too-many-statements
   @tornado.gen.coroutine
   def execute(self, tracker, tmaster, start, end):
@@ -411,41 +521,23 @@ class Divide(Operator):
       for key in metrics:
         if key not in metrics2:
           continue
-        met = Metrics(None, None, key, start, end, {})
-        for timestamp in metrics[key].timeline.keys():
-          if timestamp not in metrics2[key].timeline or metrics2[key].timeline[timestamp] == 0:
-            metrics[key].timeline.pop(timestamp)
-          else:
-            met.timeline[timestamp] = metrics[key].timeline[timestamp] / \
-              metrics2[key].timeline[timestamp]
-        allMetrics.append(met)
+        allMetrics.append(
+            combineMetrics(metrics[key], metrics2[key], key, start, end, divideValues))
       raise tornado.gen.Return(allMetrics)
     # If first is univariate
     elif len(metrics) == 1 and "" in metrics:
       allMetrics = []
-      for key, metric in metrics2.iteritems():
-        # Initialize with first metrics timeline, but second metric's instance
-        # because that is multivariate
-        met = Metrics(None, None, metric.instance, start, end, dict(metrics[""].timeline))
-        for timestamp in met.timeline.keys():
-          if timestamp not in metric.timeline or metric.timeline[timestamp] == 0:
-            met.timeline.pop(timestamp)
-          else:
-            met.timeline[timestamp] /= metric.timeline[timestamp]
-        allMetrics.append(met)
+      for metric in metrics2.itervalues():
+        # Second metric's instance because that is multivariate
+        allMetrics.append(
+            combineMetrics(metrics[""], metric, metric.instance, start, end, divideValues))
       raise tornado.gen.Return(allMetrics)
     # If second is univariate
     else:
       allMetrics = []
-      for key, metric in metrics.iteritems():
-        # Initialize with first metrics timeline and its instance
-        met = Metrics(None, None, metric.instance, start, end, dict(metric.timeline))
-        for timestamp in met.timeline.keys():
-          if timestamp not in metrics2[""].timeline or metrics2[""].timeline[timestamp] == 0:
-            met.timeline.pop(timestamp)
-          else:
-            met.timeline[timestamp] /= metrics2[""].timeline[timestamp]
-        allMetrics.append(met)
+      for metric in metrics.itervalues():
+        allMetrics.append(
+            combineMetrics(metric, metrics2[""], metric.instance, start, end, divideValues))
       raise tornado.gen.Return(allMetrics)
     raise Exception("This should not be generated.")
 
@@ -478,6 +570,10 @@ class Multiply(Operator):
     self.timeSeries1 = children[0]
     self.timeSeries2 = children[1]
 
+  def getChildren(self, start, end):
+    return [(ts, start, end) for ts in [self.timeSeries1, self.timeSeries2]
+            if not isinstance(ts, float)]
+
   # pylint: disable=too-many-branches, too-many-statements
   @tornado.gen.coroutine
   def execute(self, tracker, tmaster, start, end):
@@ -536,41 +632,23 @@ class Multiply(Operator):
       for key in metrics:
         if key not in metrics2:
           continue
-        met = Metrics(None, None, key, start, end, {})
-        for timestamp in metrics[key].timeline.keys():
-          if timestamp not in metrics2[key].timeline:
-            metrics[key].timeline.pop(timestamp)
-          else:
-            met.timeline[timestamp] = metrics[key].timeline[timestamp] * \
-              metrics2[key].timeline[timestamp]
-        allMetrics.append(met)
+        allMetrics.append(
+            combineMetrics(metrics[key], metrics2[key], key, start, end, np.multiply))
       raise tornado.gen.Return(allMetrics)
     # If first is univariate
     elif len(metrics) == 1 and "" in metrics:
       allMetrics = []
-      for key, metric in metrics2.iteritems():
-        # Initialize with first metrics timeline, but second metric's instance
-        # because that is multivariate
-        met = Metrics(None, None, metric.instance, start, end, dict(metrics[""].timeline))
-        for timestamp in met.timeline.keys():
-          if timestamp not in metric.timeline:
-            met.timeline.pop(timestamp)
-          else:
-            met.timeline[timestamp] *= metric.timeline[timestamp]
-        allMetrics.append(met)
+      for metric in metrics2.itervalues():
+        # Second metric's instance because that is multivariate
+        allMetrics.append(
+            combineMetrics(metrics[""], metric, metric.instance, start, end, np.multiply))
       raise tornado.gen.Return(allMetrics)
     # If second is univariate
     else:
       allMetrics = []
-      for key, metric in metrics.iteritems():
-        # Initialize with first metrics timeline and its instance
-        met = Metrics(None, None, metric.instance, start, end, dict(metric.timeline))
-        for timestamp in met.timeline.keys():
-          if timestamp not in metrics2[""].timeline:
-            met.timeline.pop(timestamp)
-          else:
-            met.timeline[timestamp] *= metrics2[""].timeline[timestamp]
-        allMetrics.append(met)
+      for metric in metrics.itervalues():
+        allMetrics.append(
+            combineMetrics(metric, metrics2[""], metric.instance, start, end, np.multiply))
       raise tornado.gen.Return(allMetrics)
     raise Exception("This should not be generated.")
 
@@ -603,6 +681,10 @@ class Subtract(Operator):
     self.timeSeries1 = children[0]
     self.timeSeries2 = children[1]
 
+  def getChildren(self, start, end):
+    return [(ts, start, end) for ts in [self.timeSeries1, self.timeSeries2]
+            if not isinstance(ts, float)]
+
   # pylint: disable=too-many-branches, too-many-statements
   @tornado.gen.coroutine
   def execute(self, tracker, tmaster, start, end):
@@ -659,41 +741,23 @@ class Subtract(Operator):
       for key in metrics:
         if key not in metrics2:
           continue
-        met = Metrics(None, None, key, start, end, {})
-        for timestamp in metrics[key].timeline.keys():
-          if timestamp not in metrics2[key].timeline:
-            metrics[key].timeline.pop(timestamp)
-          else:
-            met.timeline[timestamp] = metrics[key].timeline[timestamp] - \
-              metrics2[key].timeline[timestamp]
-        allMetrics.append(met)
+        allMetrics.append(
+            combineMetrics(metrics[key], metrics2[key], key, start, end, np.subtract))
       raise tornado.gen.Return(allMetrics)
     # If first is univariate
     elif len(metrics) == 1 and "" in metrics:
       allMetrics = []
-      for key, metric in metrics2.iteritems():
-        # Initialize with first metrics timeline, but second metric's instance
-        # because that is multivariate
-        met = Metrics(None, None, metric.instance, start, end, dict(metrics[""].timeline))
-        for timestamp in met.timeline.keys():
-          if timestamp not in metric.timeline:
-            met.timeline.pop(timestamp)
-          else:
-            met.timeline[timestamp] -= metric.timeline[timestamp]
-        allMetrics.append(met)
+      for metric in metrics2.itervalues():
+        # Second metric's instance because that is multivariate
+        allMetrics.append(
+            combineMetrics(metrics[""], metric, metric.instance, start, end, np.subtract))
       raise tornado.gen.Return(allMetrics)
     # If second is univariate
     else:
       allMetrics = []
-      for key, metric in metrics.iteritems():
-        # Initialize with first metrics timeline and its instance
-        met = Metrics(None, None, metric.instance, start, end, dict(metric.timeline))
-        for timestamp in met.timeline.keys():
-          if timestamp not in metrics2[""].timeline:
-            met.timeline.pop(timestamp)
-          else:
-            met.timeline[timestamp] -= metrics2[""].timeline[timestamp]
-        allMetrics.append(met)
+      for metric in metrics.itervalues():
+        allMetrics.append(
+            combineMetrics(metric, metrics2[""], metric.instance, start, end, np.subtract))
       raise tornado.gen.Return(allMetrics)
     raise Exception("This should not be generated.")
 
@@ -709,6 +773,9 @@ class Rate(Operator):
       raise Exception("RATE requires a timeseries, not constant.")
     self.timeSeries = children[0]
 
+  def getChildren(self, start, end):
+    return [(self.timeSeries, start - 60, end)]
+
   @tornado.gen.coroutine
   def execute(self, tracker, tmaster, start, end):
     # Get 1 previous data point to be able to apply rate on the first data
@@ -716,12 +783,6 @@ class Rate(Operator):
 
     # Apply rate on all of them
     for metric in metrics:
-      timeline = {}
-      allTimestamps = sorted(metric.timeline.keys())
-      for i in range(1, len(allTimestamps)):
-        timestamp = allTimestamps[i]
-        prev = allTimestamps[i-1]
-        if start <= timestamp <= end and timestamp - prev == 60:
-          timeline[timestamp] = metric.timeline[timestamp] - metric.timeline[prev]
-      metric.timeline = timeline
+      values = metric.getValues(start - 60, end)
+      metric.setValues(values[1:] - values[:-1], start)
     raise tornado.gen.Return(metrics)
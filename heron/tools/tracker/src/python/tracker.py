@@ -12,8 +12,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 ''' tracker.py '''
+import hashlib
 import json
 
+from collections import OrderedDict
 from functools import partial
 
 from heron.common.src.python.utils.log import Log
@@ -24,6 +26,85 @@ from heron.tools.tracker.src.python import javaobj
 from heron.tools.tracker.src.python import utils
 
 
+class TopologyIndex(object):
+  """
+  Indexes of the tracked topologies, by key, by state manager,
+  and by cluster, environ and name.
+  """
+  def __init__(self):
+    # A map from (topologyName, state_manager_name) to the topology
+    self.topologiesByKey = OrderedDict()
+    # A map from state_manager_name to the topologies, by name
+    self.topologiesByStateManager = {}
+    # A map from (cluster, environ, topologyName) to the topologies,
+    # which may be more than one for different roles
+    self.topologiesByName = {}
+    # A map from (topologyName, state_manager_name) to the
+    # (cluster, environ, topologyName) a topology is indexed by
+    self.nameKeys = {}
+
+  def clear(self):
+    """
+    Removes all the topologies.
+    """
+    self.topologiesByKey.clear()
+    self.topologiesByStateManager.clear()
+    self.topologiesByName.clear()
+    self.nameKeys.clear()
+
+  def add(self, topology):
+    """
+    Adds the topology to the indexes.
+    """
+    key = (topology.name, topology.state_manager_name)
+    self.topologiesByKey[key] = topology
+    self.topologiesByStateManager.setdefault(
+        topology.state_manager_name, OrderedDict())[topology.name] = topology
+    self.update(topology)
+
+  def update(self, topology):
+    """
+    Moves the topology in the indexes if its cluster or environ changed.
+    This is registered as a watch of the topology, since they are set
+    by its watches, so a topology that is no longer indexed is ignored.
+    """
+    key = (topology.name, topology.state_manager_name)
+    if self.topologiesByKey.get(key) is not topology:
+      return
+    nameKey = (topology.cluster, topology.environ, topology.name)
+    previousNameKey = self.nameKeys.get(key)
+    if previousNameKey != nameKey:
+      if previousNameKey is not None:
+        self.removeByName(previousNameKey, topology)
+      self.topologiesByName.setdefault(nameKey, []).append(topology)
+      self.nameKeys[key] = nameKey
+
+  def remove(self, topology):
+    """
+    Removes the topology from the indexes.
+    """
+    key = (topology.name, topology.state_manager_name)
+    self.topologiesByKey.pop(key, None)
+    self.topologiesByStateManager.get(topology.state_manager_name, {}).pop(topology.name, None)
+    nameKey = self.nameKeys.pop(key, None)
+    if nameKey is not None:
+      self.removeByName(nameKey, topology)
+
+  def removeByName(self, nameKey, topology):
+    """
+    Removes the topology from the topologies of a (cluster, environ, topologyName).
+    """
+    self.topologiesByName[nameKey].remove(topology)
+    if not self.topologiesByName[nameKey]:
+      del self.topologiesByName[nameKey]
+
+  def contains(self, topology):
+    """
+    Returns whether the topology is indexed.
+    """
+    return self.topologiesByKey.get((topology.name, topology.state_manager_name)) is topology
+
+
 class Tracker(object):
   """
   Tracker is a stateless cache of all the topologies
@@ -34,10 +115,12 @@ class Tracker(object):
   This class caches all the data and is accessed
   by handlers.
   """
+  # Maximum number of parsed Java serialized config values kept
+  JAVA_OBJECT_CACHE_SIZE = 10000
 
   def __init__(self, config):
     self.config = config
-    self.topologies = []
+    self.topologyIndex = TopologyIndex()
     self.state_managers = []
 
     # A map from a tuple of form
@@ -49,6 +132,36 @@ class Tracker(object):
     # since other info can not be relied upon.
     self.topologyInfos = {}
 
+    # A map from (cluster, environ, topologyName) of an
+    # info's execution state to the keys of topologyInfos.
+    self.topologyInfoKeysByName = {}
+
+    # A map from (topologyName, state_manager_name) to
+    # map <section of topologyInfo -> (source proto, section)>,
+    # so that a watch re-extracts only the sections
+    # whose source proto changed.
+    self.topologyInfoSections = {}
+
+    # A map from the digest of a Java serialized config value to
+    # its representation, in LRU order.
+    self.javaObjectCache = OrderedDict()
+
+  @property
+  def topologies(self):
+    """
+    Returns the list of all the topologies.
+    """
+    return self.topologyIndex.topologiesByKey.values()
+
+  @topologies.setter
+  def topologies(self, topologies):
+    """
+    Replaces all the topologies, and rebuilds the indexes.
+    """
+    self.topologyIndex.clear()
+    for topology in topologies:
+      self.topologyIndex.add(topology)
+
   def synch_topologies(self):
     """
     Sync the topologies with the statemgrs.
@@ -90,10 +203,9 @@ class Tracker(object):
     an optional role.
     Raises exception if topology is not found, or more than one are found.
     """
-    topologies = filter(lambda t: t.name == topologyName
-                        and t.cluster == cluster
-                        and (not role or t.execution_state.role == role)
-                        and t.environ == environ, self.topologies)
+    topologies = filter(lambda t: not role or t.execution_state.role == role,
+                        self.topologyIndex.topologiesByName.get(
+                            (cluster, environ, topologyName), []))
     if not topologies or len(topologies) > 1:
       if role is not None:
         raise Exception("Topology not found for {0}, {1}, {2}, {3}".format(
@@ -109,7 +221,7 @@ class Tracker(object):
     """
     Returns all the topologies for a given state manager.
     """
-    return filter(lambda t: t.state_manager_name == name, self.topologies)
+    return self.topologyIndex.topologiesByStateManager.get(name, {}).values()
 
   def addNewTopology(self, state_manager, topologyName):
     """
@@ -119,10 +231,12 @@ class Tracker(object):
     topology = Topology(topologyName, state_manager.name)
     Log.info("Adding new topology: %s, state_manager: %s",
              topologyName, state_manager.name)
-    self.topologies.append(topology)
 
-    # Register a watch on topology and change
+    self.topologyIndex.add(topology)
+
+    # Register a watch on topology to reindex it, and change
     # the topologyInfo on any new change.
+    topology.register_watch(self.topologyIndex.update)
     topology.register_watch(self.setTopologyInfo)
 
     def on_topology_pplan(data):
@@ -163,17 +277,39 @@ class Tracker(object):
     """
     Removes the topology from the local cache.
     """
-    topologies = []
-    for top in self.topologies:
-      if (top.name == topology_name and
-          top.state_manager_name == state_manager_name):
-        # Remove topologyInfo
-        if (topology_name, state_manager_name) in self.topologyInfos:
-          self.topologyInfos.pop((topology_name, state_manager_name))
-      else:
-        topologies.append(top)
-
-    self.topologies = topologies
+    key = (topology_name, state_manager_name)
+    topology = self.topologyIndex.topologiesByKey.get(key)
+    if topology is not None:
+      self.topologyIndex.remove(topology)
+      # Remove topologyInfo
+      if key in self.topologyInfos:
+        self.unindexTopologyInfo(key)
+        self.topologyInfos.pop(key)
+      self.topologyInfoSections.pop(key, None)
+
+  def indexTopologyInfo(self, key, topologyInfo):
+    """
+    Sets the info of a topology, and indexes it by
+    the cluster, environ and name of its execution state.
+    """
+    if key in self.topologyInfos:
+      self.unindexTopologyInfo(key)
+    self.topologyInfos[key] = topologyInfo
+    executionState = topologyInfo["execution_state"]
+    nameKey = (executionState["cluster"], executionState["environ"], key[0])
+    self.topologyInfoKeysByName.setdefault(nameKey, []).append(key)
+
+  def unindexTopologyInfo(self, key):
+    """
+    Removes the info of a topology from the index.
+    """
+    executionState = self.topologyInfos[key]["execution_state"]
+    nameKey = (executionState["cluster"], executionState["environ"], key[0])
+    keys = self.topologyInfoKeysByName.get(nameKey, [])
+    if key in keys:
+      keys.remove(key)
+    if not keys:
+      self.topologyInfoKeysByName.pop(nameKey, None)
 
   def extract_execution_state(self, topology):
     """
@@ -378,20 +514,7 @@ class Tracker(object):
           # when multi-language support is added later, ConfigValueType should be checked
 
           # Hexadecimal byte array for Serialized objects
-          try:
-            pobj = javaobj.loads(kvs.serialized_value)
-            physicalPlan["config"][kvs.key] = {
-                'value' : json.dumps(pobj,
-                                     default=lambda custom_field: custom_field.__dict__,
-                                     sort_keys=True,
-                                     indent=2),
-                'raw' : utils.hex_escape(kvs.serialized_value)}
-          except Exception:
-            Log.exception("Failed to parse data as java object")
-            physicalPlan["config"][kvs.key] = {
-                # The value should be a valid json object
-                'value' : '{}',
-                'raw' : utils.hex_escape(kvs.serialized_value)}
+          physicalPlan["config"][kvs.key] = self.extract_java_object(kvs.serialized_value)
     for spout in spouts:
       spout_name = spout.comp.name
       physicalPlan["spouts"][spout_name] = []
@@ -438,6 +561,53 @@ class Tracker(object):
 
     return physicalPlan
 
+  def extract_java_object(self, serialized_value):
+    """
+    Returns the representation of a Java serialized config value.
+    Values are parsed once, and cached by the digest of their content,
+    since the same values are found in every version of the physical plan.
+    The returned dict must not be modified.
+    """
+    digest = hashlib.sha1(serialized_value).digest()
+    javaObject = self.javaObjectCache.pop(digest, None)
+    if javaObject is None:
+      try:
+        pobj = javaobj.loads(serialized_value)
+        javaObject = {
+            'value' : json.dumps(pobj,
+                                 default=lambda custom_field: custom_field.__dict__,
+                                 sort_keys=True,
+                                 indent=2),
+            'raw' : utils.hex_escape(serialized_value)}
+      except Exception:
+        Log.exception("Failed to parse data as java object")
+        javaObject = {
+            # The value should be a valid json object
+            'value' : '{}',
+            'raw' : utils.hex_escape(serialized_value)}
+    self.javaObjectCache[digest] = javaObject
+    while len(self.javaObjectCache) > self.JAVA_OBJECT_CACHE_SIZE:
+      self.javaObjectCache.popitem(last=False)
+    return javaObject
+
+  def extract_section(self, topology, section, source, extract):
+    """
+    Returns extract(topology), unless the section was already
+    extracted from the same source proto, in which case the
+    previous section is returned. Protos from the state manager
+    are new objects on every watch, so they are also compared
+    by value, which is much cheaper than extracting again.
+    """
+    sections = self.topologyInfoSections.setdefault(
+        (topology.name, topology.state_manager_name), {})
+    if section in sections:
+      previousSource, value = sections[section]
+      if previousSource is source or (previousSource is not None and previousSource == source):
+        return value
+    value = extract(topology)
+    sections[section] = (source, value)
+    return value
+
   def setTopologyInfo(self, topology):
     """
     Extracts info from the stored proto states and
@@ -445,9 +615,13 @@ class Tracker(object):
     the API.
     This method is called on any change for the topology.
     For example, when a container moves and its host or some
-    port changes. All the information is parsed all over
-    again and cache is updated.
+    port changes. Only the sections whose source proto changed
+    are parsed again, and cache is updated.
+    Watches of a removed topology may still fire, which is ignored.
     """
+    if not self.topologyIndex.contains(topology):
+      return
+
     # Execution state is the most basic info.
     # If there is no execution state, just return
     # as the rest of the things don't matter.
@@ -478,22 +652,34 @@ class Tracker(object):
         "scheduler_location": None,
     }
 
-    executionState = self.extract_execution_state(topology)
+    physicalPlan = topology.physical_plan
+    executionState = dict(self.extract_section(
+        topology, "execution_state", topology.execution_state, self.extract_execution_state))
     executionState["has_physical_plan"] = has_physical_plan
     executionState["has_tmaster_location"] = has_tmaster_location
     executionState["has_scheduler_location"] = has_scheduler_location
     executionState["status"] = topology.get_status()
 
-    topologyInfo["metadata"] = self.extract_metadata(topology)
+    topologyInfo["metadata"] = self.extract_section(
+        topology, "metadata", topology.execution_state, self.extract_metadata)
+    # Runtime state is modified by its handler
     topologyInfo["runtime_state"] = self.extract_runtime_state(topology)
 
     topologyInfo["execution_state"] = executionState
-    topologyInfo["logical_plan"] = self.extract_logical_plan(topology)
-    topologyInfo["physical_plan"] = self.extract_physical_plan(topology)
-    topologyInfo["tmaster_location"] = self.extract_tmaster(topology)
-    topologyInfo["scheduler_location"] = self.extract_scheduler_location(topology)
-
-    self.topologyInfos[(topology.name, topology.state_manager_name)] = topologyInfo
+    # Logical plan only depends on the topology of the physical plan,
+    # which does not change when containers move.
+    topologyInfo["logical_plan"] = self.extract_section(
+        topology, "logical_plan", physicalPlan.topology if physicalPlan else None,
+        self.extract_logical_plan)
+    topologyInfo["physical_plan"] = self.extract_section(
+        topology, "physical_plan", physicalPlan, self.extract_physical_plan)
+    topologyInfo["tmaster_location"] = self.extract_section(
+        topology, "tmaster_location", topology.tmaster, self.extract_tmaster)
+    topologyInfo["scheduler_location"] = self.extract_section(
+        topology, "scheduler_location", topology.scheduler_location,
+        self.extract_scheduler_location)
+
+    self.indexTopologyInfo((topology.name, topology.state_manager_name), topologyInfo)
 
   def getTopologyInfo(self, topologyName, cluster, role, environ):
     """
@@ -501,16 +687,15 @@ class Tracker(object):
     by its name, cluster, environ, and an optional role parameter.
     Raises exception if no such topology is found.
     """
-    # Iterate over the values to filter the desired topology.
-    for (topology_name, _), topologyInfo in self.topologyInfos.iteritems():
+    # Iterate over the infos with the same cluster, environ and name
+    # to filter the desired topology.
+    for key in self.topologyInfoKeysByName.get((cluster, environ, topologyName), []):
+      topologyInfo = self.topologyInfos[key]
       executionState = topologyInfo["execution_state"]
-      if (topologyName == topology_name and
-          cluster == executionState["cluster"] and
-          environ == executionState["environ"]):
-        # If role is specified, first try to match "role" field. If "role" field
-        # does not exist, try to match "submission_user" field.
-        if not role or executionState.get("role") == role:
-          return topologyInfo
+      # If role is specified, first try to match "role" field. If "role" field
+      # does not exist, try to match "submission_user" field.
+      if not role or executionState.get("role") == role:
+        return topologyInfo
     if role is not None:
       Log.info("Could not find topology info for topology: %s," \
                "cluster: %s, role: %s, and environ: %s",
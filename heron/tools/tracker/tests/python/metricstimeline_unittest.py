@@ -0,0 +1,187 @@
+''' metricstimeline_unittest.py '''
+# pylint: disable=missing-docstring, unused-argument
+import tornado.concurrent
+import tornado.gen
+import tornado.testing
+
+from mock import patch, Mock
+
+from heron.tools.tracker.src.python.metricstimeline import MetricsTimelineCache
+
+NOW = 10000
+
+def makeTmaster():
+  tmaster = Mock()
+  tmaster.host = "host"
+  tmaster.stats_port = 1234
+  tmaster.topology_id = "topology-id"
+  return tmaster
+
+def makeBuckets(metricNames, instances, start, end):
+  """ Buckets of a minute from 0, valued by their start time """
+  ret = []
+  for metricName in metricNames:
+    for instance in instances:
+      ret.append((metricName, instance, None, None, None))
+      for bucketStart in range(0, NOW, 60):
+        if bucketStart <= end and bucketStart + 59 >= start:
+          ret.append((metricName, instance, bucketStart, bucketStart + 59, str(bucketStart)))
+  return ret
+
+class MetricsTimelineCacheTest(tornado.testing.AsyncTestCase):
+  def setUp(self):
+    super(MetricsTimelineCacheTest, self).setUp()
+    self.calls = []
+    @tornado.gen.coroutine
+    def fetchSideEffect(tmaster, component, metricNames, instances, start, end):
+      self.calls.append((list(metricNames), start, end))
+      raise tornado.gen.Return((True, makeBuckets(metricNames, instances, start, end)))
+    patcher = patch("heron.tools.tracker.src.python.metricstimeline.fetchMetricsFromTmaster",
+                    side_effect=fetchSideEffect)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+    timePatcher = patch("time.time", return_value=NOW)
+    timePatcher.start()
+    self.addCleanup(timePatcher.stop)
+    self.cache = MetricsTimelineCache(finalDelaySec=120)
+    self.tmaster = makeTmaster()
+
+  @tornado.testing.gen_test
+  def test_fetches_missing_ranges_only(self):
+    ret = yield self.cache.getMetricsTimeline(
+        self.tmaster, "bolt", ["m1", "m2"], ["i1"], 1000, 2000)
+    self.assertEqual([(["m1", "m2"], 1000, 2000)], self.calls)
+    self.assertEqual("bolt", ret["component"])
+    self.assertEqual(1000, ret["starttime"])
+    expected = {str(s) for s in range(960, 2001, 60)}
+    self.assertEqual(expected, set(ret["timeline"]["m1"]["i1"].values()))
+
+    self.calls = []
+    ret2 = yield self.cache.getMetricsTimeline(
+        self.tmaster, "bolt", ["m1", "m2"], ["i1"], 1000, 2000)
+    self.assertEqual([], self.calls)
+    self.assertEqual(ret, ret2)
+
+    # Only the extended tail is fetched, and only for the cached metrics
+    ret = yield self.cache.getMetricsTimeline(
+        self.tmaster, "bolt", ["m1", "m3"], ["i1"], 500, 3000)
+    self.assertEqual([(["m1"], 500, 999), (["m1"], 2001, 3000), (["m3"], 500, 3000)],
+                     sorted(self.calls))
+    expected = {str(s) for s in range(480, 3001, 60)}
+    self.assertEqual(expected, set(ret["timeline"]["m1"]["i1"].values()))
+    self.assertEqual(expected, set(ret["timeline"]["m3"]["i1"].values()))
+
+  @tornado.testing.gen_test
+  def test_recent_buckets_are_refetched(self):
+    yield self.cache.getMetricsTimeline(self.tmaster, "bolt", ["m1"], ["i1"], 9000, NOW)
+    self.calls = []
+    yield self.cache.getMetricsTimeline(self.tmaster, "bolt", ["m1"], ["i1"], 9000, NOW)
+    self.assertEqual([(["m1"], NOW - 120 + 1, NOW)], self.calls)
+
+  @tornado.testing.gen_test
+  def test_keys(self):
+    yield self.cache.getMetricsTimeline(self.tmaster, "bolt", ["m1"], ["i1", "i2"], 1000, 2000)
+    yield self.cache.getMetricsTimeline(self.tmaster, "bolt", ["m1"], ["i2", "i1"], 1000, 2000)
+    self.assertEqual(1, len(self.calls))
+    yield self.cache.getMetricsTimeline(self.tmaster, "bolt", ["m1"], ["i1"], 1000, 2000)
+    yield self.cache.getMetricsTimeline(self.tmaster, "spout", ["m1"], ["i1"], 1000, 2000)
+    self.tmaster.topology_id = "restarted"
+    yield self.cache.getMetricsTimeline(self.tmaster, "bolt", ["m1"], ["i1"], 1000, 2000)
+    self.assertEqual(4, len(self.calls))
+
+  @tornado.testing.gen_test
+  def test_disjoint_range_replaces_cached_range(self):
+    yield self.cache.getMetricsTimeline(self.tmaster, "bolt", ["m1"], ["i1"], 1000, 2000)
+    ret = yield self.cache.getMetricsTimeline(self.tmaster, "bolt", ["m1"], ["i1"], 5000, 6000)
+    self.assertEqual((["m1"], 5000, 6000), self.calls[-1])
+    self.assertTrue(all(int(s) >= 4980 for s in ret["timeline"]["m1"]["i1"]))
+
+  @tornado.testing.gen_test
+  def test_instances_without_data(self):
+    @tornado.gen.coroutine
+    def emptyFetch(*args):
+      raise tornado.gen.Return((True, [("m1", "i1", None, None, None)]))
+    with patch("heron.tools.tracker.src.python.metricstimeline.fetchMetricsFromTmaster",
+               side_effect=emptyFetch):
+      ret = yield self.cache.getMetricsTimeline(self.tmaster, "bolt", ["m1", "m2"], [], 0, 100)
+    self.assertEqual({"m1": {"i1": {}}}, ret["timeline"])
+
+  @tornado.testing.gen_test
+  def test_eviction(self):
+    cache = MetricsTimelineCache(maxEntries=2, maxAgeSec=3600)
+    for metricName in ["m1", "m2", "m3"]:
+      yield cache.getMetricsTimeline(self.tmaster, "bolt", [metricName], ["i1"], 8000, 9000)
+    self.assertEqual(2, len(cache.entries))
+    self.assertEqual(["m2", "m3"], [key[2] for key in cache.entries])
+
+    # Buckets older than maxAgeSec are dropped
+    ret = yield cache.getMetricsTimeline(self.tmaster, "bolt", ["m3"], ["i1"], 0, 9000)
+    self.assertEqual((["m3"], 0, 7999), self.calls[-1])
+    self.assertTrue(ret["timeline"]["m3"]["i1"])
+
+  @tornado.testing.gen_test
+  def test_coalesces_requests_in_flight(self):
+    pending = tornado.concurrent.Future()
+    def pendingFetch(*args):
+      self.calls.append(args)
+      return pending
+    with patch("heron.tools.tracker.src.python.metricstimeline.fetchMetricsFromTmaster",
+               side_effect=pendingFetch):
+      first = self.cache.getMetricsTimeline(self.tmaster, "bolt", ["m1", "m2"], ["i1"], 0, 100)
+      second = self.cache.getMetricsTimeline(self.tmaster, "bolt", ["m2", "m1"], ["i1"], 0, 100)
+      self.assertEqual(1, len(self.calls))
+      self.assertEqual(1, len(self.cache.inflightFetches))
+      pending.set_result((True, [("m1", "i1", 0, 59, "1"), ("m2", "i1", 0, 59, "2")]))
+      ret1 = yield first
+      ret2 = yield second
+    self.assertEqual({"m1": {"i1": {0: "1"}}, "m2": {"i1": {0: "2"}}}, ret1["timeline"])
+    self.assertEqual(ret1, ret2)
+    self.assertEqual({}, self.cache.inflightFetches)
+
+  @tornado.testing.gen_test
+  def test_failed_fetch_not_cached(self):
+    @tornado.gen.coroutine
+    def failedFetch(*args):
+      raise tornado.gen.Return((False, [("m1", "i1", 960, 1019, "1")]))
+    with patch("heron.tools.tracker.src.python.metricstimeline.fetchMetricsFromTmaster",
+               side_effect=failedFetch):
+      ret = yield self.cache.getMetricsTimeline(self.tmaster, "bolt", ["m1"], ["i1"], 1000, 2000)
+    self.assertEqual({"m1": {"i1": {960: "1"}}}, ret["timeline"])
+
+    ret = yield self.cache.getMetricsTimeline(self.tmaster, "bolt", ["m1"], ["i1"], 1000, 2000)
+    self.assertEqual([(["m1"], 1000, 2000)], self.calls)
+    self.assertEqual("960", ret["timeline"]["m1"]["i1"][960])
+
+  @tornado.testing.gen_test
+  def test_concurrent_clear(self):
+    yield self.cache.getMetricsTimeline(self.tmaster, "bolt", ["m1"], ["i1"], 1000, 2000)
+    pending = []
+    def pendingFetch(*args):
+      future = tornado.concurrent.Future()
+      pending.append((args, future))
+      return future
+    with patch("heron.tools.tracker.src.python.metricstimeline.fetchMetricsFromTmaster",
+               side_effect=pendingFetch):
+      # the tail of A is fetched while B replaces the cached range
+      first = self.cache.getMetricsTimeline(self.tmaster, "bolt", ["m1"], ["i1"], 1000, 3000)
+      second = self.cache.getMetricsTimeline(self.tmaster, "bolt", ["m1"], ["i1"], 7000, 8000)
+      for args, future in reversed(pending):
+        future.set_result((True, makeBuckets(*args[2:])))
+      ret1 = yield first
+      yield second
+    # A still gets all of its buckets
+    expected = {str(s) for s in range(960, 3001, 60)}
+    self.assertEqual(expected, set(ret1["timeline"]["m1"]["i1"].values()))
+
+    # but does not extend the range cached by B over the gap between them
+    self.calls = []
+    ret = yield self.cache.getMetricsTimeline(self.tmaster, "bolt", ["m1"], ["i1"], 4000, 5000)
+    self.assertEqual([(["m1"], 4000, 5000)], self.calls)
+    expected = {str(s) for s in range(3960, 5001, 60)}
+    self.assertEqual(expected, set(ret["timeline"]["m1"]["i1"].values()))
+
+  @tornado.testing.gen_test
+  def test_no_tmaster(self):
+    self.tmaster.host = None
+    with self.assertRaises(Exception):
+      yield self.cache.getMetricsTimeline(self.tmaster, "bolt", ["m1"], ["i1"], 0, 100)
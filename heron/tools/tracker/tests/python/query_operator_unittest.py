@@ -3,6 +3,7 @@
 # over 500 bad indentation errors so disable
 # pylint: disable=bad-continuation
 # pylint: disable=unused-argument, unused-variable
+import unittest
 import tornado.concurrent
 import tornado.gen
 import tornado.testing
@@ -1685,3 +1686,57 @@ class QueryOperatorTests(tornado.testing.AsyncTestCase):
           240: 0,
           300: 0
         }, metric.timeline)
+
+  @tornado.testing.gen_test
+  def test_PERCENTILE_execute_with_many_ts(self):
+    ts = Mock()
+    operator = Percentile([float(57), ts])
+    tmaster = Mock()
+    tracker = Mock()
+    start = 100
+    end = 300
+
+    # 101 values for 120, and 51 for 180 with holes
+    @tornado.gen.coroutine
+    def ts_side_effect(*args):
+      allMetrics = []
+      for i in range(101):
+        timeline = {120: float(100 - i)}
+        if i % 2 == 0:
+          timeline[180] = float(i)
+        allMetrics.append(Metrics("component", "metricName", str(i), start, end, timeline))
+      raise tornado.gen.Return(allMetrics)
+    ts.execute.side_effect = ts_side_effect
+
+    metrics = yield operator.execute(tracker, tmaster, start, end)
+    self.assertEqual(1, len(metrics))
+    self.assertDictEqual({
+      120: 57.0,
+      180: 56.0
+    }, metrics[0].timeline)
+
+class MetricsArrayTest(unittest.TestCase):
+  def test_getMinuteRange(self):
+    self.assertEqual((120, 4), getMinuteRange(100, 300))
+    self.assertEqual((120, 3), getMinuteRange(120, 299))
+    self.assertEqual((120, 0), getMinuteRange(100, 110))
+
+  def test_values(self):
+    metrics = Metrics("component", "metricName", "instance", 100, 300, {
+      120: 1.0,
+      240: 2.0,
+      300: 3.0
+    })
+    values = metrics.getValues(100, 300)
+    self.assertEqual([1.0, 2.0, 3.0], list(values[[0, 2, 3]]))
+    self.assertTrue(np.isnan(values[1]))
+    values = metrics.getValues(40, 250)
+    self.assertEqual(4, len(values))
+    self.assertEqual([1.0, 2.0], list(values[[1, 3]]))
+
+    metrics.setValues(np.array([5.0, np.nan, 6.0]), 100)
+    self.assertTrue(metrics.getValues(100, 240) is metrics.getValues(110, 299))
+    self.assertDictEqual({120: 5.0, 240: 6.0}, metrics.timeline)
+    # The timeline is the only copy once accessed
+    metrics.timeline[180] = 7.0
+    self.assertEqual([5.0, 7.0, 6.0], list(metrics.getValues(100, 240)))
@@ -1,7 +1,9 @@
 ''' query_unittest.py '''
-# pylint: disable=missing-docstring, undefined-variable
+# pylint: disable=missing-docstring, undefined-variable, unused-argument
 import unittest2 as unittest
-from mock import Mock
+import tornado.gen
+import tornado.testing
+from mock import patch, Mock
 
 from heron.tools.tracker.src.python.query import *
 
@@ -151,3 +153,50 @@ class QueryTest(unittest.TestCase):
     query = "RATE(TS(a, a, a), TS(b, b, b))"
     with self.assertRaises(Exception):
       self.query.parse_query_string(query)
+
+  def test_plan_fetches(self):
+    query = "SUM(TS(a, *, m1), TS(a, *, m2), DIVIDE(TS(a, *, m1), TS(a, i, m1)), " \
+            "RATE(TS(a, *, m3)), TS(b, *, m1), 5)"
+    root = self.query.parse_query_string(query)
+    fetches = self.query.plan_fetches(root, 1000, 2000)
+    self.assertEqual({("a", (), 940, 2060), ("a", ("i",), 940, 2060),
+                      ("a", (), 880, 2060), ("b", (), 940, 2060)}, set(fetches.keys()))
+    self.assertEqual(["m1", "m2"], fetches[("a", (), 940, 2060)].keys())
+    self.assertEqual(2, len(fetches[("a", (), 940, 2060)]["m1"]))
+    node, start, end = fetches[("a", (), 880, 2060)]["m3"][0]
+    self.assertEqual("m3", node.metricName)
+    self.assertEqual((940, 2000), (start, end))
+
+class QueryExecuteTest(tornado.testing.AsyncTestCase):
+  @tornado.testing.gen_test
+  def test_execute_query_batches_metrics(self):
+    calls = []
+    @tornado.gen.coroutine
+    def getMetricsTimelineSideEffect(tmaster, component, metricNames, instances, start, end):
+      calls.append((component, list(metricNames), instances, start, end))
+      raise tornado.gen.Return({
+          "starttime": start,
+          "endtime": end,
+          "component": component,
+          "timeline": {
+              metricName: {"i1": {960: "1.0", 1020: str(index + 2)}}
+              for index, metricName in enumerate(metricNames)
+          }
+      })
+
+    with patch("heron.tools.tracker.src.python.query.getMetricsTimeline",
+               side_effect=getMetricsTimelineSideEffect), \
+         patch("heron.tools.tracker.src.python.query_operators.getMetricsTimeline",
+               side_effect=getMetricsTimelineSideEffect):
+      query = Query(Mock())
+      metrics = yield query.execute_query(
+          Mock(), "SUM(TS(a, *, m1), TS(a, *, m2), TS(a, *, m1))", 960, 1020)
+      self.assertEqual([("a", ["m1", "m2"], [], 900, 1080)], calls)
+      self.assertEqual(1, len(metrics))
+      self.assertEqual({960: 3.0, 1020: 7.0}, metrics[0].timeline)
+
+      # A single TS fetches its own metric
+      calls[:] = []
+      metrics = yield query.execute_query(Mock(), "TS(b, *, m1)", 960, 1020)
+      self.assertEqual([("b", ["m1"], [], 900, 1080)], calls)
+      self.assertEqual({960: 1.0, 1020: 2.0}, metrics[0].timeline)
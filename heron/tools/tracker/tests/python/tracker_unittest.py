@@ -5,9 +5,13 @@ import unittest2 as unittest
 from mock import call, patch, Mock
 
 import heron.proto.execution_state_pb2 as protoEState
+import heron.proto.physical_plan_pb2 as protoPPlan
+import heron.proto.tmaster_pb2 as protoTmaster
 from heron.statemgrs.src.python import statemanagerfactory
+from heron.tools.tracker.src.python import javaobj
 from heron.tools.tracker.src.python.topology import Topology
 from heron.tools.tracker.src.python.tracker import Tracker
+from mock_proto import MockProto
 
 class TrackerTest(unittest.TestCase):
   def setUp(self):
@@ -215,3 +219,114 @@ class TrackerTest(unittest.TestCase):
     self.tracker.removeTopology('top_name4', 'mock_name2')
     self.assertItemsEqual([self.topology3, self.topology5],
                           self.tracker.topologies)
+
+  def test_set_topology_info_extracts_changed_sections(self):
+    topology = Topology(MockProto.topology_name, 'mock_name1')
+    self.tracker.topologies = [topology]
+    topology.register_watch(self.tracker.setTopologyInfo)
+    topology.set_execution_state(MockProto().create_mock_execution_state())
+    topology.set_physical_plan(MockProto().create_mock_simple_physical_plan())
+    key = (MockProto.topology_name, 'mock_name1')
+    info = self.tracker.topologyInfos[key]
+    self.assertEqual(["mock_spout"], info["logical_plan"]["spouts"].keys())
+
+    with patch.object(Tracker, 'extract_physical_plan') as extract_physical_plan, \
+         patch.object(Tracker, 'extract_logical_plan') as extract_logical_plan:
+      # The physical plan did not change
+      tmaster = protoTmaster.TMasterLocation()
+      tmaster.host = "host"
+      topology.set_tmaster(tmaster)
+      self.assertEqual(0, extract_physical_plan.call_count)
+      self.assertEqual(0, extract_logical_plan.call_count)
+      newInfo = self.tracker.topologyInfos[key]
+      self.assertEqual("host", newInfo["tmaster_location"]["host"])
+      self.assertTrue(newInfo["physical_plan"] is info["physical_plan"])
+      self.assertTrue(newInfo["execution_state"]["has_tmaster_location"])
+      self.assertFalse(info["execution_state"]["has_tmaster_location"])
+
+      # A new physical plan with the same topology
+      pplan = protoPPlan.PhysicalPlan()
+      pplan.CopyFrom(topology.physical_plan)
+      stmgr = pplan.stmgrs.add()
+      stmgr.id = "stmgr-1"
+      stmgr.host_name = "host"
+      stmgr.data_port = 1
+      stmgr.local_endpoint = "endpoint"
+      topology.set_physical_plan(pplan)
+      self.assertEqual(1, extract_physical_plan.call_count)
+      self.assertEqual(0, extract_logical_plan.call_count)
+
+    self.tracker.removeTopology(MockProto.topology_name, 'mock_name1')
+    self.assertEqual({}, self.tracker.topologyInfoSections)
+
+  def test_extract_java_object(self):
+    with patch.object(javaobj, 'loads', return_value={"a": 1}) as loads:
+      javaObject = self.tracker.extract_java_object("serialized")
+      self.assertEqual('{\n  "a": 1\n}', javaObject['value'])
+      self.assertTrue(javaObject is self.tracker.extract_java_object("serialized"))
+      self.assertEqual(1, loads.call_count)
+      self.tracker.extract_java_object("other")
+      self.assertEqual(2, loads.call_count)
+
+    self.tracker.JAVA_OBJECT_CACHE_SIZE = 1
+    with patch.object(javaobj, 'loads', side_effect=Exception("bad")) as loads:
+      self.assertEqual('{}', self.tracker.extract_java_object("bad")['value'])
+      self.assertEqual(1, len(self.tracker.javaObjectCache))
+
+  def test_indexes_follow_watches(self):
+    mock_state_manager = Mock()
+    mock_state_manager.name = 'mock_name1'
+    self.tracker.addNewTopology(mock_state_manager, MockProto.topology_name)
+    topology = self.tracker.topologies[0]
+    self.assertEqual([topology], self.tracker.getTopologiesForStateLocation('mock_name1'))
+    with self.assertRaises(Exception):
+      self.tracker.getTopologyByClusterRoleEnvironAndName(
+          MockProto.cluster, None, MockProto.environ, MockProto.topology_name)
+
+    estate = MockProto().create_mock_execution_state()
+    estate.role = 'mark'
+    topology.set_execution_state(estate)
+    self.assertEqual(topology, self.tracker.getTopologyByClusterRoleEnvironAndName(
+        MockProto.cluster, 'mark', MockProto.environ, MockProto.topology_name))
+    with self.assertRaises(Exception):
+      self.tracker.getTopologyByClusterRoleEnvironAndName(
+          MockProto.cluster, 'bob', MockProto.environ, MockProto.topology_name)
+    info = self.tracker.getTopologyInfo(
+        MockProto.topology_name, MockProto.cluster, 'mark', MockProto.environ)
+    self.assertEqual(MockProto.topology_name, info["name"])
+
+    # Moving to another environ
+    estate = MockProto().create_mock_execution_state()
+    estate.environ = 'env2'
+    topology.set_execution_state(estate)
+    self.assertEqual(topology, self.tracker.getTopologyByClusterRoleEnvironAndName(
+        MockProto.cluster, None, 'env2', MockProto.topology_name))
+    with self.assertRaises(Exception):
+      self.tracker.getTopologyByClusterRoleEnvironAndName(
+          MockProto.cluster, None, MockProto.environ, MockProto.topology_name)
+    self.assertTrue(self.tracker.getTopologyInfo(
+        MockProto.topology_name, MockProto.cluster, None, 'env2'))
+    with self.assertRaises(Exception):
+      self.tracker.getTopologyInfo(
+          MockProto.topology_name, MockProto.cluster, None, MockProto.environ)
+
+    self.tracker.removeTopology(MockProto.topology_name, 'mock_name1')
+    self.assertEqual([], self.tracker.topologies)
+    self.assertEqual([], self.tracker.getTopologiesForStateLocation('mock_name1'))
+    self.assertEqual({}, self.tracker.topologyIndex.topologiesByName)
+    self.assertEqual({}, self.tracker.topologyInfoKeysByName)
+    with self.assertRaises(Exception):
+      self.tracker.getTopologyInfo(
+          MockProto.topology_name, MockProto.cluster, None, 'env2')
+
+  def test_watches_of_removed_topology(self):
+    mock_state_manager = Mock()
+    mock_state_manager.name = 'zk'
+    self.tracker.addNewTopology(mock_state_manager, 'top1')
+    on_topology_pplan = mock_state_manager.get_pplan.call_args[0][1]
+    self.tracker.removeTopology('top1', 'zk')
+    on_topology_pplan(None)
+    self.assertEqual([], self.tracker.topologies)
+    self.assertEqual([], self.tracker.getTopologiesForStateLocation('zk'))
+    self.assertEqual({}, self.tracker.topologyIndex.topologiesByName)
+    self.assertEqual({}, self.tracker.topologyInfos)